@@ -0,0 +1,351 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Sends historical S3 log files (e.g. ALB, CloudFront or S3 access logs) the
+same way the function does when it is notified about new objects, but
+processes objects of a whole bucket prefix, or of a local copy of a bucket,
+by a pool of processes.
+
+    python3 -m aws_log_collector.backfill s3://my-logs/AWSLogs/ --account-id 134183635603
+    python3 -m aws_log_collector.backfill ./my-logs --prefix AWSLogs/ --account-id 134183635603
+
+A local directory is treated as a bucket named after the directory, e.g. one
+made by "aws s3 sync s3://my-logs ./my-logs". Log entries are sent to
+SPLUNK_LOG_URL with SPLUNK_API_KEY, unless --dry-run is given.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+from dataclasses import dataclass
+from urllib.parse import quote_plus
+
+import boto3
+import time
+from aws_lambda_context import LambdaContext
+
+from aws_log_collector.converters.s3 import S3LogsConverter
+from aws_log_collector.enrichers.s3 import S3LogsEnricher
+from aws_log_collector.lib.client import BatchClient
+from aws_log_collector.lib.hec_serializer import HecSerializer
+from aws_log_collector.lib.json_encoder import create_json_encoder
+from aws_log_collector.lib.s3_service import LocalS3Client, S3Service
+from aws_log_collector.lib.tags_cache import TagsCache
+from aws_log_collector.logger import log
+from aws_log_collector.metric import CountingMetrics
+from aws_log_collector.parsers.registry import create_parsers
+
+FUNCTION_NAME = "aws_log_collector_backfill"
+FUNCTION_VERSION = "backfill"
+# the rate limit is shared by all processes, which reserve log entries in blocks
+EVENTS_PER_PERMIT = 256
+INPUT_BYTES_METRIC = "sf.org.awsLogCollector.num.inputUncompressedBytes"
+
+
+@dataclass
+class S3Object:
+    bucket: str
+    key: str
+    size: int = None
+
+    def to_record(self):
+        # keys of S3 event records are URL encoded
+        key = quote_plus(self.key, safe="/")
+        return {"s3": {"bucket": {"name": self.bucket}, "object": {"key": key, "size": self.size}}}
+
+
+@dataclass
+class ObjectResult:
+    key: str
+    events: int = 0
+    bytes: int = 0
+    failed: bool = False
+
+
+class LocalDirectorySource(object):
+    """
+    Objects of a local directory, the name of the directory is the bucket
+    name and paths of files relative to it are object keys.
+    """
+
+    def __init__(self, directory, prefix=""):
+        directory = os.path.abspath(directory)
+        self._root_directory = os.path.dirname(directory)
+        self._bucket = os.path.basename(directory)
+        self._prefix = prefix
+
+    def objects(self):
+        directory = os.path.join(self._root_directory, self._bucket)
+        keys = []
+        for path, _, file_names in os.walk(directory):
+            for file_name in file_names:
+                key = os.path.relpath(os.path.join(path, file_name), directory).replace(os.sep, "/")
+                if key.startswith(self._prefix):
+                    keys.append(key)
+        for key in sorted(keys):
+            yield S3Object(self._bucket, key, os.path.getsize(os.path.join(directory, key)))
+
+    def client(self):
+        return LocalS3Client(self._root_directory)
+
+
+class S3BucketSource(object):
+    """
+    Objects of a bucket, listed with keys starting with the prefix.
+    """
+
+    def __init__(self, bucket, prefix=""):
+        self._bucket = bucket
+        self._prefix = prefix
+
+    def objects(self, client=None):
+        paginator = (client or boto3.client("s3")).get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self._bucket, Prefix=self._prefix):
+            for item in page.get("Contents", []):
+                if not item["Key"].endswith("/"):
+                    yield S3Object(self._bucket, item["Key"], item["Size"])
+
+    def client(self):
+        # the client shared by the S3 service
+        return None
+
+
+def create_source(location, prefix=""):
+    if location.startswith("s3://"):
+        bucket, _, location_prefix = location[len("s3://"):].partition("/")
+        return S3BucketSource(bucket, location_prefix + prefix)
+    if not os.path.isdir(location):
+        raise ValueError(f"{location} is neither an s3:// location nor a directory")
+    return LocalDirectorySource(location, prefix)
+
+
+class RateLimiter(object):
+    """
+    Limits the rate of log entries sent by all processes of the pool. The
+    time the next block of log entries may be sent lives in shared memory,
+    so the limiter works when passed to processes at their start.
+    """
+
+    def __init__(self, events_per_second, mp_context=multiprocessing):
+        self._events_per_second = events_per_second
+        self._next_time = mp_context.Value("d", 0.0)
+
+    def acquire(self, events):
+        if self._events_per_second <= 0:
+            return
+        with self._next_time.get_lock():
+            now = time.monotonic()
+            start = max(now, self._next_time.value)
+            self._next_time.value = start + events / self._events_per_second
+        if start > now:
+            time.sleep(start - now)
+
+    def limit(self, items):
+        for index, item in enumerate(items):
+            if index % EVENTS_PER_PERMIT == 0:
+                self.acquire(EVENTS_PER_PERMIT)
+            yield item
+
+
+class Progress(object):
+    """
+    Sums up results of processed objects and logs them at most once per
+    interval_seconds.
+    """
+
+    def __init__(self, total_objects, interval_seconds):
+        self.total_objects = total_objects
+        self.objects = 0
+        self.failed_keys = []
+        self.events = 0
+        self.bytes = 0
+        self._interval_seconds = interval_seconds
+        self._start = time.monotonic()
+        self._last_report = self._start
+
+    def add(self, result):
+        self.objects += 1
+        self.events += result.events
+        self.bytes += result.bytes
+        if result.failed:
+            self.failed_keys.append(result.key)
+        now = time.monotonic()
+        if now - self._last_report >= self._interval_seconds:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        elapsed_seconds = max(time.monotonic() - self._start, 1e-6)
+        log.info(f"Processed {self.objects}/{self.total_objects} objects ({len(self.failed_keys)} failed), "
+                 f"{self.events} log entries ({self.events / elapsed_seconds:.0f}/s), "
+                 f"{self.bytes / 1024 / 1024:.1f} MiB ({self.bytes / elapsed_seconds / 1024 / 1024:.1f} MiB/s) "
+                 f"in {elapsed_seconds:.0f}s")
+
+
+class _NoTagsCache(object):
+    generation = 0
+
+    @staticmethod
+    def get(resource_arn, sfx_metrics):
+        return None
+
+    @staticmethod
+    def may_have_tags(resource_arn):
+        return False
+
+
+class BackfillWorker(object):
+    """
+    Converts and sends log entries of objects, one object at a time.
+    """
+
+    def __init__(self, options, source, rate_limiter):
+        tags_cache = _NoTagsCache() if options.without_tags else TagsCache(options.tags_cache_ttl_seconds)
+        self._converter = S3LogsConverter(S3LogsEnricher(tags_cache), S3Service(source.client()),
+                                          create_parsers(), options.include_log_fields,
+                                          parse_workers=options.parse_workers)
+        self._context = create_context(options.region, options.account_id)
+        self._json_encoder = create_json_encoder(options.json_encoder)
+        self._rate_limiter = rate_limiter
+        self._options = options
+
+    def process(self, s3_object):
+        metrics = CountingMetrics()
+        result = ObjectResult(s3_object.key)
+
+        def counted(logs):
+            for item in logs:
+                result.events += 1
+                yield item
+
+        failures = []
+        try:
+            hec_items = self._converter.convert_records_to_hec([s3_object.to_record()], self._context, metrics,
+                                                               on_failure=failures.append)
+            serializer = HecSerializer(encoder=self._json_encoder)
+            hec_logs = counted(self._rate_limiter.limit(serializer.dumps(hec_item) for hec_item in hec_items))
+            failed_batches = self._send(hec_logs, metrics)
+            if failed_batches > 0:
+                log.error(f"Failed to send {failed_batches} batch(es) of s3://{s3_object.bucket}/{s3_object.key}")
+                failures.append(0)
+        except Exception as ex:
+            log.error(f"Failed to backfill s3://{s3_object.bucket}/{s3_object.key}: {ex}")
+            failures.append(0)
+
+        result.bytes = metrics.totals.get(INPUT_BYTES_METRIC, 0)
+        result.failed = len(failures) > 0
+        return result
+
+    def _send(self, logs, metrics):
+        options = self._options
+        if options.dry_run:
+            for _ in logs:
+                pass
+            return 0
+
+        with BatchClient.create(options.url, options.api_key, options.max_request_size_bytes,
+                                options.compression_level, metrics, senders=options.senders) as client:
+            return client.send(logs)
+
+
+def create_context(region, account_id):
+    # parsers and enrichers derive the region and account of resources from the function ARN
+    context = LambdaContext()
+    context.function_name = FUNCTION_NAME
+    context.function_version = FUNCTION_VERSION
+    context.invoked_function_arn = f"arn:aws:lambda:{region}:{account_id}:function:{FUNCTION_NAME}"
+    return context
+
+
+# worker of the current process, created once by the pool
+_worker = None
+
+
+def _init_worker(options, source, rate_limiter):
+    global _worker
+    logging.basicConfig(format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    _worker = BackfillWorker(options, source, rate_limiter)
+
+
+def _process(s3_object):
+    return _worker.process(s3_object)
+
+
+def run(options, source=None):
+    """
+    Processes all objects of the source and returns the final Progress.
+    """
+    source = source or create_source(options.location, options.prefix)
+    objects = list(source.objects())
+    log.info(f"Backfilling {len(objects)} objects by {max(options.processes, 1)} processes")
+    progress = Progress(len(objects), options.progress_interval_seconds)
+
+    # boto3 clients are not fork safe, workers start from scratch
+    mp_context = multiprocessing.get_context("spawn")
+    rate_limiter = RateLimiter(options.max_events_per_second, mp_context)
+    if options.processes <= 0:
+        _init_worker(options, source, rate_limiter)
+        for result in map(_process, objects):
+            progress.add(result)
+    else:
+        with mp_context.Pool(options.processes, _init_worker, (options, source, rate_limiter)) as pool:
+            # objects differ in size a lot, each one is handed out separately
+            for result in pool.imap_unordered(_process, objects, chunksize=1):
+                progress.add(result)
+
+    progress.report()
+    for key in progress.failed_keys:
+        log.error(f"Failed to backfill {key}")
+    return progress
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(prog="python3 -m aws_log_collector.backfill",
+                                     description="Sends historical S3 log files to Splunk Observability Cloud.")
+    parser.add_argument("location", help="s3://bucket/prefix, or a local directory holding a copy of a bucket")
+    parser.add_argument("--prefix", default="", help="only objects with keys starting with the prefix are sent")
+    parser.add_argument("--account-id", required=True, help="AWS account id of resources the logs come from")
+    parser.add_argument("--region", default=os.getenv("AWS_REGION", os.getenv("AWS_DEFAULT_REGION", "us-east-1")),
+                        help="AWS region of resources the logs come from")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="number of processes converting objects, 0 converts them in this process")
+    parser.add_argument("--max-events-per-second", type=float, default=0,
+                        help="rate limit of log entries sent by all processes, 0 disables it")
+    parser.add_argument("--progress-interval-seconds", type=float, default=10)
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="threads parsing lines of an object in each process")
+    parser.add_argument("--senders", type=int, default=1, help="threads sending log entries in each process")
+    parser.add_argument("--include-log-fields", action="store_true")
+    parser.add_argument("--without-tags", action="store_true", help="log entries are not enriched with AWS tags")
+    parser.add_argument("--tags-cache-ttl-seconds", type=int, default=15 * 60)
+    parser.add_argument("--dry-run", action="store_true", help="log entries are converted but not sent")
+    parser.add_argument("--url", default=os.getenv("SPLUNK_LOG_URL", default="<unknown-url>"))
+    parser.add_argument("--api-key", default=os.getenv("SPLUNK_API_KEY", default="<unknown-token>"))
+    parser.add_argument("--max-request-size-bytes", type=int, default=2 * 1024 * 1024)
+    parser.add_argument("--compression-level", type=int, default=6)
+    parser.add_argument("--json-encoder", default="json")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    logging.basicConfig(format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    progress = run(parse_args(args))
+    return 1 if progress.failed_keys else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
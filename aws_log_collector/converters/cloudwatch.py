@@ -13,13 +13,23 @@
 # limitations under the License.
 
 import base64
-import gzip
 import json
-from io import BytesIO, BufferedReader
+import zlib
+from json.decoder import WHITESPACE
 
 from aws_log_collector.converters.converter import Converter
 from aws_log_collector.enrichers.cloudwatch import CloudWatchLogsEnricher
-from aws_log_collector.metric import size_of_json
+from aws_log_collector.lib.frozen_dict import FrozenDict
+
+# wbits of zlib expecting the gzip header and trailer
+GZIP_WBITS = zlib.MAX_WBITS | 16
+# fields of the payload needed before its log events are parsed
+HEADER_FIELDS = ("logGroup", "logStream")
+LOG_EVENTS_FIELD = "logEvents"
+# sent by CloudWatch Logs to check that a destination (e.g. a Kinesis stream) is reachable
+CONTROL_MESSAGE_TYPE = "CONTROL_MESSAGE"
+
+_decoder = json.JSONDecoder()
 
 
 class CloudWatchLogsConverter(Converter):
@@ -35,33 +45,38 @@ class CloudWatchLogsConverter(Converter):
             return False
 
     def _convert_to_hec(self, log_event, context, sfx_metrics):
-        aws_logs_base64 = log_event["awslogs"]["data"]
-        aws_logs_compressed = base64.b64decode(aws_logs_base64)
-        aws_logs = self._read_logs(aws_logs_compressed)
-        metadata = self._logs_enricher.get_metadata(aws_logs, context, sfx_metrics)
-        sfx_metrics.namespace(metadata["source"])
-        self._send_input_metrics(sfx_metrics, aws_logs_base64, aws_logs_compressed, aws_logs)
+        payload = CloudWatchLogsPayload.decode(log_event["awslogs"]["data"])
+        namespace, hec_items = self.convert_payload_to_hec(payload, context, sfx_metrics)
+        if namespace is not None:
+            sfx_metrics.namespace(namespace)
+        self.send_input_metrics(sfx_metrics, payload.base64_size, payload.compressed_size, len(payload.data))
 
-        return self._enriched_logs_to_hec(aws_logs, metadata)
+        return hec_items
 
-    @staticmethod
-    def _read_logs(aws_logs):
-        with gzip.GzipFile(fileobj=BytesIO(aws_logs)) as decompress_stream:
-            data = b"".join(BufferedReader(decompress_stream))
-        return json.loads(data)
+    def convert_payload_to_hec(self, payload, context, sfx_metrics):
+        """
+        Returns the namespace and HEC items of a decoded payload, control
+        messages have neither.
+        """
+        aws_logs, log_events = parse_logs(payload.data.decode("utf-8"))
+        if aws_logs.get("messageType") == CONTROL_MESSAGE_TYPE:
+            return None, iter(())
+        metadata = self._logs_enricher.get_metadata(aws_logs, context, sfx_metrics)
+        return metadata["source"], self._enriched_logs_to_hec(log_events, metadata)
 
     @staticmethod
-    def _enriched_logs_to_hec(logs, metadata):
+    def _enriched_logs_to_hec(log_events, metadata):
 
         def _get_fields():
             result = dict(metadata)
             del result["host"]
             del result["source"]
             del result["sourcetype"]
-            return result
+            # shared by all items, which lets the serializer reuse the serialized fields
+            return FrozenDict(result)
 
         fields = _get_fields()
-        for item in logs["logEvents"]:
+        for item in log_events:
             timestamp_as_string = str(item['timestamp'])
             hec_item = {"event": item["message"],
                         "fields": fields,
@@ -74,9 +89,82 @@ class CloudWatchLogsConverter(Converter):
             yield hec_item
 
     @staticmethod
-    def _send_input_metrics(sfx_metrics, aws_logs_base64, aws_logs_compressed, logs):
+    def send_input_metrics(sfx_metrics, base64_bytes, compressed_bytes, uncompressed_bytes):
         sfx_metrics.counters(
-                ("sf.org.awsLogCollector.num.inputBase64Bytes", len(aws_logs_base64)),
-                ("sf.org.awsLogCollector.num.inputCompressedBytes", len(aws_logs_compressed)),
-                ("sf.org.awsLogCollector.num.inputUncompressedBytes", size_of_json(logs))
+                ("sf.org.awsLogCollector.num.inputBase64Bytes", base64_bytes),
+                ("sf.org.awsLogCollector.num.inputCompressedBytes", compressed_bytes),
+                ("sf.org.awsLogCollector.num.inputUncompressedBytes", uncompressed_bytes)
         )
+
+
+class CloudWatchLogsPayload(object):
+    """
+    Decompressed payload of a CloudWatch Logs subscription, with sizes of its
+    encoded forms for metrics.
+    """
+
+    def __init__(self, data, base64_size, compressed_size):
+        self.data = data
+        self.base64_size = base64_size
+        self.compressed_size = compressed_size
+
+    @staticmethod
+    def decode(aws_logs_base64):
+        aws_logs_compressed = base64.b64decode(aws_logs_base64)
+        # a single call, the payload is small enough to be decompressed at once
+        aws_logs_data = zlib.decompress(aws_logs_compressed, GZIP_WBITS)
+        return CloudWatchLogsPayload(aws_logs_data, len(aws_logs_base64), len(aws_logs_compressed))
+
+
+def parse_logs(text):
+    """
+    Parses the JSON payload of a CloudWatch Logs subscription and returns its
+    fields but logEvents, and an iterator decoding log events one by one.
+
+    CloudWatch writes logEvents as the last field, fields following it (if
+    any) are not returned. Payloads where logEvents precede the fields needed
+    for enrichment are parsed as a whole.
+    """
+    index = _expect(text, _skip(text, 0), "{")
+    logs = {}
+    while True:
+        index = _skip(text, index)
+        if text.startswith("}", index) and not logs:
+            return logs, iter(())
+
+        name, index = _decoder.raw_decode(text, index)
+        index = _skip(text, _expect(text, _skip(text, index), ":"))
+        if name == LOG_EVENTS_FIELD and text.startswith("[", index):
+            if any(field not in logs for field in HEADER_FIELDS):
+                logs = json.loads(text)
+                return logs, iter(logs.get(LOG_EVENTS_FIELD, ()))
+            return logs, _log_events(text, index + 1)
+
+        logs[name], index = _decoder.raw_decode(text, index)
+        index = _skip(text, index)
+        if text.startswith("}", index):
+            return logs, iter(logs.pop(LOG_EVENTS_FIELD, None) or ())
+        index = _expect(text, index, ",")
+
+
+def _log_events(text, index):
+    index = _skip(text, index)
+    if text.startswith("]", index):
+        return
+    while True:
+        log_event, index = _decoder.raw_decode(text, index)
+        yield log_event
+        index = _skip(text, index)
+        if text.startswith("]", index):
+            return
+        index = _skip(text, _expect(text, index, ","))
+
+
+def _skip(text, index):
+    return WHITESPACE.match(text, index).end()
+
+
+def _expect(text, index, char):
+    if not text.startswith(char, index):
+        raise json.JSONDecodeError(f"Expecting '{char}'", text, index)
+    return index + 1
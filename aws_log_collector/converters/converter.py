@@ -14,7 +14,7 @@
 
 from abc import abstractmethod
 
-from typing import List
+from typing import Iterator
 
 
 class Converter:
@@ -23,9 +23,35 @@ class Converter:
     def supports(self, log_event) -> bool:
         pass
 
-    def convert_to_hec(self, log_event, context, sfx_metrics) -> List[tuple]:
-        return list(self._convert_to_hec(log_event, context, sfx_metrics))
+    def convert_to_hec(self, log_event, context, sfx_metrics) -> Iterator[dict]:
+        # items are produced lazily, so that large inputs are never held in memory at once
+        return iter(self._convert_to_hec(log_event, context, sfx_metrics))
+
+    def response(self, hec_items, failed_batches=0):
+        """
+        Returns the response of the invocation once hec_items, returned by
+        convert_to_hec, have been sent, failed_batches of them could not be.
+        """
+        return None
 
     @abstractmethod
     def _convert_to_hec(self, log_event, context, sfx_metrics):
         pass
+
+
+class TrackedItems(object):
+    """
+    HEC items of a batch of input records (e.g. SQS messages), which collect
+    IDs of records that failed while the items are iterated.
+    """
+
+    def __init__(self, hec_items, failed_ids, records=None):
+        self._hec_items = hec_items
+        self.failed_ids = failed_ids
+        self.records = records
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._hec_items)
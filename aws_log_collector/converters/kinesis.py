@@ -0,0 +1,109 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from aws_log_collector.converters.cloudwatch import CloudWatchLogsConverter, CloudWatchLogsPayload
+from aws_log_collector.converters.converter import Converter, TrackedItems
+from aws_log_collector.lib.parallel import pipelined_map
+from aws_log_collector.logger import log
+
+
+class KinesisLogsConverter(Converter):
+    """
+    Converts CloudWatch Logs subscription payloads delivered by a Kinesis
+    data stream or passed to a Kinesis Data Firehose transformation.
+
+    Payloads are decoded by decode_workers threads (base64 decoding and
+    decompression release the GIL) while log events of previous ones are
+    enriched, and log events of all records are sent as a single stream.
+
+    Firehose records are returned unchanged, or as failed when they could
+    not be converted. Records of a data stream that could not be converted
+    are skipped, retrying them would hold back the whole shard.
+    """
+
+    def __init__(self, cloudwatch_logs_converter: CloudWatchLogsConverter, decode_workers: int = 0):
+        self._cloudwatch_logs_converter = cloudwatch_logs_converter
+        self._decode_workers = decode_workers
+
+    def supports(self, log_event):
+        return self._is_firehose(log_event) or self._is_kinesis(log_event)
+
+    def response(self, hec_items, failed_batches=0):
+        if hec_items.records is None:
+            return None
+        return {"records": [{"recordId": record["recordId"],
+                             "result": "ProcessingFailed" if record["recordId"] in hec_items.failed_ids else "Ok",
+                             "data": record["data"]}
+                            for record in hec_items.records]}
+
+    def _convert_to_hec(self, log_event, context, sfx_metrics):
+        if self._is_firehose(log_event):
+            records = [(record["recordId"], record["data"]) for record in log_event["records"]]
+        else:
+            records = [(record["kinesis"]["sequenceNumber"], record["kinesis"]["data"])
+                       for record in log_event["Records"]]
+        failed_ids = set()
+        # the response of a Firehose transformation lists all its records
+        return TrackedItems(self._convert_records_to_hec(records, context, sfx_metrics, failed_ids), failed_ids,
+                            log_event["records"] if self._is_firehose(log_event) else None)
+
+    def _convert_records_to_hec(self, records, context, sfx_metrics, failed_ids):
+        namespaces = set()
+        # sizes of decoded payloads, which are not kept once converted
+        base64_bytes, compressed_bytes, uncompressed_bytes = 0, 0, 0
+        for record_id, payload in pipelined_map(self._decode, records, self._decode_workers):
+            if payload is None:
+                failed_ids.add(record_id)
+                continue
+            base64_bytes += payload.base64_size
+            compressed_bytes += payload.compressed_size
+            uncompressed_bytes += len(payload.data)
+            try:
+                namespace, hec_items = self._cloudwatch_logs_converter.convert_payload_to_hec(payload, context,
+                                                                                              sfx_metrics)
+                yield from hec_items
+            except Exception as ex:
+                log.error(f"Failed to convert CloudWatch logs of Kinesis record {record_id}: {ex}")
+                failed_ids.add(record_id)
+                continue
+            if namespace is not None:
+                namespaces.add(namespace)
+
+        if len(namespaces) == 1:
+            sfx_metrics.namespace(namespaces.pop())
+        self._cloudwatch_logs_converter.send_input_metrics(sfx_metrics, base64_bytes, compressed_bytes,
+                                                           uncompressed_bytes)
+        sfx_metrics.counters(("sf.org.awsLogCollector.num.kinesis.records", len(records)),
+                             ("sf.org.awsLogCollector.num.kinesis.failedRecords", len(failed_ids)))
+
+    @staticmethod
+    def _decode(record):
+        record_id, data = record
+        try:
+            return record_id, CloudWatchLogsPayload.decode(data)
+        except Exception as ex:
+            log.error(f"Failed to decode CloudWatch logs of Kinesis record {record_id}: {ex}")
+            return record_id, None
+
+    @staticmethod
+    def _is_firehose(log_event):
+        return "deliveryStreamArn" in log_event and "records" in log_event
+
+    @staticmethod
+    def _is_kinesis(log_event):
+        try:
+            records = log_event["Records"]
+            return len(records) > 0 and records[0]["eventSource"] == "aws:kinesis" and "kinesis" in records[0]
+        except (KeyError, TypeError):
+            return False
@@ -12,23 +12,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import partial
 from typing import List
 from urllib.parse import unquote_plus
 
 from aws_log_collector.converters.converter import Converter
 from aws_log_collector.enrichers.s3 import S3LogsEnricher
+from aws_log_collector.enrichers.tag_dimensions import TagDimensions
+from aws_log_collector.lib.continuation import Continuations
+from aws_log_collector.lib.parallel import merge, pipelined_map, StageStats
+from aws_log_collector.lib.process_pool import ProcessPool
+from aws_log_collector.lib.processed_objects import ProcessedObjects
 from aws_log_collector.lib.s3_service import S3Service
 from aws_log_collector.logger import log
 from aws_log_collector.parsers.parser import Parser
 
+# lines are passed between pipeline stages in chunks, which keeps the overhead
+# of queues and threads switching low
+LINES_PER_CHUNK = 256
+
 
 class S3LogsConverter(Converter):
 
-    def __init__(self, logs_enricher: S3LogsEnricher, s3_service: S3Service, parsers: List[Parser], include_log_fields: bool):
+    def __init__(self, logs_enricher: S3LogsEnricher, s3_service: S3Service, parsers: List[Parser], include_log_fields: bool,
+                 deferred_enrichment_namespaces: List[str] = (), tag_dimensions: TagDimensions = None,
+                 max_parallel_objects: int = 1, parse_workers: int = 0, continuations: Continuations = None,
+                 parse_processes: int = 0, parse_processes_threshold_bytes: int = 0,
+                 processed_objects: ProcessedObjects = None, parse_queue_size: int = 2,
+                 merge_queue_size: int = 1000):
         self._logs_enricher = logs_enricher
         self._s3_service = s3_service
         self._parsers = parsers
         self._include_log_fields = include_log_fields
+        self._deferred_enrichment_namespaces = set(deferred_enrichment_namespaces)
+        self._tag_dimensions = tag_dimensions
+        self._max_parallel_objects = max_parallel_objects
+        self._parse_workers = parse_workers
+        self._continuations = continuations
+        self._parse_processes_threshold_bytes = parse_processes_threshold_bytes
+        self._processed_objects = processed_objects
+        self._parse_queue_size = parse_queue_size
+        self._merge_queue_size = merge_queue_size
+        # forked last, so that processes inherit the converter as configured
+        self._parse_pool = ProcessPool(parse_processes, self._process_chunk) if parse_processes > 0 else None
 
     def supports(self, log_event):
         try:
@@ -40,42 +66,203 @@ class S3LogsConverter(Converter):
             return False
 
     def _convert_to_hec(self, log_event, context, sfx_metrics):
+        return self.convert_records_to_hec(log_event["Records"], context, sfx_metrics)
+
+    def convert_records_to_hec(self, records, context, sfx_metrics, on_failure=None):
+        """
+        Yields HEC items of objects of S3 event records, on_failure is called
+        with the index of each record whose object could not be read.
+        """
         context_metadata = self._logs_enricher.get_context_metadata(context)
+        deadline = self._continuations.deadline(context) if self._continuations is not None else None
 
-        records = log_event["Records"]
-        for record in records:
-            bucket = record["s3"]["bucket"]["name"]
-            key = unquote_plus(record["s3"]["object"]["key"])
+        def convert(index, record, record_metrics):
             try:
-                parser = self._find_parser(key)
-                if parser is None:
-                    log.error(f"Parser not found for object s3://{bucket}/{key}")
-                    sfx_metrics.inc_counter("sf.org.awsLogCollector.num.s3.unsupported_log_files")
-                    continue
-
-                yield from self._convert_s3_object_to_hec_items(bucket, key, parser, context_metadata, sfx_metrics)
-            except Exception as e:
-                log.error(f"Failed to process s3 log file: s3://{bucket}/{key} error: {e}")
-                sfx_metrics.inc_counter("sf.org.awsLogCollector.num.s3.errors")
-
-    def _convert_s3_object_to_hec_items(self, bucket, key, parser, context_metadata, sfx_metrics):
+                yield from self._convert_record_to_hec_items(record, context_metadata, record_metrics, deadline)
+            except Exception:
+                # logged already, objects of other records are converted anyway
+                if on_failure is not None:
+                    on_failure(index)
+
+        if len(records) == 1:
+            yield from convert(0, records[0], sfx_metrics)
+            return
+
+        # objects are read in parallel, each one with metrics of its own namespace
+        records_metrics = [sfx_metrics.scoped() for _ in records]
+        yield from merge([partial(convert, index, record, record_metrics)
+                          for index, (record, record_metrics) in enumerate(zip(records, records_metrics))],
+                         self._max_parallel_objects, self._merge_queue_size)
+
+        namespaces = set(record_metrics.current_namespace() for record_metrics in records_metrics)
+        if len(namespaces) == 1:
+            sfx_metrics.namespace(namespaces.pop())
+
+    def _convert_record_to_hec_items(self, record, context_metadata, sfx_metrics, deadline=None):
+        bucket = record["s3"]["bucket"]["name"]
+        key = unquote_plus(record["s3"]["object"]["key"])
+        size = record["s3"]["object"].get("size")
+        skip_lines = Continuations.checkpoint_lines(record)
+        try:
+            parser = self._find_parser(key)
+            if parser is None:
+                log.error(f"Parser not found for object s3://{bucket}/{key}")
+                sfx_metrics.inc_counter("sf.org.awsLogCollector.num.s3.unsupported_log_files")
+                return
+
+            if self._processed_objects is not None:
+                skip_lines = self._processed_objects.start(record, sfx_metrics)
+                if skip_lines is None:
+                    return
+
+            if deadline is not None and deadline.is_near():
+                # e.g. other objects of the event took all the time
+                self._continue(record, skip_lines)
+                return
+
+            lines = yield from self._convert_s3_object_to_hec_items(bucket, key, size, parser, context_metadata,
+                                                                    sfx_metrics, skip_lines, deadline)
+            if lines is not None:
+                log.info(f"Deadline is near, s3://{bucket}/{key} will be continued after {lines} lines")
+                self._continue(record, lines)
+            elif self._processed_objects is not None:
+                self._processed_objects.complete(record)
+        except Exception as e:
+            log.error(f"Failed to process s3 log file: s3://{bucket}/{key} error: {e}")
+            sfx_metrics.inc_counter("sf.org.awsLogCollector.num.s3.errors")
+            raise
+
+    def _continue(self, record, lines):
+        self._continuations.add(record, lines)
+        if self._processed_objects is not None:
+            self._processed_objects.partial(record, lines)
+
+    def _convert_s3_object_to_hec_items(self, bucket, key, size, parser, context_metadata, sfx_metrics,
+                                        skip_lines=0, deadline=None):
+        """
+        Yields HEC items of lines of the object following the first skip_lines
+        lines. Returns the number of lines processed when it stops early
+        because the deadline is near, or None once the whole object is processed.
+        """
         namespace = parser.get_namespace()
         file_metadata = parser.get_file_metadata(context_metadata, key)
         common_metadata = {**context_metadata, **file_metadata}
+        # in the deferred enrichment mode log records carry ARN fields only
+        # and tags are sent as separate tag dimension records
+        deferred_enrichment = namespace in self._deferred_enrichment_namespaces
+        metadata_memo = self._logs_enricher.memoize(common_metadata, with_tags=not deferred_enrichment)
+        arns = set()
+
+        def to_hec_items(lines):
+            return self._to_hec_items(parser, common_metadata, metadata_memo, deferred_enrichment, lines, sfx_metrics)
 
+        # the object is read and decompressed, parsed and enriched, and sent in
+        # separate stages, with parse_workers threads (or the processes of the
+        # pool, for large objects) parsing
+        read_stats, parse_stats = StageStats("read"), StageStats("parse")
         bytes_received = 0
-        raw_lines_generator = self._s3_service.read_lines(bucket, key)
-        for line in parser.complete_lines(raw_lines_generator):
-            if bytes_received == 0 and (parser.validate_line(line) is False):
+        lines_processed = skip_lines
+        stopped_early = False
+        raw_lines_generator = self._s3_service.read_lines(bucket, key, size)
+        chunks = self._valid_line_chunks(parser.complete_lines(raw_lines_generator), parser, bucket, key, skip_lines)
+        pool = self._acquire_parse_pool(size)
+        if pool is not None:
+            parser_index = self._parsers.index(parser)
+            parsed_chunks = pool.map((parser_index, common_metadata, chunk) for chunk in chunks)
+            results = self._enrich_parsed_chunks(parsed_chunks, namespace, metadata_memo, deferred_enrichment,
+                                                 sfx_metrics)
+        else:
+            results = pipelined_map(to_hec_items, chunks, self._parse_workers, self._parse_queue_size,
+                                    read_stats=read_stats, transform_stats=parse_stats)
+        try:
+            for hec_items, lines_arns, lines_bytes, lines_count in results:
+                bytes_received += lines_bytes
+                if deferred_enrichment and self._tag_dimensions is not None:
+                    self._tag_dimensions.collect(arns, lines_arns)
+                yield from hec_items
+                lines_processed += lines_count
+                # at least a chunk of lines is processed, so every continuation makes progress
+                if deadline is not None and deadline.is_near():
+                    stopped_early = True
+                    break
+        finally:
+            # stops reading and parsing ahead
+            results.close()
+            if pool is not None:
+                pool.release()
+
+        if deferred_enrichment and self._tag_dimensions is not None:
+            yield from self._tag_dimensions.to_hec(namespace, arns, common_metadata, sfx_metrics)
+
+        self._send_input_metrics(sfx_metrics, namespace, bytes_received, metadata_memo)
+        if self._parse_workers > 0 and pool is None:
+            read_stats.send_metrics(sfx_metrics)
+            parse_stats.send_metrics(sfx_metrics)
+        return lines_processed if stopped_early else None
+
+    def _to_hec_items(self, parser, common_metadata, metadata_memo, deferred_enrichment, lines, sfx_metrics):
+        parsed_lines = [parser.parse(common_metadata, line) for line in lines]
+        hec_items, lines_arns = self._enrich(parser.get_namespace(), parsed_lines, metadata_memo, deferred_enrichment,
+                                             sfx_metrics)
+        return hec_items, lines_arns, sum(len(line) for line in lines), len(lines)
+
+    def _enrich(self, namespace, parsed_lines, metadata_memo, deferred_enrichment, sfx_metrics):
+        hec_items, lines_arns = [], set()
+        for parsed_line in parsed_lines:
+            metadata = metadata_memo.get(parsed_line.arns, sfx_metrics)
+            if deferred_enrichment:
+                lines_arns.update(parsed_line.arns)
+            hec_items.append(self._to_hec(namespace, parsed_line, metadata))
+        return hec_items, lines_arns
+
+    def _acquire_parse_pool(self, size):
+        # only a single object at a time is parsed by the pool, others are parsed by threads
+        pool = self._parse_pool
+        if pool is None or size is None or size < self._parse_processes_threshold_bytes or not pool.acquire():
+            return None
+        return pool
+
+    def _process_chunk(self, task):
+        """
+        Runs in a process of the pool, returns parsed lines of the chunk, their
+        bytes and count. Lines are enriched by the parent process, since tags
+        refreshed by a forked process would be lost with its copy of the cache.
+        """
+        parser_index, common_metadata, lines = task
+        parsed_lines = [self._parsers[parser_index].parse(common_metadata, line) for line in lines]
+        return parsed_lines, sum(len(line) for line in lines), len(lines)
+
+    def _enrich_parsed_chunks(self, parsed_chunks, namespace, metadata_memo, deferred_enrichment, sfx_metrics):
+        """
+        Yields the same as _to_hec_items for chunks parsed by the pool.
+        """
+        try:
+            for parsed_lines, lines_bytes, lines_count in parsed_chunks:
+                hec_items, lines_arns = self._enrich(namespace, parsed_lines, metadata_memo, deferred_enrichment,
+                                                     sfx_metrics)
+                yield hec_items, lines_arns, lines_bytes, lines_count
+        finally:
+            parsed_chunks.close()
+
+    @staticmethod
+    def _valid_line_chunks(lines, parser, bucket, key, skip_lines=0):
+        chunk = []
+        bytes_read = 0
+        for index, line in enumerate(lines):
+            if bytes_read == 0 and (parser.validate_line(line) is False):
                 log.error(f"First S3 file line is invalid: {line};"
                           f" skipping file with key: {key}; in bucket: {bucket}")
                 break
-            bytes_received += len(line)
-            parsed_line = parser.parse(common_metadata, line)
-            metadata = self._logs_enricher.get_metadata(parsed_line.arns, common_metadata, sfx_metrics)
-            yield self._to_hec(namespace, parsed_line, metadata)
-
-        self._send_input_metrics(sfx_metrics, namespace, bytes_received)
+            bytes_read += len(line)
+            if index < skip_lines:
+                # processed by a previous invocation
+                continue
+            chunk.append(line)
+            if len(chunk) == LINES_PER_CHUNK:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
     def _find_parser(self, log_file_name):
         for parser in self._parsers:
@@ -86,7 +273,8 @@ class S3LogsConverter(Converter):
 
     def _to_hec(self, namespace, parsed_line, metadata):
         if (self._include_log_fields):
-            metadata["event"] = parsed_line.fields
+            # metadata is shared by many log lines, so the parsed fields go into a copy
+            metadata = {**metadata, "event": parsed_line.fields}
 
         hec_item = {
             "event": parsed_line.log_line,
@@ -98,8 +286,11 @@ class S3LogsConverter(Converter):
         return hec_item
 
     @staticmethod
-    def _send_input_metrics(sfx_metrics, namespace, bytes_received):
+    def _send_input_metrics(sfx_metrics, namespace, bytes_received, metadata_memo):
         sfx_metrics.namespace(namespace)
         sfx_metrics.counters(
-            ("sf.org.awsLogCollector.num.inputUncompressedBytes", bytes_received)
+            ("sf.org.awsLogCollector.num.inputUncompressedBytes", bytes_received),
+            ("sf.org.awsLogCollector.num.s3.metadataCacheHits", metadata_memo.hits),
+            ("sf.org.awsLogCollector.num.s3.metadataContainerCacheHits", metadata_memo.container_hits),
+            ("sf.org.awsLogCollector.num.s3.metadataCacheMisses", metadata_memo.misses)
         )
@@ -0,0 +1,90 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from aws_log_collector.converters.converter import Converter, TrackedItems
+from aws_log_collector.converters.s3 import S3LogsConverter
+from aws_log_collector.logger import log
+
+
+class SqsS3LogsConverter(Converter):
+    """
+    Converts S3 notifications delivered by SQS, either directly or wrapped
+    in SNS notifications.
+
+    Objects of all messages of a batch are converted concurrently, by the S3
+    converter. Messages whose objects could not be read, or which are not S3
+    notifications, are reported as batch item failures, so that only those
+    are delivered again (the event source mapping has to report batch item
+    failures). Log entries are not tracked by message when sent, so all
+    messages are reported as failures when any batch could not be sent, in
+    which case objects of the messages are not continued by another
+    invocation either, they are processed from the start once delivered again.
+    """
+
+    def __init__(self, s3_logs_converter: S3LogsConverter):
+        self._s3_logs_converter = s3_logs_converter
+
+    def supports(self, log_event):
+        try:
+            records = log_event["Records"]
+            return len(records) > 0 and records[0]["eventSource"] == "aws:sqs" and "body" in records[0]
+        except (KeyError, TypeError):
+            return False
+
+    def response(self, hec_items, failed_batches=0):
+        if failed_batches > 0:
+            failed_ids = {message["messageId"] for message in hec_items.records}
+        else:
+            failed_ids = hec_items.failed_ids
+        return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in sorted(failed_ids)]}
+
+    def _convert_to_hec(self, log_event, context, sfx_metrics):
+        failed_message_ids = set()
+        return TrackedItems(self._convert_messages_to_hec(log_event, context, sfx_metrics, failed_message_ids),
+                            failed_message_ids, log_event["Records"])
+
+    def _convert_messages_to_hec(self, log_event, context, sfx_metrics, failed_message_ids):
+        s3_records, message_ids = [], []
+        for message in log_event["Records"]:
+            try:
+                records = self._s3_records(message["body"])
+            except Exception as ex:
+                log.error(f"Failed to read S3 notification of SQS message {message['messageId']}: {ex}")
+                failed_message_ids.add(message["messageId"])
+                continue
+            s3_records += records
+            message_ids += [message["messageId"]] * len(records)
+
+        sfx_metrics.counters(("sf.org.awsLogCollector.num.sqs.messages", len(log_event["Records"])))
+        if s3_records:
+            yield from self._s3_logs_converter.convert_records_to_hec(
+                s3_records, context, sfx_metrics, on_failure=lambda index: failed_message_ids.add(message_ids[index]))
+        sfx_metrics.counters(("sf.org.awsLogCollector.num.sqs.failedMessages", len(failed_message_ids)))
+
+    @staticmethod
+    def _s3_records(body):
+        notification = json.loads(body)
+        if notification.get("Type") == "Notification" and "Message" in notification:
+            # delivered by SNS
+            notification = json.loads(notification["Message"])
+        if notification.get("Event") == "s3:TestEvent":
+            # sent once a notification is configured
+            return []
+        records = notification["Records"]
+        if any("s3" not in record for record in records):
+            raise ValueError("not an S3 notification")
+        return records
+
@@ -28,10 +28,16 @@ class BaseEnricher:
             "awsAccountId": aws_account_id
         }
 
+    def tags_generation(self):
+        return self._tags_cache.generation
+
     def get_tags(self, arn, sfx_metrics):
         if arn:
             return self._tags_cache.get(arn, sfx_metrics)
 
+    def may_have_tags(self, arn):
+        return bool(arn) and self._tags_cache.may_have_tags(arn)
+
     @staticmethod
     def merge(metadata, *tags_list):
         for tags in tags_list:
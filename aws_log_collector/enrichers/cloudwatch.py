@@ -12,7 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import time
+
 from aws_log_collector.enrichers.base_enricher import BaseEnricher
+from aws_log_collector.enrichers.log_group_router import LogGroupRouter, DEFAULT_NAMESPACE
+from aws_log_collector.lib.frozen_dict import FrozenDict
+from aws_log_collector.lib.lru_cache import LruCache
 from aws_log_collector.logger import log
 
 LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING = {
@@ -25,34 +30,70 @@ LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING = {
 
 class CloudWatchLogsEnricher(BaseEnricher):
 
+    def __init__(self, tags_cache, metadata_cache_size=1024, metadata_cache_ttl_seconds=5 * 60,
+                 log_group_router=None):
+        super().__init__(tags_cache)
+        self._log_group_router = log_group_router or LogGroupRouter.create(
+            None, LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING)
+        self._metadata_cache = LruCache(metadata_cache_size) if metadata_cache_size > 0 else None
+        self._metadata_cache_ttl_seconds = metadata_cache_ttl_seconds
+        self._average_miss_seconds = 0.0
+
     def get_metadata(self, raw_logs, context, sfx_metrics):
+        if self._metadata_cache is None:
+            return self._get_metadata(raw_logs, context, sfx_metrics)
+
+        # enriched metadata of a log stream is kept until tags are refreshed
+        key = (raw_logs['logGroup'], raw_logs['logStream'], context.invoked_function_arn, context.function_version)
+        cached = self._metadata_cache.get(key)
+        if cached is not None and cached[0] == self.tags_generation():
+            self._send_metadata_cache_metrics(sfx_metrics, hit=True)
+            return cached[1]
+
+        start = time.perf_counter()
+        metadata = FrozenDict(self._get_metadata(raw_logs, context, sfx_metrics))
+        elapsed_seconds = time.perf_counter() - start
+        if self._average_miss_seconds:
+            self._average_miss_seconds = 0.9 * self._average_miss_seconds + 0.1 * elapsed_seconds
+        else:
+            self._average_miss_seconds = elapsed_seconds
+        self._metadata_cache.put(key, (self.tags_generation(), metadata), self._metadata_cache_ttl_seconds)
+        self._send_metadata_cache_metrics(sfx_metrics, hit=False)
+        return metadata
+
+    def _get_metadata(self, raw_logs, context, sfx_metrics):
         metadata = self._basic_enrichment(raw_logs, context)
         tags = self.get_tags(metadata.get("arn"), sfx_metrics)
         return self.merge(metadata, tags)
 
-    def _basic_enrichment(self, logs, context):
-
-        def _get_aws_namespace(log_group):
-            log_group_lower = log_group.lower()
-            for prefix, source in LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING.items():
-                if log_group_lower.startswith(prefix):
-                    return source
-            return "other"
+    def _send_metadata_cache_metrics(self, sfx_metrics, hit):
+        sfx_metrics.counters(
+            ("sf.org.awsLogCollector.num.cloudwatch.metadataCacheHits", 1 if hit else 0),
+            ("sf.org.awsLogCollector.num.cloudwatch.metadataCacheMisses", 0 if hit else 1),
+            ("sf.org.awsLogCollector.num.cloudwatch.metadataCacheSavedMicros",
+             int(self._average_miss_seconds * 1000000) if hit else 0)
+        )
 
+    def _basic_enrichment(self, logs, context):
         log_group = logs['logGroup']
-        aws_namespace = _get_aws_namespace(log_group)
+        rule = self._log_group_router.route(log_group)
+        aws_namespace = rule.namespace if rule is not None else DEFAULT_NAMESPACE
         common_metadata = self.get_context_metadata(context)
         metadata = {'logGroup': log_group,
                     'logStream': logs['logStream'],
                     'source': aws_namespace,
                     'sourcetype': "aws:" + aws_namespace}
-        namespace_metadata = self._enricher_factory(metadata['source'])(context, log_group)
+        namespace_metadata = self._enricher_factory(metadata['source'], rule)(context, log_group)
 
         metadata.update(common_metadata)
         metadata.update(namespace_metadata)
         return metadata
 
-    def _enricher_factory(self, source):
+    def _enricher_factory(self, source, rule=None):
+        def template_enricher(context, log_group):
+            region, account_id = self._parse_log_collector_function_arn(context)
+            return rule.enrich(region, account_id, log_group)
+
         def lambda_enricher(context, log_group):
             fwd_arn_parts = context.invoked_function_arn.split('function')
             arn_prefix = fwd_arn_parts[0]
@@ -110,4 +151,6 @@ class CloudWatchLogsEnricher(BaseEnricher):
             'eks': eks_enricher,
             'api-gateway': api_gateway_enricher
         }
+        if rule is not None and rule.has_templates():
+            return template_enricher
         return enrichers.get(source, default_enricher)
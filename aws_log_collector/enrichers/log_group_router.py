@@ -0,0 +1,203 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import re
+from string import Formatter
+
+from aws_log_collector.lib.frozen_dict import FrozenDict
+from aws_log_collector.lib.lru_cache import LruCache
+
+DEFAULT_NAMESPACE = "other"
+
+# named groups are numbered like plain ones, so turning them into plain groups
+# keeps group indexes of the combined pattern intact (escaped parentheses,
+# i.e. preceded by an odd number of backslashes, are left alone)
+NAMED_GROUP_REGEX = re.compile(r"(?<!\\)((?:\\\\)*)\(\?P<[^>]*>")
+# backreferences and conditionals refer to groups of the rule's own pattern,
+# such patterns are matched on their own rather than combined with others
+GROUP_REFERENCE_REGEX = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+# global inline flags, e.g. "(?i)", apply to the whole pattern, so such patterns
+# are matched on their own as well
+GLOBAL_FLAGS_REGEX = re.compile(r"\(\?[aiLmsux]+\)")
+
+TEMPLATE_FIELDS = {"region", "accountId", "logGroup", "logGroupName"}
+# number of log groups whose formatted templates are kept by a rule
+TEMPLATE_CACHE_SIZE = 1024
+
+_RULE = object()
+
+
+class LogGroupRule(object):
+    """
+    Routes log groups matching a prefix or a regular expression to a namespace.
+
+    Host and ARN templates are formatted with region, accountId, logGroup,
+    logGroupName (the last segment of the log group) and named groups of the
+    regular expression, other fields are rejected when the rule is created.
+    Rules without templates use the built-in enricher of the namespace.
+    """
+
+    def __init__(self, namespace, prefix=None, regex=None, host=None, arn=None):
+        if (prefix is None) == (regex is None):
+            raise ValueError(f"Log group rule of the {namespace} namespace needs either a prefix or a regex")
+        self.namespace = namespace
+        self.prefix = prefix.lower() if prefix is not None else None
+        self.regex = re.compile(regex, re.IGNORECASE) if regex is not None else None
+        self.host = host
+        self.arn = arn
+        for template in (host, arn):
+            if template is not None:
+                self._check_template(template)
+        # log events of a log group come in batches, so each one is formatted once
+        self._metadata_cache = LruCache(TEMPLATE_CACHE_SIZE)
+
+    def has_templates(self):
+        return self.host is not None or self.arn is not None
+
+    def enrich(self, region, account_id, log_group):
+        key = (region, account_id, log_group)
+        metadata = self._metadata_cache.get(key)
+        if metadata is None:
+            metadata = FrozenDict(self._format(region, account_id, log_group))
+            self._metadata_cache.put(key, metadata)
+        return metadata
+
+    def _format(self, region, account_id, log_group):
+        values = {"region": region,
+                  "accountId": account_id,
+                  "logGroup": log_group,
+                  "logGroupName": log_group.split("/")[-1]}
+        if self.regex is not None:
+            values.update(self.regex.match(log_group).groupdict(default=""))
+
+        arn = self.arn.format(**values) if self.arn is not None else None
+        metadata = {"host": self.host.format(**values) if self.host is not None else arn or log_group}
+        if arn is not None:
+            metadata["arn"] = arn
+        return metadata
+
+    def _check_template(self, template):
+        fields = TEMPLATE_FIELDS | set(self.regex.groupindex if self.regex is not None else ())
+        for _, field, _, _ in Formatter().parse(template):
+            if field is not None and field not in fields:
+                raise ValueError(f"Template {template} of the {self.namespace} namespace uses unknown field "
+                                 f"{{{field}}}, known fields are {', '.join(sorted(fields))}")
+
+    @staticmethod
+    def from_config(config):
+        return LogGroupRule(config["namespace"], config.get("prefix"), config.get("regex"),
+                            config.get("host"), config.get("arn"))
+
+
+class LogGroupRouter(object):
+    """
+    Finds the rule of a log group.
+
+    Prefix rules are compiled into a trie and the longest matching prefix wins,
+    regular expressions are compiled into a single alternation and the first
+    matching one wins. Regular expressions take precedence over prefixes.
+    The cost of routing depends on the length of the log group name, not on
+    the number of rules. Regular expressions referring to their own groups
+    (backreferences) are matched on their own, between the alternations of
+    rules before and after them.
+    """
+
+    def __init__(self, rules):
+        self._trie = {}
+        regex_rules = []
+        for rule in rules:
+            if rule.prefix is not None:
+                self._add_prefix(rule)
+            else:
+                regex_rules.append(rule)
+        self._alternations = self._combine(regex_rules)
+
+    def route(self, log_group):
+        for regex, rules_by_group, rule in self._alternations:
+            match = regex.match(log_group)
+            if match is not None:
+                return rule or rules_by_group[match.lastindex]
+
+        rule = None
+        node = self._trie
+        for char in log_group.lower():
+            node = node.get(char)
+            if node is None:
+                break
+            rule = node.get(_RULE, rule)
+        return rule
+
+    def _add_prefix(self, rule):
+        node = self._trie
+        for char in rule.prefix:
+            node = node.setdefault(char, {})
+        node[_RULE] = rule
+
+    @staticmethod
+    def _combine(regex_rules):
+        """
+        Returns (regex, rules by group index, rule) to be tried in order. Each
+        rule of a combined regex is a group of its own, so the index of the
+        last matching group tells the rule, a regex of a single rule is the
+        rule's own one.
+        """
+        alternations, patterns, rules_by_group, group = [], [], {}, 1
+        for rule in regex_rules:
+            pattern = LogGroupRouter._plain_pattern(rule)
+            if pattern is None:
+                if patterns:
+                    alternations.append((re.compile("|".join(patterns), re.IGNORECASE), rules_by_group, None))
+                    patterns, rules_by_group, group = [], {}, 1
+                alternations.append((rule.regex, None, rule))
+                continue
+            patterns.append("(" + pattern + ")")
+            rules_by_group[group] = rule
+            group += rule.regex.groups + 1
+        if patterns:
+            alternations.append((re.compile("|".join(patterns), re.IGNORECASE), rules_by_group, None))
+        return alternations
+
+    @staticmethod
+    def _plain_pattern(rule):
+        """
+        Returns the pattern of the rule with named groups turned into plain
+        ones, or None if it can not be combined with patterns of other rules.
+        """
+        if GROUP_REFERENCE_REGEX.search(rule.regex.pattern) or GLOBAL_FLAGS_REGEX.search(rule.regex.pattern):
+            return None
+        pattern = NAMED_GROUP_REGEX.sub(r"\1(", rule.regex.pattern)
+        try:
+            # e.g. "(?P<" within a character class is not a named group, and
+            # global inline flags such as "(?i)" are allowed only at the start
+            compiled = re.compile("(" + pattern + ")|")
+        except re.error:
+            return None
+        if compiled.groups != rule.regex.groups + 1 or compiled.groupindex:
+            return None
+        return pattern
+
+    @staticmethod
+    def create(rules_json, default_prefixes):
+        """
+        Creates the router of rules given as a JSON list, e.g.
+        [{"prefix": "/ecs/", "namespace": "ecs", "arn": "arn:aws:ecs:{region}:{accountId}:service/{logGroupName}"}]
+
+        Default prefix rules are added first, so that given rules can override them.
+        """
+        rules = [LogGroupRule(namespace, prefix=prefix) for prefix, namespace in default_prefixes.items()]
+        if rules_json:
+            # the last rule added for a prefix wins
+            rules += [LogGroupRule.from_config(config) for config in json.loads(rules_json)]
+        return LogGroupRouter(rules)
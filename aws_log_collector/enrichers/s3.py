@@ -15,10 +15,17 @@
 import copy
 
 from aws_log_collector.enrichers.base_enricher import BaseEnricher
+from aws_log_collector.lib.frozen_dict import FrozenDict
+from aws_log_collector.lib.lru_cache import LruCache
 
 
 class S3LogsEnricher(BaseEnricher):
 
+    def __init__(self, tags_cache, container_cache_size=0, container_cache_ttl_seconds=5 * 60):
+        super().__init__(tags_cache)
+        self._container_cache = LruCache(container_cache_size) if container_cache_size > 0 else None
+        self._container_cache_ttl_seconds = container_cache_ttl_seconds
+
     def get_metadata(self, arns, metadata, sfx_metrics):
         result = copy.deepcopy(metadata)
 
@@ -28,3 +35,73 @@ class S3LogsEnricher(BaseEnricher):
             result = self.merge(result, {name: arn}, tags)
 
         return result
+
+    def get_arn_metadata(self, arns, metadata):
+        """
+        Same as get_metadata but without tags, which are provided separately
+        as tag dimension records.
+        """
+        result = copy.deepcopy(metadata)
+
+        for name, arn in arns:
+            result = self.merge(result, {name: arn})
+
+        return result
+
+    def memoize(self, metadata, with_tags=True, max_entries=1024):
+        """
+        Returns memo of enriched metadata for a single log file, see S3MetadataMemo.
+        """
+        return S3MetadataMemo(self, metadata, with_tags, max_entries,
+                              self._container_cache, self._container_cache_ttl_seconds)
+
+
+class S3MetadataMemo(object):
+    """
+    Enriched metadata of a single log file memoized per distinct list of ARNs,
+    e.g. nearly all lines of an ALB log file share the same elbArn and
+    targetGroupArn. Returned metadata is immutable as it is shared by many log
+    records. Unless disabled, the metadata is also kept in the per container
+    cache of the enricher until tags are refreshed.
+    """
+
+    def __init__(self, logs_enricher, metadata, with_tags, max_entries,
+                 container_cache=None, container_cache_ttl_seconds=None):
+        self._logs_enricher = logs_enricher
+        self._container_cache = container_cache
+        self._container_cache_ttl_seconds = container_cache_ttl_seconds
+        self._metadata = metadata
+        self._metadata_key = (with_tags, tuple(metadata.items()))
+        self._with_tags = with_tags
+        self._entries = LruCache(max_entries)
+        self.hits = 0
+        self.container_hits = 0
+        self.misses = 0
+
+    def get(self, arns, sfx_metrics):
+        key = tuple(arns)
+        result = self._entries.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        container_cache = self._container_cache
+        generation = self._logs_enricher.tags_generation() if container_cache is not None else None
+        if container_cache is not None:
+            cached = container_cache.get((self._metadata_key, key))
+            if cached is not None and cached[0] == generation:
+                result = cached[1]
+                self.container_hits += 1
+
+        if result is None:
+            self.misses += 1
+            if self._with_tags:
+                result = FrozenDict(self._logs_enricher.get_metadata(arns, self._metadata, sfx_metrics))
+            else:
+                result = FrozenDict(self._logs_enricher.get_arn_metadata(arns, self._metadata))
+            if container_cache is not None:
+                container_cache.put((self._metadata_key, key), (generation, result),
+                                    self._container_cache_ttl_seconds)
+
+        self._entries.put(key, result)
+        return result
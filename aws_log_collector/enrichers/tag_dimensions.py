@@ -0,0 +1,72 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from aws_log_collector.lib.lru_cache import LruCache
+
+
+class TagDimensions(object):
+    """
+    Produces "tag dimension" records, i.e. a single record with resource tags
+    per ARN, so that the backend can join tags with log records that carry
+    ARN fields only. A record of the same ARN is produced at most once per
+    interval_seconds.
+
+    ARNs of a log file are collected by collect, which keeps only ARNs the
+    tags cache may have tags for (e.g. not ARNs of S3 objects), and at most
+    max_arns_per_file of them, so that memory does not grow with the file.
+    """
+
+    def __init__(self, logs_enricher, interval_seconds, max_tracked_arns=10000, max_arns_per_file=1000):
+        self._logs_enricher = logs_enricher
+        self._interval_seconds = interval_seconds
+        self._produced = LruCache(max_tracked_arns)
+        self._max_arns_per_file = max_arns_per_file
+
+    def collect(self, arns, new_arns):
+        """
+        Adds (name, ARN) pairs of new_arns which may get a tag dimension record to arns.
+        """
+        for name_arn in new_arns:
+            if len(arns) >= self._max_arns_per_file:
+                return
+            if name_arn not in arns and self._produced.get(name_arn[1]) is None \
+                    and self._logs_enricher.may_have_tags(name_arn[1]):
+                arns.add(name_arn)
+
+    def to_hec(self, namespace, arns, context_metadata, sfx_metrics):
+        produced = 0
+        for name, arn in arns:
+            if self._produced.get(arn) is not None:
+                continue
+
+            tags = self._logs_enricher.get_tags(arn, sfx_metrics)
+            if tags:
+                # resources without tags yet are looked up again with the next file
+                self._produced.put(arn, True, self._interval_seconds)
+                produced += 1
+                yield self._to_hec(namespace, name, arn, tags, context_metadata)
+
+        sfx_metrics.counters(("sf.org.awsLogCollector.num.tagDimensionRecords", produced))
+
+    def _to_hec(self, namespace, name, arn, tags, context_metadata):
+        fields = {**context_metadata, "arn": arn, name: arn}
+        return {
+            "event": arn,
+            "fields": self._logs_enricher.merge(fields, tags),
+            "source": namespace,
+            "sourcetype": "aws:tags",
+            "time": time.time()
+        }
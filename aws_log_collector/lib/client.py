@@ -13,37 +13,81 @@
 # limitations under the License.
 
 import gzip
-import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import time
 
-from aws_log_collector.metric import size_of_str
+from aws_log_collector.lib.parallel import StageStats
 from aws_log_collector.logger import log
 
 
 class BatchClient(object):
 
     @staticmethod
-    def create(url, api_key, max_request_size_in_bytes, compression_level, sfx_metrics, max_retry=3):
-        client = RetryableClient.create(url, api_key, compression_level, sfx_metrics)
-        return BatchClient(client, max_request_size_in_bytes, max_retry)
+    def create(url, api_key, max_request_size_in_bytes, compression_level, sfx_metrics, max_retry=3, senders=1,
+               session_pool=None):
+        client = RetryableClient.create(url, api_key, compression_level, sfx_metrics, session_pool=session_pool)
+        return BatchClient(client, max_request_size_in_bytes, max_retry, senders, sfx_metrics)
 
-    def __init__(self, client, max_request_size_in_bytes, max_retry):
+    def __init__(self, client, max_request_size_in_bytes, max_retry, senders=1, sfx_metrics=None):
         self._client = client
         self._max_batch_size_bytes = max_request_size_in_bytes
         self._max_retry = max_retry
+        self._senders = senders
+        self._sfx_metrics = sfx_metrics
 
     def send(self, logs):
-        for batch in self._batch(logs):
-            try:
-                self._client.send(batch)
-            except Exception:
-                log.exception(f"Exception while forwarding log batch {batch}")
-            else:
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug(f"Forwarded log batch: {json.dumps(batch)}")
+        """
+        Sends logs in batches, returns the number of batches that could not
+        be sent (after retries).
+        """
+        if self._senders <= 1:
+            failed_batches = sum(not self._send_batch(batch) for batch in self._batch(logs))
+            self._send_failure_metrics(failed_batches)
+            return failed_batches
+
+        # batches are sent by senders threads, the next batch is built in the meantime
+        send_stats = StageStats("send")
+        idle_senders = threading.BoundedSemaphore(self._senders)
+        failures = []
+
+        def sent(done):
+            idle_senders.release()
+            if not done.result():
+                failures.append(done)
+
+        with ThreadPoolExecutor(max_workers=self._senders) as executor:
+            pending = []
+            for batch in self._batch(logs):
+                start = time.perf_counter()
+                idle_senders.acquire()
+                stall_seconds = time.perf_counter() - start
+                future = executor.submit(self._send_batch, batch)
+                future.add_done_callback(sent)
+                pending = [future for future in pending if not future.done()] + [future]
+                send_stats.record(len(pending), stall_seconds)
+
+        if self._sfx_metrics is not None:
+            send_stats.send_metrics(self._sfx_metrics)
+        self._send_failure_metrics(len(failures))
+        return len(failures)
+
+    def _send_batch(self, batch):
+        try:
+            self._client.send(batch)
+        except Exception:
+            log.exception(f"Exception while forwarding log batch {batch}")
+            return False
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug(f"Forwarded log batch: {[_to_str(item) for item in batch]}")
+        return True
+
+    def _send_failure_metrics(self, failed_batches):
+        if self._sfx_metrics is not None and failed_batches > 0:
+            self._sfx_metrics.counters(("sf.org.awsLogCollector.num.failedBatches", failed_batches))
 
     def _batch(self, items):
         batch = []
@@ -53,7 +97,7 @@ class BatchClient(object):
             if item_size_bytes > self._max_batch_size_bytes:
                 log.info(
                     f"Item is bigger than max batch size ({self._max_batch_size_bytes}), going to truncate it")
-                item = item.encode("utf-8")[:self._max_batch_size_bytes].decode("utf-8", "ignore")
+                item = _truncate(item, self._max_batch_size_bytes)
                 item_size_bytes = self._size_of_bytes(item)
 
             if item_size_bytes + batch_size_bytes > self._max_batch_size_bytes:
@@ -76,14 +120,14 @@ class BatchClient(object):
 
     @staticmethod
     def _size_of_bytes(item):
-        return len(str(item).encode("UTF-8"))
+        return len(_to_bytes(item))
 
 
 class RetryableClient(object):
 
     @staticmethod
-    def create(url, api_key, compression_level, sfx_metrics, max_retry=3):
-        client = HTTPClient(url, api_key, compression_level, sfx_metrics)
+    def create(url, api_key, compression_level, sfx_metrics, max_retry=3, session_pool=None):
+        client = HTTPClient(url, api_key, compression_level, sfx_metrics, session_pool=session_pool)
         return RetryableClient(client, max_retry)
 
     def __init__(self, client, max_retry=3):
@@ -117,29 +161,81 @@ class RetryableException(Exception):
     pass
 
 
+class SessionPool(object):
+    """
+    Keeps sessions, and so connections they opened, between invocations. A
+    session is used by a single thread at a time.
+    """
+
+    def __init__(self):
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return requests.Session()
+
+    def release(self, session):
+        with self._lock:
+            self._idle.append(session)
+
+    def connect(self, url, timeout):
+        """
+        Opens a connection to the host of url, e.g. while the function is
+        initialized, so that the first request does not wait for the TLS handshake.
+        """
+        session = self.acquire()
+        try:
+            # the status does not matter, the connection is kept open either way
+            session.head(url, timeout=timeout)
+        finally:
+            self.release(session)
+
+
 class HTTPClient(object):
 
-    def __init__(self, host, api_key, compression_level, sfx_metrics, timeout=20):
+    def __init__(self, host, api_key, compression_level, sfx_metrics, timeout=20, session_pool=None):
         self._url = host
         self._headers = {"Content-type": "application/json", "Content-Encoding": "gzip", "X-SF-TOKEN": api_key}
         self._compression_level = compression_level
         self._sfx_metrics = sfx_metrics
         self._timeout = timeout
-        self._session = None
+        self._session_pool = session_pool
+        # batches may be sent from several threads, each one gets a session of its own
+        self._sessions = None
+        self._sessions_lock = threading.Lock()
+        self._thread_local = None
 
     def _connect(self):
-        self._session = requests.Session()
-        self._session.headers.update(self._headers)
+        self._sessions = []
+        self._thread_local = threading.local()
 
     def _close(self):
-        self._session.close()
-        self._session = None
+        for session in self._sessions:
+            if self._session_pool is not None:
+                self._session_pool.release(session)
+            else:
+                session.close()
+        self._sessions = None
+        self._thread_local = None
+
+    def _session(self):
+        session = getattr(self._thread_local, "session", None)
+        if session is None:
+            session = self._session_pool.acquire() if self._session_pool is not None else requests.Session()
+            session.headers.update(self._headers)
+            self._thread_local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
 
     def send(self, log_events):
         log_events_combined = self._combine_events(log_events)
         data_compressed = self._compress_logs(log_events_combined)
         self._sfx_metrics.counters(
-            ('sf.org.awsLogCollector.num.outputUncompressedBytes', size_of_str(log_events_combined)),
+            ('sf.org.awsLogCollector.num.outputUncompressedBytes', len(log_events_combined)),
             ('sf.org.awsLogCollector.num.outputCompressedBytes', len(data_compressed)),
             ("sf.org.awsLogCollector.num.splunkLogRequests", 1)
         )
@@ -147,7 +243,7 @@ class HTTPClient(object):
             if log.isEnabledFor(logging.DEBUG):
                 log.debug(f"Data to be sent={data_compressed}")
             log.info(f"Sending request to url={self._url}")
-            resp = self._session.post(self._url, data_compressed, timeout=self._timeout)
+            resp = self._session().post(self._url, data_compressed, timeout=self._timeout)
         except Exception as ex:
             # network error
             log.warning(f"Exception occurred during log sending {ex}")
@@ -162,10 +258,10 @@ class HTTPClient(object):
 
     @staticmethod
     def _combine_events(logs):
-        return "\n".join(logs)
+        return b"\n".join([_to_bytes(log_event) for log_event in logs])
 
     def _compress_logs(self, batch):
-        return gzip.compress(bytes(batch, "utf-8"), self._compression_level)
+        return gzip.compress(batch, self._compression_level)
 
     def __enter__(self):
         self._connect()
@@ -173,3 +269,17 @@ class HTTPClient(object):
 
     def __exit__(self, ex_type, ex_value, traceback):
         self._close()
+
+
+# log items are either UTF-8 encoded (bytes) or str
+def _to_bytes(item):
+    return item if isinstance(item, bytes) else str(item).encode("utf-8")
+
+
+def _to_str(item):
+    return item.decode("utf-8") if isinstance(item, bytes) else item
+
+
+def _truncate(item, max_size_bytes):
+    truncated = _to_bytes(item)[:max_size_bytes].decode("utf-8", "ignore")
+    return truncated.encode("utf-8") if isinstance(item, bytes) else truncated
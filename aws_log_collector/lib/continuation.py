@@ -0,0 +1,124 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import threading
+
+import boto3
+import time
+
+from aws_log_collector.logger import log
+
+# S3 event record field holding the checkpoint of a record processed partially
+CHECKPOINT_FIELD = "awsLogCollectorCheckpoint"
+
+
+class Deadline(object):
+    """
+    Point in time, margin_seconds before the invocation times out, when
+    processing should stop so that the work done can still be sent.
+    """
+
+    def __init__(self, remaining_seconds, margin_seconds):
+        self._time = time.monotonic() + remaining_seconds - margin_seconds
+
+    def is_near(self):
+        return time.monotonic() >= self._time
+
+
+class Continuations(object):
+    """
+    Collects checkpoints of S3 event records that could not be processed
+    before the deadline and invokes the function again with an event
+    resuming them, once everything processed so far has been sent.
+
+    Checkpoints travel with the continuation event: each record carries the
+    number of lines already processed under CHECKPOINT_FIELD.
+    """
+
+    def __init__(self, invoker, margin_seconds):
+        self._invoker = invoker
+        self._margin_seconds = margin_seconds
+        self._records = []
+        self._lock = threading.Lock()
+
+    def deadline(self, context):
+        if self._margin_seconds <= 0:
+            return None
+        remaining_seconds = context.get_remaining_time_in_millis() / 1000
+        if remaining_seconds <= self._margin_seconds:
+            # nothing would be processed, and the continuation would be continued forever
+            log.warning(f"Remaining time of the invocation ({remaining_seconds}s) is shorter than "
+                        f"the continuation margin ({self._margin_seconds}s), ignoring the deadline")
+            return None
+        return Deadline(remaining_seconds, self._margin_seconds)
+
+    def add(self, record, lines):
+        with self._lock:
+            self._records.append({**record, CHECKPOINT_FIELD: {"lines": lines}})
+
+    def dispatch(self, context, sfx_metrics):
+        """
+        Invokes the function with records checkpointed during this invocation, if any.
+        """
+        with self._lock:
+            records, self._records = self._records, []
+        if not records:
+            return
+
+        log.info(f"Deadline is near, continuing {len(records)} S3 object(s) in another invocation")
+        self._invoker.invoke(context.invoked_function_arn, {"Records": records})
+        sfx_metrics.counters(("sf.org.awsLogCollector.num.s3.continuations", len(records)))
+
+    def discard(self):
+        with self._lock:
+            self._records = []
+
+    @staticmethod
+    def checkpoint_lines(record):
+        return record.get(CHECKPOINT_FIELD, {}).get("lines", 0)
+
+
+class LambdaInvoker(object):
+    """
+    Invokes a Lambda function asynchronously, the function is retried by
+    Lambda if it fails.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+
+    def invoke(self, function_arn, event):
+        if self._client is None:
+            self._client = boto3.client("lambda")
+        self._client.invoke(FunctionName=function_arn, InvocationType="Event", Payload=json.dumps(event))
+
+
+class LocalInvoker(object):
+    """
+    Stand-in of LambdaInvoker keeping invocations in memory, so that they can
+    be run locally (e.g. in tests) with run_pending.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def invoke(self, function_arn, event):
+        # the event is serialized, just like the payload of a real invocation
+        self.events.append((function_arn, json.loads(json.dumps(event))))
+
+    def run_pending(self, handler, context):
+        while self.events:
+            _, event = self.events.pop(0)
+            handler(event, context)
@@ -0,0 +1,74 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from aws_log_collector.lib.frozen_dict import FrozenDict
+from aws_log_collector.lib.json_encoder import create_json_encoder
+
+# HEC item fields that differ for every log record
+VARIABLE_FIELDS = ("event", "time")
+
+
+class HecSerializer(object):
+    """
+    Serializes HEC items to UTF-8 JSON, the output is the same as
+    encoder.dumps(hec_item).
+
+    HEC items sharing the same immutable "fields" (a FrozenDict) and the same
+    host, source and sourcetype share a template of the serialized envelope, so
+    only the event and time are serialized per item. Other items are
+    serialized as a whole.
+    """
+
+    def __init__(self, max_templates=1024, encoder=None):
+        self._encoder = encoder or create_json_encoder()
+        self._templates = {}
+        self._max_templates = max_templates
+
+    def dumps(self, hec_item):
+        fields = hec_item.get("fields")
+        if type(fields) is not FrozenDict:
+            return self._encoder.dumps(hec_item)
+
+        key = (id(fields), tuple(hec_item.keys()),
+               hec_item.get("host"), hec_item.get("source"), hec_item.get("sourcetype"))
+        template = self._templates.get(key)
+        if template is None:
+            template = self._template(hec_item)
+            if template is None:
+                return self._encoder.dumps(hec_item)
+            if len(self._templates) >= self._max_templates:
+                self._templates.clear()
+            self._templates[key] = template
+
+        # the template keeps a reference to fields, so its id can not be reused by another object
+        _, parts, suffix = template
+        dumps = self._encoder.dumps
+        return b"".join([prefix + dumps(hec_item[name]) for prefix, name in parts]) + suffix
+
+    def _template(self, hec_item):
+        if any(name not in hec_item for name in VARIABLE_FIELDS):
+            return None
+
+        parts = []
+        prefix = b"{"
+        for i, (name, value) in enumerate(hec_item.items()):
+            if i > 0:
+                prefix += self._encoder.item_separator
+            prefix += self._encoder.dumps(name) + self._encoder.key_separator
+            if name in VARIABLE_FIELDS:
+                parts.append((prefix, name))
+                prefix = b""
+            else:
+                prefix += self._encoder.dumps(value)
+        return hec_item["fields"], parts, prefix + b"}"
@@ -0,0 +1,105 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    # optional, the stdlib encoder is used when it is not installed
+    orjson = None
+
+DEFAULT = "json"
+
+
+class JsonEncoder(object):
+    """
+    Encodes objects using the json module of the stdlib, the output is the
+    same as json.dumps(obj) encoded to UTF-8 (ASCII really, as non-ASCII
+    characters are escaped).
+    """
+
+    name = "json"
+    item_separator = b", "
+    key_separator = b": "
+
+    def dumps(self, obj):
+        return json.dumps(obj).encode("utf-8")
+
+
+class CompactJsonEncoder(object):
+    """
+    Encodes objects to compact UTF-8 JSON using the json module of the stdlib:
+    no whitespace between items and non-ASCII characters written as they are,
+    not escaped. Smaller than the output of JsonEncoder, but not the same bytes.
+    """
+
+    name = "json-compact"
+    item_separator = b","
+    key_separator = b":"
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+        self._ascii_encoder = json.JSONEncoder(separators=(",", ":"))
+
+    def dumps(self, obj):
+        text = self._encoder.encode(obj)
+        try:
+            return text.encode("utf-8")
+        except UnicodeEncodeError:
+            # lone surrogates (e.g. a "\ud800" escape in a JSON log line) have
+            # no UTF-8 encoding, so they stay escaped
+            return self._ascii_encoder.encode(obj).encode("utf-8")
+
+
+class OrjsonEncoder(object):
+    """
+    Encodes objects using orjson, with the same output as CompactJsonEncoder
+    except for floats: NaN and infinity are written as null, and exponents
+    without "+" and leading zeros (1e16 instead of 1e+16, the same number).
+
+    Objects orjson does not support (e.g. integers above 64 bits, non-string
+    keys or lone surrogates) are encoded by CompactJsonEncoder.
+    """
+
+    name = "orjson"
+    item_separator = b","
+    key_separator = b":"
+
+    def __init__(self):
+        self._fallback = CompactJsonEncoder()
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            return self._fallback.dumps(obj)
+
+
+def available_encoders():
+    encoders = [JsonEncoder, CompactJsonEncoder]
+    if orjson is not None:
+        encoders.append(OrjsonEncoder)
+    return encoders
+
+
+def create_json_encoder(name=DEFAULT):
+    """
+    Creates the encoder of the given name. Only the default one, "json", sends
+    the same bytes as json.dumps, the others are smaller or faster.
+    """
+    encoders = {encoder.name: encoder for encoder in available_encoders()}
+    if name not in encoders:
+        raise ValueError(f"JSON encoder {name} is not available, available encoders: {', '.join(encoders)}")
+    return encoders[name]()
@@ -0,0 +1,129 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def _unit_size(key, value):
+    return 1
+
+
+class LruCache(object):
+    """
+    Least recently used cache with an optional TTL per entry.
+
+    The cache is bounded by the total size of its entries. The size of a single
+    entry is computed by the sizeof(key, value) function and defaults to 1, in
+    which case the cache is bounded by the number of entries. Values shared by
+    several entries (e.g. interned ones) are sized by shared_sizeof(value),
+    counted once while any entry refers to the same value object.
+
+    The cache is safe to use from multiple threads.
+    """
+
+    def __init__(self, max_size, sizeof=_unit_size, clock=time.monotonic, shared_sizeof=None):
+        self._entries = OrderedDict()
+        self._max_size = max_size
+        self._sizeof = sizeof
+        self._shared_sizeof = shared_sizeof
+        # id of a shared value -> [value, number of entries referring to it, size]
+        self._shared = {}
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get(key, default)
+
+    def put(self, key, value, ttl_seconds=None):
+        with self._lock:
+            return self._put(key, value, ttl_seconds)
+
+    def remove(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._shared.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, default):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= self._clock():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _put(self, key, value, ttl_seconds):
+        if key in self._entries:
+            self._remove(key)
+
+        size = self._sizeof(key, value)
+        shared = self._shared.get(id(value)) if self._shared_sizeof is not None else None
+        shared_size = self._shared_sizeof(value) if self._shared_sizeof is not None and shared is None else 0
+        if size + shared_size > self._max_size:
+            return False
+
+        expires_at = self._clock() + ttl_seconds if ttl_seconds is not None else None
+        self._entries[key] = (value, expires_at, size)
+        self.size += size
+        if self._shared_sizeof is not None:
+            if shared is None:
+                shared = self._shared[id(value)] = [value, 0, shared_size]
+                self.size += shared_size
+            shared[1] += 1
+
+        while self.size > self._max_size:
+            _, (evicted_value, _, evicted_size) = self._entries.popitem(last=False)
+            self.size -= evicted_size
+            self._release(evicted_value)
+            self.evictions += 1
+        return True
+
+    def _remove(self, key):
+        value, _, size = self._entries.pop(key)
+        self.size -= size
+        self._release(value)
+
+    def _release(self, value):
+        if self._shared_sizeof is None:
+            return
+        shared = self._shared[id(value)]
+        shared[1] -= 1
+        if shared[1] == 0:
+            del self._shared[id(value)]
+            self.size -= shared[2]
@@ -0,0 +1,150 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import boto3
+
+from aws_log_collector.logger import log
+
+# assumed role credentials are renewed this long before they expire
+CREDENTIALS_RENEWAL_MARGIN_SECONDS = 5 * 60
+
+
+class MultiAccountTagsCache(object):
+    """
+    Routes tag lookups to a separate TagsCache per AWS account, based on the
+    account ID in the resource ARN. ARNs of other accounts (or without an
+    account ID, e.g. S3 buckets) are looked up in the default cache.
+
+    Namespaces that have already been fetched are refreshed in parallel
+    across all accounts, once any of them expires.
+    """
+
+    def __init__(self, default_cache, caches_by_account_id, max_workers=8):
+        self.default_cache = default_cache
+        self.caches_by_account_id = caches_by_account_id
+        self._max_workers = max_workers
+        self._next_refresh_time = float("inf")
+        # generation of the caches when the next refresh time was computed,
+        # namespaces fetched by lookups since then may expire sooner
+        self._refreshed_generation = 0
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return sum(cache.generation for cache in self._caches())
+
+    def get(self, resource_arn, sfx_metrics):
+        if self._refresh_due():
+            with self._refresh_lock:
+                # another thread may have refreshed the caches in the meantime
+                if self._refresh_due():
+                    self.refresh_expired(sfx_metrics)
+
+        return self._cache_for(resource_arn).get(resource_arn, sfx_metrics)
+
+    def may_have_tags(self, resource_arn):
+        return self._cache_for(resource_arn).may_have_tags(resource_arn)
+
+    def refresh_expired(self, sfx_metrics):
+        expired = [(cache, namespace) for cache in self._caches()
+                   for namespace in cache.namespaces.values()
+                   if namespace.last_fetch_time > 0 and namespace.is_expired()]
+        if expired:
+            log.debug(f"Refreshing {len(expired)} expired namespace(s)")
+            # through the refresh lock of each namespace, so a namespace being
+            # refreshed by a lookup is not fetched twice
+            with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+                refreshed = list(executor.map(
+                    lambda cache_namespace: cache_namespace[0].refresh_if_expired(cache_namespace[1]), expired))
+            sfx_metrics.counters(("sf.org.awsLogCollector.num.tagCacheRefresh", sum(refreshed)))
+
+        self._refreshed_generation = self.generation
+        self._next_refresh_time = min([namespace.last_fetch_time + namespace.ttl_seconds
+                                       for cache in self._caches() for namespace in cache.namespaces.values()
+                                       if namespace.last_fetch_time > 0], default=float("inf"))
+
+    def prewarm(self, namespace_names, timeout_seconds):
+        caches = self._caches()
+        executor = ThreadPoolExecutor(max_workers=len(caches))
+        futures = [executor.submit(cache.prewarm, namespace_names, timeout_seconds) for cache in caches]
+        # each cache waits for its own fetches at most timeout_seconds
+        done, _ = wait(futures, timeout=timeout_seconds + 1)
+        executor.shutdown(wait=False, cancel_futures=True)
+        return sum(future.result() for future in done)
+
+    def send_metrics(self, sfx_metrics):
+        counters, gauges = defaultdict(int), defaultdict(int)
+        for cache in self._caches():
+            cache_counters, cache_gauges = cache.collect_metrics()
+            for name, value in cache_counters:
+                counters[name] += value
+            for name, value in cache_gauges:
+                gauges[name] += value
+        sfx_metrics.counters(*counters.items())
+        sfx_metrics.gauges(*gauges.items())
+
+    def _refresh_due(self):
+        return time.time() > self._next_refresh_time or self.generation != self._refreshed_generation
+
+    def _cache_for(self, resource_arn):
+        parts = resource_arn.split(":", 5)
+        account_id = parts[4] if len(parts) > 5 else None
+        return self.caches_by_account_id.get(account_id, self.default_cache)
+
+    def _caches(self):
+        return [self.default_cache, *self.caches_by_account_id.values()]
+
+
+class AssumedRoleTaggingClients(object):
+    """
+    Creates resource tagging API clients of another account by assuming the
+    given role. Clients are re-created once the role credentials are about to expire.
+    """
+
+    def __init__(self, role_arn, region_name, sts_client, global_region_available,
+                 session_factory=boto3.session.Session, session_name="splunk-aws-log-collector"):
+        self._role_arn = role_arn
+        self._region_name = region_name
+        self._sts_client = sts_client
+        self._global_region_available = global_region_available
+        self._session_factory = session_factory
+        self._session_name = session_name
+        self._clients = None
+        self._expiration_time = 0
+        # namespaces of the account are fetched from several threads
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            return self._get_clients()
+
+    def _get_clients(self):
+        if self._clients is None or time.time() > self._expiration_time - CREDENTIALS_RENEWAL_MARGIN_SECONDS:
+            log.debug(f"Assuming role {self._role_arn}")
+            credentials = self._sts_client.assume_role(RoleArn=self._role_arn,
+                                                       RoleSessionName=self._session_name)["Credentials"]
+            session = self._session_factory(aws_access_key_id=credentials["AccessKeyId"],
+                                            aws_secret_access_key=credentials["SecretAccessKey"],
+                                            aws_session_token=credentials["SessionToken"],
+                                            region_name=self._region_name)
+            global_client = session.client("resourcegroupstaggingapi", region_name="us-east-1") \
+                if self._global_region_available else None
+            self._clients = session.client("resourcegroupstaggingapi"), global_client
+            self._expiration_time = credentials["Expiration"].timestamp()
+        return self._clients
@@ -0,0 +1,194 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+_FAILED = object()
+
+# how often threads blocked on a queue check whether they should stop
+WAIT_TIMEOUT_SECONDS = 0.1
+
+
+class StageStats(object):
+    """
+    Queue depth and stall time of a single pipeline stage, where stall time is
+    the time the stage spent waiting for the next stage to take its output.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.max_queue_depth = 0
+        self.stall_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, queue_depth, stall_seconds):
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+            self.stall_seconds += stall_seconds
+
+    def send_metrics(self, sfx_metrics):
+        sfx_metrics.counters((f"sf.org.awsLogCollector.num.pipeline.{self.name}StallMicros",
+                              int(self.stall_seconds * 1000000)))
+        sfx_metrics.gauges((f"sf.org.awsLogCollector.pipeline.{self.name}QueueDepth", self.max_queue_depth))
+
+
+def merge(producers, max_workers, max_pending_items=1000):
+    """
+    Runs producers (functions returning iterables) on at most max_workers threads
+    and yields their items in the order they are produced.
+
+    Items are passed through a bounded queue, so producers are held back when the
+    consumer is slower. An exception raised by a producer is re-raised to the
+    consumer, which stops the remaining producers (as does closing the generator).
+    """
+    producers = list(producers)
+    if max_workers <= 1 or len(producers) <= 1:
+        for producer in producers:
+            yield from producer()
+        return
+
+    items = queue.Queue(max_pending_items)
+    stopped = threading.Event()
+
+    def run(producer):
+        try:
+            for item in producer():
+                if not _put(items, (None, item), stopped):
+                    return
+        except Exception as ex:
+            _put(items, (_FAILED, ex), stopped)
+        finally:
+            _put(items, (_DONE, None), stopped)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(producers))) as executor:
+        for producer in producers:
+            executor.submit(run, producer)
+
+        running = len(producers)
+        try:
+            while running > 0:
+                kind, value = items.get()
+                if kind is _DONE:
+                    running -= 1
+                elif kind is _FAILED:
+                    raise value
+                else:
+                    yield value
+        finally:
+            stopped.set()
+
+
+def pipelined_map(transform, items, workers, max_pending_items=2, read_stats=None, transform_stats=None):
+    """
+    Yields transform(item) of each item in the order of items.
+
+    Items are read on a thread of their own and transformed on workers threads,
+    so reading (e.g. network I/O and decompression, which release the GIL)
+    overlaps with transforming and with the consumer. Stages are connected by
+    bounded queues and the number of items in flight is bounded as well, so
+    slow stages hold back the previous ones. An exception raised while reading
+    or transforming is re-raised to the consumer.
+    """
+    if workers <= 0:
+        for item in items:
+            yield transform(item)
+        return
+
+    inputs = queue.Queue(max_pending_items)
+    outputs = queue.Queue(max_pending_items)
+    # bounds results waiting for an earlier item to be transformed
+    in_flight = threading.BoundedSemaphore(2 * max_pending_items + workers)
+    stopped = threading.Event()
+
+    def read():
+        try:
+            for index, item in enumerate(items):
+                if not _acquire(in_flight, stopped) or not _put(inputs, (index, item), stopped, read_stats):
+                    return
+        except Exception as ex:
+            _put(outputs, (_FAILED, ex), stopped)
+        finally:
+            for _ in range(workers):
+                _put(inputs, (_DONE, None), stopped)
+
+    def transform_items():
+        try:
+            while True:
+                index, item = _get(inputs, stopped)
+                if index is _DONE:
+                    return
+                if not _put(outputs, (index, transform(item)), stopped, transform_stats):
+                    return
+        except Exception as ex:
+            _put(outputs, (_FAILED, ex), stopped)
+        finally:
+            _put(outputs, (_DONE, None), stopped)
+
+    threads = [threading.Thread(target=read, daemon=True)]
+    threads += [threading.Thread(target=transform_items, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    running, results, next_index = workers, {}, 0
+    try:
+        while running > 0:
+            index, value = outputs.get()
+            if index is _DONE:
+                running -= 1
+            elif index is _FAILED:
+                raise value
+            else:
+                results[index] = value
+                while next_index in results:
+                    result = results.pop(next_index)
+                    next_index += 1
+                    in_flight.release()
+                    yield result
+    finally:
+        stopped.set()
+        for thread in threads:
+            thread.join()
+
+
+def _put(items, item, stopped, stats=None):
+    start = time.perf_counter()
+    while not stopped.is_set():
+        try:
+            items.put(item, timeout=WAIT_TIMEOUT_SECONDS)
+            if stats is not None:
+                stats.record(items.qsize(), time.perf_counter() - start)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(items, stopped):
+    while not stopped.is_set():
+        try:
+            return items.get(timeout=WAIT_TIMEOUT_SECONDS)
+        except queue.Empty:
+            pass
+    return _DONE, None
+
+
+def _acquire(semaphore, stopped):
+    while not stopped.is_set():
+        if semaphore.acquire(timeout=WAIT_TIMEOUT_SECONDS):
+            return True
+    return False
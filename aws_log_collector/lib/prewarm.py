@@ -0,0 +1,78 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+from aws_log_collector.logger import log
+
+
+class Prewarm(object):
+    """
+    Runs steps while the function is initialized, when Lambda gives it the
+    full CPU, rather than during the first invocation, e.g. opening the
+    connection to the ingest endpoint or fetching tags.
+
+    Steps share a time budget: a step is given the time left and steps are
+    skipped once it runs out. Durations of steps that succeeded are reported
+    by the first invocation, as the latency it was spared.
+    """
+
+    def __init__(self, time_budget_seconds, clock=time.monotonic):
+        self._clock = clock
+        self._deadline = clock() + time_budget_seconds
+        self.durations = {}
+        self.skipped = []
+        self.failed = []
+        self._reported = False
+
+    def remaining_seconds(self):
+        return max(self._deadline - self._clock(), 0)
+
+    def run(self, name, step):
+        """
+        Calls step with the number of seconds left of the budget.
+        """
+        remaining_seconds = self.remaining_seconds()
+        if remaining_seconds <= 0:
+            log.info(f"Prewarm step {name} skipped, the time budget ran out")
+            self.skipped.append(name)
+            return
+
+        start = self._clock()
+        try:
+            step(remaining_seconds)
+        except Exception as ex:
+            log.warning(f"Prewarm step {name} failed: {ex}")
+            self.failed.append(name)
+            return
+        self.durations[name] = self._clock() - start
+        log.debug(f"Prewarm step {name} took {self.durations[name]:.3f}s")
+
+    def send_metrics(self, sfx_metrics):
+        """
+        Sends metrics of the steps once, by the first invocation.
+        """
+        if self._reported:
+            return
+        self._reported = True
+        sfx_metrics.gauges(
+            ("sf.org.awsLogCollector.prewarm.savedMillis", self._millis(sum(self.durations.values()))),
+            *[(f"sf.org.awsLogCollector.prewarm.{name}Millis", self._millis(duration))
+              for name, duration in self.durations.items()])
+        sfx_metrics.counters(("sf.org.awsLogCollector.num.prewarm.skippedSteps", len(self.skipped)),
+                             ("sf.org.awsLogCollector.num.prewarm.failedSteps", len(self.failed)))
+
+    @staticmethod
+    def _millis(seconds):
+        return int(round(seconds * 1000))
@@ -0,0 +1,139 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import threading
+import traceback
+from collections import deque
+
+from aws_log_collector.logger import log
+
+_ERROR = "error"
+_RESULT = "result"
+_DONE = object()
+
+
+class ProcessPool(object):
+    """
+    Pool of processes running handler on items of map, connected to this
+    process by pipes only. multiprocessing.Pool and queues need POSIX
+    semaphores, which are not available in AWS Lambda (there is no /dev/shm).
+
+    Processes are forked when the pool is created, so the handler (and
+    everything it refers to) is inherited rather than pickled. The pool
+    should be created while this process runs a single thread, e.g. when the
+    function is initialized, and then lives as long as the execution
+    environment. Items and results are pickled.
+
+    The pool is used by a single map at a time, see acquire. Items must not
+    be None, which stops a process.
+    """
+
+    def __init__(self, processes, handler):
+        context = multiprocessing.get_context("fork")
+        self._connections = []
+        self._processes = []
+        for _ in range(processes):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=_serve, args=(worker_connection, handler), daemon=True)
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self._lock = threading.Lock()
+        self.broken = False
+
+    def acquire(self):
+        """
+        Returns True if the pool can be used by the caller, who then has to
+        release it once map is done.
+        """
+        return not self.broken and self._lock.acquire(blocking=False)
+
+    def release(self):
+        self._lock.release()
+
+    def map(self, items):
+        """
+        Yields results of handler for items in the order of items. Each process
+        works on a single item at a time, the next item is taken once the result
+        of the oldest one is received, so at most one item per process is pending.
+        An exception raised by handler is re-raised as RuntimeError.
+        """
+        items = iter(items)
+        pending = deque()
+        try:
+            for connection in self._connections:
+                if not self._submit(connection, items):
+                    break
+                pending.append(connection)
+
+            while pending:
+                connection = pending.popleft()
+                result = self._receive(connection)
+                if self._submit(connection, items):
+                    pending.append(connection)
+                yield result
+        finally:
+            # results of items still being processed are discarded, e.g. when
+            # the consumer stopped early
+            for connection in pending:
+                try:
+                    self._receive(connection)
+                except Exception:
+                    pass
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+                connection.close()
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join()
+
+    @staticmethod
+    def _submit(connection, items):
+        item = next(items, _DONE)
+        if item is _DONE:
+            return False
+        connection.send(item)
+        return True
+
+    def _receive(self, connection):
+        try:
+            status, value = connection.recv()
+        except (EOFError, OSError) as ex:
+            # e.g. the process ran out of memory and was killed
+            self.broken = True
+            log.error(f"Process of the pool exited unexpectedly, the pool is not used anymore: {ex!r}")
+            raise RuntimeError("process of the pool exited unexpectedly") from ex
+        if status == _ERROR:
+            raise RuntimeError(f"handler failed in a process of the pool: {value}")
+        return value
+
+
+def _serve(connection, handler):
+    while True:
+        try:
+            item = connection.recv()
+        except EOFError:
+            return
+        if item is None:
+            return
+        try:
+            connection.send((_RESULT, handler(item)))
+        except Exception:
+            connection.send((_ERROR, traceback.format_exc()))
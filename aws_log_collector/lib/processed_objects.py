@@ -0,0 +1,224 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from urllib.parse import unquote_plus
+
+import boto3
+import time
+
+from aws_log_collector.lib.continuation import Continuations
+from aws_log_collector.lib.lru_cache import LruCache
+from aws_log_collector.logger import log
+
+COMPLETE = "complete"
+# the rest of the object was continued by another invocation
+PARTIAL = "partial"
+
+# what to do with a partially forwarded object notified again
+SKIP = "skip"
+RESUME = "resume"
+REPROCESS = "reprocess"
+PARTIAL_POLICIES = (SKIP, RESUME, REPROCESS)
+
+
+def object_id(record):
+    """
+    Identifies the version of the object of an S3 event record. The sequencer
+    tells apart objects written again under the same key with the same content.
+    """
+    s3_object = record["s3"]["object"]
+    return "/".join([record["s3"]["bucket"]["name"], unquote_plus(s3_object["key"]),
+                     s3_object.get("eTag", ""), s3_object.get("sequencer", "")])
+
+
+class ProcessedObjects(object):
+    """
+    Skips objects of S3 event records already forwarded, e.g. when Lambda
+    retries a failed invocation or S3 delivers a notification twice.
+
+    Objects are marked once everything processed so far has been sent (see
+    commit), as complete or as partial when the rest of the object was
+    continued by another invocation. An object marked as partial and notified
+    again is handled by partial_policy: skipped (the continuation forwards the
+    rest), resumed after the lines forwarded, or processed from the start.
+    Continuations themselves are always processed, unless the object is complete.
+    """
+
+    def __init__(self, store, partial_policy=SKIP):
+        if partial_policy not in PARTIAL_POLICIES:
+            raise ValueError(f"Unknown partial policy {partial_policy}, expected one of {', '.join(PARTIAL_POLICIES)}")
+        self._store = store
+        self._partial_policy = partial_policy
+        self._marks = []
+        self._lock = threading.Lock()
+
+    def start(self, record, sfx_metrics):
+        """
+        Returns the number of lines of the object to skip, or None when the
+        whole object should be skipped.
+        """
+        checkpoint_lines = Continuations.checkpoint_lines(record)
+        try:
+            state = self._store.get(object_id(record))
+        except Exception as ex:
+            # the object is rather forwarded twice than not at all
+            log.warning(f"Failed to read state of S3 object {object_id(record)}, processing it anyway: {ex}")
+            return checkpoint_lines
+
+        if state is None or (checkpoint_lines > 0 and state["status"] != COMPLETE):
+            return checkpoint_lines
+        if state["status"] == COMPLETE or self._partial_policy == SKIP:
+            log.info(f"S3 object {object_id(record)} was processed already ({state['status']}), skipping it")
+            sfx_metrics.inc_counter("sf.org.awsLogCollector.num.s3.duplicateObjects")
+            return None
+        return state.get("lines", 0) if self._partial_policy == RESUME else 0
+
+    def complete(self, record):
+        self._mark(record, {"status": COMPLETE})
+
+    def partial(self, record, lines):
+        self._mark(record, {"status": PARTIAL, "lines": lines})
+
+    def commit(self):
+        """
+        Stores marks of objects processed during this invocation, to be called
+        once everything processed has been sent.
+        """
+        with self._lock:
+            marks, self._marks = self._marks, []
+        for object_id_, state in marks:
+            try:
+                self._store.put(object_id_, state)
+            except Exception as ex:
+                log.error(f"Failed to store state of S3 object {object_id_}: {ex}")
+
+    def discard(self):
+        with self._lock:
+            self._marks = []
+
+    def _mark(self, record, state):
+        with self._lock:
+            self._marks.append((object_id(record), state))
+
+
+class MemoryStore(object):
+    """
+    Keeps states in the execution environment, so only duplicates handled by
+    the same environment are detected.
+    """
+
+    def __init__(self, ttl_seconds, max_entries=100000):
+        self._ttl_seconds = ttl_seconds
+        self._entries = LruCache(max_entries)
+
+    def get(self, object_id_):
+        return self._entries.get(object_id_)
+
+    def put(self, object_id_, state):
+        self._entries.put(object_id_, state, self._ttl_seconds)
+
+
+class FileStore(object):
+    """
+    Keeps states in files of a local directory, one file per object, which
+    may be shared by processes of the same host.
+    """
+
+    def __init__(self, directory, ttl_seconds):
+        self._directory = directory
+        self._ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, object_id_):
+        try:
+            with open(self._path(object_id_), "r") as file:
+                entry = json.load(file)
+        except FileNotFoundError:
+            return None
+        if entry["expiresAt"] < time.time():
+            return None
+        return entry["state"]
+
+    def put(self, object_id_, state):
+        entry = {"id": object_id_, "state": state, "expiresAt": time.time() + self._ttl_seconds}
+        # readers see either the previous file or the new one
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(file_descriptor, "w") as file:
+            json.dump(entry, file)
+        os.replace(temporary_path, self._path(object_id_))
+
+    def _path(self, object_id_):
+        return os.path.join(self._directory, hashlib.sha256(object_id_.encode("utf-8")).hexdigest() + ".json")
+
+
+class DynamoDbStore(object):
+    """
+    Keeps states in a DynamoDB table with the "id" string partition key,
+    shared by all execution environments. Items carry the "expiresAt" epoch
+    seconds attribute, which may be configured as TTL of the table.
+    """
+
+    def __init__(self, table_name, ttl_seconds, client=None):
+        self._table_name = table_name
+        self._ttl_seconds = ttl_seconds
+        self._client = client
+        # objects of an event are started from several threads, creating a client is not thread safe
+        self._client_lock = threading.Lock()
+
+    def get(self, object_id_):
+        item = self._get_client().get_item(TableName=self._table_name, Key={"id": {"S": object_id_}},
+                                           ConsistentRead=True).get("Item")
+        # expired items are deleted by DynamoDB with a delay
+        if item is None or int(item["expiresAt"]["N"]) < time.time():
+            return None
+        state = {"status": item["status"]["S"]}
+        if "lines" in item:
+            state["lines"] = int(item["lines"]["N"])
+        return state
+
+    def put(self, object_id_, state):
+        item = {"id": {"S": object_id_}, "status": {"S": state["status"]},
+                "expiresAt": {"N": str(int(time.time() + self._ttl_seconds))}}
+        if "lines" in state:
+            item["lines"] = {"N": str(state["lines"])}
+        self._get_client().put_item(TableName=self._table_name, Item=item)
+
+    def _get_client(self):
+        with self._client_lock:
+            if self._client is None:
+                self._client = boto3.client("dynamodb")
+            return self._client
+
+
+def create_processed_objects(store, ttl_seconds, partial_policy=SKIP):
+    """
+    Returns ProcessedObjects using the store given as "memory",
+    "file:<directory>" or "dynamodb:<table name>", or None if store is empty.
+    """
+    if not store:
+        return None
+    kind, _, argument = store.partition(":")
+    if kind == "memory":
+        return ProcessedObjects(MemoryStore(ttl_seconds), partial_policy)
+    if kind == "file" and argument:
+        return ProcessedObjects(FileStore(argument, ttl_seconds), partial_policy)
+    if kind == "dynamodb" and argument:
+        return ProcessedObjects(DynamoDbStore(argument, ttl_seconds), partial_policy)
+    raise ValueError(f"Unknown processed objects store {store}, expected memory, file:<directory> "
+                     f"or dynamodb:<table name>")
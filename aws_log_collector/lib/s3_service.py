@@ -12,16 +12,243 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
+import itertools
+import mmap
 import os
+import shutil
+import tempfile
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
-from smart_open import open
+import boto3
+import time
+from botocore.exceptions import ClientError, ConnectionClosedError, IncompleteReadError, ReadTimeoutError
+from botocore.response import StreamingBody
+from urllib3.exceptions import ProtocolError
+
+from aws_log_collector.logger import log
+
+GZIP_MAGIC = b"\x1f\x8b"
+# wbits of zlib.decompressobj expecting the gzip header and trailer
+GZIP_WBITS = 31
+
+READ_CHUNK_SIZE_BYTES = 1024 * 1024
+# limits the size of a decompressed chunk, log files compress very well
+MAX_DECOMPRESSED_CHUNK_SIZE_BYTES = 4 * 1024 * 1024
+# free space left in the download directory for others
+MIN_FREE_SPACE_BYTES = 64 * 1024 * 1024
+# errors of a response stream after which the rest of the object is requested again,
+# e.g. a connection reset, a read timeout or a response shorter than expected
+RESUMABLE_ERRORS = (ReadTimeoutError, ConnectionClosedError, IncompleteReadError, ProtocolError, ConnectionError)
 
 
 class S3Service:
+    # objects may be read from several threads, creating a client is not
+    # thread safe but using it is
+    _client = None
+    _client_lock = threading.Lock()
+
+    def __init__(self, client=None, chunk_size_bytes=READ_CHUNK_SIZE_BYTES, download_threshold_bytes=None,
+                 download_part_size_bytes=8 * 1024 * 1024, download_concurrency=8, download_directory=None,
+                 resume_attempts=3, resume_backoff_seconds=0.5):
+        self._s3_client = client
+        self._chunk_size_bytes = chunk_size_bytes
+        self._resume_attempts = resume_attempts
+        self._resume_backoff_seconds = resume_backoff_seconds
+        self._download_threshold_bytes = download_threshold_bytes
+        self._download_part_size_bytes = download_part_size_bytes
+        self._download_concurrency = download_concurrency
+        self._download_directory = download_directory or tempfile.gettempdir()
+
+    @classmethod
+    def client(cls):
+        with cls._client_lock:
+            if cls._client is None:
+                cls._client = boto3.client("s3")
+            return cls._client
+
+    def read_lines(self, bucket, key, size=None):
+        """
+        Yields lines of the object without line terminators, just like parsers
+        expect them. Gzip compressed objects are decompressed.
+
+        Objects of known size above the download threshold are downloaded in
+        parts, in parallel, to a temporary file and read from memory mapped file.
+        Other objects are streamed. Either way, a response stream which fails
+        is resumed, see _read.
+        """
+        if self._should_download(size):
+            yield from split_lines(decompress(self._download(bucket, key, size)))
+            return
+
+        yield from split_lines(decompress(self._read(bucket, key)))
+
+    def _read(self, bucket, key, start=0, end=None):
+        """
+        Yields chunks of bytes of the object from start to end (inclusive, or
+        to the end of the object). When the response stream fails, the rest is
+        requested again with a Range from the offset reached, at most
+        resume_attempts times. The rest has to come from the same version of
+        the object (If-Match), so (compressed) bytes are never mixed up.
+        """
+        client = self._get_client()
+        offset = start
+        etag = None
+        attempts = 0
+        while True:
+            arguments = {"Bucket": bucket, "Key": key}
+            if offset > 0 or end is not None:
+                arguments["Range"] = f"bytes={offset}-{'' if end is None else end}"
+            if etag is not None:
+                arguments["IfMatch"] = etag
+            body = None
+            try:
+                response = client.get_object(**arguments)
+                etag = etag or response.get("ETag")
+                body = response["Body"]
+                for chunk in body.iter_chunks(self._chunk_size_bytes):
+                    offset += len(chunk)
+                    yield chunk
+                if end is not None and offset != end + 1:
+                    raise IncompleteReadError(actual_bytes=offset - start, expected_bytes=end - start + 1)
+                return
+            except RESUMABLE_ERRORS as ex:
+                if attempts >= self._resume_attempts:
+                    raise
+                attempts += 1
+                log.warning(f"Reading s3://{bucket}/{key} failed after {offset} bytes, resuming "
+                            f"(attempt {attempts} of {self._resume_attempts}): {ex!r}")
+                time.sleep(self._resume_backoff_seconds * 2 ** (attempts - 1))
+            finally:
+                if body is not None:
+                    body.close()
+
+    def _get_client(self):
+        return self._s3_client or S3Service.client()
+
+    def _should_download(self, size):
+        if self._download_threshold_bytes is None or size is None or size <= self._download_threshold_bytes:
+            return False
+        free_bytes = shutil.disk_usage(self._download_directory).free
+        if free_bytes < size + MIN_FREE_SPACE_BYTES:
+            log.info(f"Not enough space to download the object ({size} bytes) to {self._download_directory} "
+                     f"({free_bytes} bytes free), streaming it instead")
+            return False
+        return True
+
+    def _download(self, bucket, key, size):
+        with tempfile.TemporaryFile(dir=self._download_directory) as file:
+            file.truncate(size)
+
+            def download_part(start):
+                end = min(start + self._download_part_size_bytes, size) - 1
+                offset = start
+                for chunk in self._read(bucket, key, start, end):
+                    os.pwrite(file.fileno(), chunk, offset)
+                    offset += len(chunk)
+
+            with ThreadPoolExecutor(max_workers=self._download_concurrency) as executor:
+                # raises the exception of a failed part, if any
+                list(executor.map(download_part, range(0, size, self._download_part_size_bytes)))
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, size, self._chunk_size_bytes):
+                    yield mapped[start:start + self._chunk_size_bytes]
+
+
+def decompress(chunks):
+    """
+    Yields chunks of data, decompressed if the data starts with the gzip magic
+    number. Files made of several gzip members are supported. Raises EOFError
+    when the data ends in the middle of a gzip member.
+    """
+    chunks = iter(chunks)
+    first_chunk = b""
+    for chunk in chunks:
+        first_chunk += chunk
+        if len(first_chunk) >= len(GZIP_MAGIC):
+            break
+    if not first_chunk.startswith(GZIP_MAGIC):
+        yield first_chunk
+        yield from chunks
+        return
+
+    decompressor = zlib.decompressobj(wbits=GZIP_WBITS)
+    # whether the current gzip member was started but has not ended yet
+    in_member = False
+    for chunk in itertools.chain([first_chunk], chunks):
+        while chunk:
+            in_member = True
+            yield decompressor.decompress(chunk, MAX_DECOMPRESSED_CHUNK_SIZE_BYTES)
+            if decompressor.eof:
+                # the next gzip member, if any
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(wbits=GZIP_WBITS)
+                in_member = False
+            else:
+                chunk = decompressor.unconsumed_tail
+    yield decompressor.flush()
+    if in_member:
+        raise EOFError("Compressed data ended before the end of the last gzip member")
+
+
+def split_lines(chunks, encoding="utf-8"):
+    """
+    Splits chunks of bytes into lines without "\\n" (or "\\r\\n") terminators.
+    Bytes are split at the last "\\n" of a chunk, which never is a part of
+    a multi-byte character, so whole blocks of lines are decoded at once.
+    """
+    pending = b""
+    for chunk in chunks:
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            pending += chunk
+            continue
+
+        block = pending + chunk[:end] if pending else memoryview(chunk)[:end]
+        pending = chunk[end:]
+        text = str(block, encoding)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n")
+        lines = text.split("\n")
+        # the block ends with "\n", so the last item is always empty
+        lines.pop()
+        yield from lines
+
+    if pending:
+        yield str(pending, encoding)
+
+
+class LocalS3Client(object):
+    """
+    Stand-in of the S3 client reading objects from a local directory, where
+    the object key of a bucket is a path relative to root_directory/bucket.
+    """
+
+    def __init__(self, root_directory):
+        self._root_directory = root_directory
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        path = os.path.join(self._root_directory, Bucket, Key)
+        stat = os.stat(path)
+        size = stat.st_size
+        # changes whenever the file is written
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        if IfMatch is not None and IfMatch != etag:
+            raise ClientError({"Error": {"Code": "PreconditionFailed", "Message": "At least one of the pre-conditions "
+                                                                                  "you specified did not hold"}},
+                              "GetObject")
+        if Range is None:
+            return {"Body": StreamingBody(open(path, "rb"), size), "ContentLength": size, "ETag": etag,
+                    "ResponseMetadata": {"RetryAttempts": 0}}
+
+        first, last = Range[len("bytes="):].split("-")
+        start, end = (int(first), min(int(last or size - 1), size - 1)) if first else (size - int(last), size - 1)
+        with open(path, "rb") as file:
+            file.seek(start)
+            data = file.read(end - start + 1)
+        return {"Body": StreamingBody(io.BytesIO(data), len(data)), "ContentLength": len(data), "ETag": etag,
+                "ContentRange": f"bytes {start}-{end}/{size}", "ResponseMetadata": {"RetryAttempts": 0}}
 
-    @staticmethod
-    def read_lines(bucket, key):
-        path = os.path.join(bucket, key)
-        with open(f"s3://{path}", "r") as s3file:
-            for line in s3file:
-                yield line
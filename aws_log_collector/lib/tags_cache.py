@@ -12,9 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import boto3
 from botocore.config import Config
 import time
+from aws_log_collector.lib.frozen_dict import FrozenDict
+from aws_log_collector.lib.lru_cache import LruCache
 from aws_log_collector.logger import log
 
 SUPPORTED_NAMESPACES = ["lambda", "rds", "eks", "apigateway", "s3", "elasticloadbalancing",
@@ -28,6 +35,18 @@ SUPPORTED_NAMESPACES = ["lambda", "rds", "eks", "apigateway", "s3", "elasticload
 # find any official confirmation that observations coming from tests are valid
 SUPPORTED_GLOBAL_NAMESPACES = ["cloudfront"]
 
+# rough per entry overhead of the LRU bookkeeping (ordered dict node, entry tuple
+# and the reference to a tag set shared with other resources, which is sized once)
+CACHE_ENTRY_OVERHEAD_BYTES = 128
+
+# matches the ARN up to and including the resource type, e.g. the prefix of
+# arn:aws:elasticloadbalancing:us-east-2:840385940912:loadbalancer/app/my-lb/50dc6c495c0c9188
+# is arn:aws:elasticloadbalancing:us-east-2:840385940912:loadbalancer
+# (resource type is empty if there is no separator, e.g. arn:aws:s3:::my-bucket)
+ARN_RESOURCE_TYPE_PREFIX_REGEX = re.compile(r"(arn:[^:]*:[^:]*:[^:]*:[^:]*:)([^/:]*)([/:])?", re.IGNORECASE)
+
+_MISSING = object()
+
 
 class TagsCache(object):
     session = boto3.session.Session()
@@ -43,51 +62,240 @@ class TagsCache(object):
         global_resource_tagging_client = boto3.client("resourcegroupstaggingapi",
                                                       config=Config(region_name="us-east-1"))
 
-    def __init__(self, cache_ttl_seconds):
-        self.tags_by_arn = {}
-        self.cache_ttl_seconds = cache_ttl_seconds
-        self.last_fetch_time = 0
+    def __init__(self, cache_ttl_seconds, negative_cache_ttl_seconds=60, max_size_bytes=64 * 1024 * 1024,
+                 namespace_ttl_seconds=None, miss_rate_refresh_threshold=0.5, miss_rate_min_lookups=100,
+                 miss_rate_min_refresh_interval_seconds=5 * 60, tagging_clients=None,
+                 negative_cache_max_entries=10000):
+        namespace_ttl_seconds = namespace_ttl_seconds or {}
+        self.tagging_clients = tagging_clients or TagsCache._own_account_tagging_clients
+        self.tags_by_arn = LruCache(max_size_bytes, sizeof=TagsCache._size_of_entry,
+                                    shared_sizeof=TagsCache._size_of_tag_set)
+        # resources without tags are kept apart, so that they never evict tags of other resources
+        self.untagged_arns = LruCache(negative_cache_max_entries)
+        self.negative_cache_ttl_seconds = negative_cache_ttl_seconds
+        self.namespaces = {namespace: NamespaceTags(namespace, namespace_ttl_seconds.get(namespace, cache_ttl_seconds))
+                           for namespace in SUPPORTED_NAMESPACES}
+        self.miss_rate_refresh_threshold = miss_rate_refresh_threshold
+        self.miss_rate_min_lookups = miss_rate_min_lookups
+        self.miss_rate_min_refresh_interval_seconds = miss_rate_min_refresh_interval_seconds
+        self.negative_hits = 0
+        self.lookups_skipped = 0
+        # changes whenever tags are refreshed, so that metadata derived from tags can be invalidated
+        self.generation = 0
+        self._reported_stats = (0, 0, 0, 0, 0)
+        # lookups may come from several threads, a namespace is refreshed by one of them
+        self._lock = threading.RLock()
 
     def get(self, resource_arn, sfx_metrics):
-        if self._is_expired():
-            self._refresh(sfx_metrics)
+        prefix = self._resource_type_prefix(resource_arn)
+        namespace = self.namespaces.get(prefix.split(":")[2].lower()) if prefix is not None else None
+        if namespace is None:
+            with self._lock:
+                self.lookups_skipped += 1
+            return None
+
+        if self._needs_refresh(namespace):
+            # tags are fetched without holding the cache lock, so that lookups
+            # of other namespaces go on, lookups of this one wait for its tags
+            with namespace.refresh_lock:
+                if self._needs_refresh(namespace):
+                    self._refresh(namespace, sfx_metrics)
+
+        with self._lock:
+            return self._get(prefix, namespace, resource_arn)
+
+    def _get(self, prefix, namespace, resource_arn):
+        if prefix.lower() not in namespace.resource_type_prefixes:
+            # e.g. S3 object ARNs, the cache can not have tags for those
+            self.lookups_skipped += 1
+            return None
+
+        namespace.lookups += 1
+        arn = resource_arn.lower()
+        tags = self.tags_by_arn.get(arn, _MISSING)
+        if tags is not _MISSING:
+            return tags
+        if self.untagged_arns.get(arn, _MISSING) is _MISSING:
+            # remember that the resource has no tags, so that it is cheap to ask again,
+            # only the first lookup counts as a miss, a refresh would not find its tags
+            self.untagged_arns.put(arn, None, self.negative_cache_ttl_seconds)
+            namespace.misses += 1
+        else:
+            self.negative_hits += 1
+        return None
+
+    def may_have_tags(self, resource_arn):
+        """
+        Tells without a lookup (or a refresh) whether the cache may hold tags
+        of the resource, i.e. it belongs to a supported namespace whose tags
+        were not fetched yet, or its resource type was among the fetched ones.
+        """
+        prefix = self._resource_type_prefix(resource_arn)
+        namespace = self.namespaces.get(prefix.split(":")[2].lower()) if prefix is not None else None
+        if namespace is None:
+            return False
+        return namespace.last_fetch_time == 0 or prefix.lower() in namespace.resource_type_prefixes
 
-        return self.tags_by_arn.get(resource_arn.lower(), None)
+    def send_metrics(self, sfx_metrics):
+        counters, gauges = self.collect_metrics()
+        sfx_metrics.counters(*counters)
+        sfx_metrics.gauges(*gauges)
 
-    def _is_expired(self):
-        return time.time() > self.last_fetch_time + self.cache_ttl_seconds
+    def collect_metrics(self):
+        """
+        Returns counters (changes since the previous call) and gauges describing the cache.
+        """
+        stats = (self.tags_by_arn.hits, self.negative_hits, self.untagged_arns.misses,
+                 self.tags_by_arn.evictions, self.lookups_skipped)
+        hits, negative_hits, misses, evictions, lookups_skipped = [current - reported for current, reported
+                                                                   in zip(stats, self._reported_stats)]
+        self._reported_stats = stats
+        counters = [
+            ("sf.org.awsLogCollector.num.tagCacheHits", hits),
+            ("sf.org.awsLogCollector.num.tagCacheNegativeHits", negative_hits),
+            ("sf.org.awsLogCollector.num.tagCacheMisses", misses),
+            ("sf.org.awsLogCollector.num.tagCacheEvictions", evictions),
+            ("sf.org.awsLogCollector.num.tagCacheLookupsSkipped", lookups_skipped)
+        ]
+        gauges = [
+            ("sf.org.awsLogCollector.tagCacheSizeBytes", self.tags_by_arn.size),
+            ("sf.org.awsLogCollector.tagCacheEntries", len(self.tags_by_arn)),
+            ("sf.org.awsLogCollector.tagCacheNegativeEntries", len(self.untagged_arns))
+        ]
+        return counters, gauges
 
-    def _refresh(self, sfx_metrics):
-        self.last_fetch_time = time.time()
-        self.tags_by_arn = self._build_cache()
+    def _needs_refresh(self, namespace):
+        return namespace.is_expired() or self._misses_too_often(namespace)
+
+    def _misses_too_often(self, namespace):
+        return namespace.lookups >= self.miss_rate_min_lookups \
+               and namespace.misses >= namespace.lookups * self.miss_rate_refresh_threshold \
+               and time.time() > namespace.last_fetch_time + self.miss_rate_min_refresh_interval_seconds
+
+    def _refresh(self, namespace, sfx_metrics):
+        if not namespace.is_expired():
+            log.info(f"Refreshing tags of the {namespace.name} namespace early "
+                     f"({namespace.misses} out of {namespace.lookups} lookups missed)")
+            sfx_metrics.inc_counter("sf.org.awsLogCollector.num.tagCacheMissRateRefresh")
+
+        fetch_time = time.time()
+        tags_by_arn_cache = self.fetch(namespace)
+        self.store(namespace, tags_by_arn_cache, fetch_time)
         sfx_metrics.inc_counter("sf.org.awsLogCollector.num.tagCacheRefresh")
 
-    def _build_cache(self):
+    def refresh_if_expired(self, namespace):
+        """
+        Refreshes tags of the expired namespace, unless another thread did so
+        while this one was waiting for the refresh lock of the namespace.
+        Returns whether the namespace was refreshed.
+        """
+        with namespace.refresh_lock:
+            if not namespace.is_expired():
+                return False
+            fetch_time = time.time()
+            self.store(namespace, self.fetch(namespace), fetch_time)
+            return True
+
+    def fetch(self, namespace):
+        """
+        Fetches tags of the namespace, note it does not modify the cache so it
+        is safe to fetch tags of several namespaces at once.
+        """
+        return self._build_cache(namespace.name)
+
+    def store(self, namespace, tags_by_arn_cache, fetch_time=None):
+        """
+        Stores fetched tags of the namespace, which counts as fetched (at
+        fetch_time, now by default) only then, so that lookups made while the
+        tags are being fetched still see the namespace as expired.
+        """
+        with self._lock:
+            resource_type_prefixes = set()
+            for arn, tags in tags_by_arn_cache.items():
+                self.tags_by_arn.put(arn, tags, namespace.ttl_seconds)
+                resource_type_prefixes.add(self._resource_type_prefix(arn))
+            namespace.resource_type_prefixes = resource_type_prefixes
+            namespace.last_fetch_time = fetch_time if fetch_time is not None else time.time()
+            namespace.lookups = 0
+            namespace.misses = 0
+            self.generation += 1
+
+    def prewarm(self, namespace_names, timeout_seconds):
+        """
+        Fetches tags of the namespaces in parallel, e.g. while the function is
+        initialized. Fetches hold refresh locks of the namespaces, so lookups
+        wait for those still running after timeout_seconds rather than fetch
+        the tags again. Returns the number of namespaces fetched in time.
+        """
+        namespaces = [self.namespaces[name] for name in namespace_names if name in self.namespaces]
+        if not namespaces:
+            return 0
+        executor = ThreadPoolExecutor(max_workers=len(namespaces))
+        futures = {executor.submit(self.refresh_if_expired, namespace): namespace for namespace in namespaces}
+        done, not_done = wait(futures, timeout=timeout_seconds)
+        # fetches still running are left to complete, those not started yet to lookups
+        executor.shutdown(wait=False, cancel_futures=True)
+        if not_done:
+            log.info(f"Tags of {', '.join(futures[future].name for future in not_done)} namespace(s) "
+                     f"were not fetched within {timeout_seconds:.1f}s")
+        return sum(1 for future in done if future.result())
+
+    def _build_cache(self, namespace):
         tags_by_arn_cache = {}
+        tag_sets = TagSets()
 
-        TagsCache._load_tags(self.resource_tagging_client, SUPPORTED_NAMESPACES, tags_by_arn_cache)
-        if self.global_region_available:
-            TagsCache._load_tags(self.global_resource_tagging_client,
-                                 SUPPORTED_GLOBAL_NAMESPACES, tags_by_arn_cache)
+        try:
+            resource_tagging_client, global_resource_tagging_client = self.tagging_clients()
+        except Exception as ex:
+            log.exception(f"Encountered an Exception when trying to create tagging clients (exception={ex})")
+            return tags_by_arn_cache
+
+        TagsCache._load_tags(resource_tagging_client, [namespace], tags_by_arn_cache, tag_sets)
+        if global_resource_tagging_client is not None and namespace in SUPPORTED_GLOBAL_NAMESPACES:
+            TagsCache._load_tags(global_resource_tagging_client, [namespace], tags_by_arn_cache, tag_sets)
 
         return tags_by_arn_cache
 
+    @classmethod
+    def _own_account_tagging_clients(cls):
+        if cls.global_region_available:
+            return cls.resource_tagging_client, cls.global_resource_tagging_client
+        return cls.resource_tagging_client, None
+
     @staticmethod
-    def _load_tags(resource_tagging_client, supported_namespaces, tags_by_arn_cache):
+    def _resource_type_prefix(arn):
+        match = ARN_RESOURCE_TYPE_PREFIX_REGEX.match(arn)
+        if match is None:
+            return None
+        prefix, resource_type, separator = match.groups()
+        return prefix + resource_type if separator else prefix
+
+    @staticmethod
+    def _size_of_entry(arn, tags):
+        # tag sets are interned and shared by many resources, so they are sized
+        # by _size_of_tag_set once per tag set rather than per entry
+        return CACHE_ENTRY_OVERHEAD_BYTES + sys.getsizeof(arn)
+
+    @staticmethod
+    def _size_of_tag_set(tags):
+        return sys.getsizeof(tags) + sum(sys.getsizeof(name) + sys.getsizeof(value) for name, value in tags.items())
+
+    @staticmethod
+    def _load_tags(resource_tagging_client, supported_namespaces, tags_by_arn_cache, tag_sets):
         get_resources_paginator = resource_tagging_client.get_paginator("get_resources")
 
         try:
             for page in get_resources_paginator.paginate(
                     ResourceTypeFilters=supported_namespaces, ResourcesPerPage=100
             ):
-                page_tags_by_arn = TagsCache._parse_get_resources_response_for_tags_by_arn(page)
+                page_tags_by_arn = TagsCache._parse_get_resources_response_for_tags_by_arn(page, tag_sets)
                 tags_by_arn_cache.update(page_tags_by_arn)
         except Exception as ex:
             log.exception(f"Encountered an Exception when trying to fetch tags (exception={ex})")
 
 
     @staticmethod
-    def _parse_get_resources_response_for_tags_by_arn(resources_page):
+    def _parse_get_resources_response_for_tags_by_arn(resources_page, tag_sets):
         tags_by_arn = {}
 
         aws_resource_list = resources_page["ResourceTagMappingList"]
@@ -95,9 +303,48 @@ class TagsCache(object):
             arn = aws_resource["ResourceARN"].lower()
             log.debug(f"loading tags for {arn}")
             aws_tags = aws_resource["Tags"]
-            tags = tags_by_arn.get(arn, {})
+            tags = dict(tags_by_arn.get(arn, {}))
             for raw_tag in aws_tags:
                 tags[raw_tag["Key"]] = raw_tag.get("Value", "null")
-            tags_by_arn[arn] = tags
+            tags_by_arn[arn] = tag_sets.intern(tags)
 
         return tags_by_arn
+
+
+class NamespaceTags(object):
+    """
+    Refresh state of tags of a single namespace, namespaces are refreshed independently.
+    """
+
+    def __init__(self, name, ttl_seconds):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.last_fetch_time = 0
+        self.resource_type_prefixes = set()
+        self.lookups = 0
+        self.misses = 0
+        self.refresh_lock = threading.Lock()
+
+    def is_expired(self):
+        return time.time() > self.last_fetch_time + self.ttl_seconds
+
+
+class TagSets(object):
+    """
+    Interns tag sets, so that all resources with identical tags share a single
+    immutable mapping. Tag keys and values are interned as well.
+    """
+
+    def __init__(self):
+        self._tag_sets = {}
+
+    def intern(self, tags):
+        key = frozenset(tags.items())
+        tag_set = self._tag_sets.get(key)
+        if tag_set is None:
+            tag_set = FrozenDict((sys.intern(name), sys.intern(value)) for name, value in tags.items())
+            self._tag_sets[key] = tag_set
+        return tag_set
+
+    def __len__(self):
+        return len(self._tag_sets)
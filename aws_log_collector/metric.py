@@ -12,7 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
+import copy
+import threading
 
 import signalfx
 import time
@@ -22,10 +23,6 @@ def size_of_str(string):
     return len(bytes(string, "utf-8"))
 
 
-def size_of_json(obj):
-    return size_of_str(json.dumps(obj))
-
-
 def _current_time():
     return int(round(time.time() * 1000))
 
@@ -50,11 +47,62 @@ class SfxMetrics(object):
                             metric_name_values))
         self._sfx_metrics.send(counters=counters)
 
+    def gauges(self, *metric_name_values):
+        gauges = list(map(lambda metric_name_value: self.counter(metric_name_value[0], metric_name_value[1]),
+                          metric_name_values))
+        self._sfx_metrics.send(gauges=gauges)
+
     def namespace(self, namespace):
         self._namespace = namespace
 
+    def current_namespace(self):
+        return self._namespace
+
+    def scoped(self):
+        """
+        Returns metrics sent through the same client, but with a namespace of their own,
+        e.g. for a single S3 object processed along with others.
+        """
+        return copy.copy(self)
+
     def counter(self, metric_name, metric_value):
         return {'metric': metric_name,
                 'value': metric_value,
                 'dimensions': {'namespace': self._namespace},
                 'timestamp': _current_time()}
+
+
+class CountingMetrics(object):
+    """
+    Metrics summed up in memory instead of being sent, e.g. by the backfill
+    command which reports progress of its own. Counters of all namespaces
+    are summed together, gauges keep their maximum.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._namespace = "unknown"
+        self._lock = threading.Lock()
+
+    def inc_counter(self, metric_name):
+        self.counters((metric_name, 1))
+
+    def counters(self, *metric_name_values):
+        with self._lock:
+            for metric_name, metric_value in metric_name_values:
+                self.totals[metric_name] = self.totals.get(metric_name, 0) + metric_value
+
+    def gauges(self, *metric_name_values):
+        with self._lock:
+            for metric_name, metric_value in metric_name_values:
+                self.totals[metric_name] = max(self.totals.get(metric_name, metric_value), metric_value)
+
+    def namespace(self, namespace):
+        self._namespace = namespace
+
+    def current_namespace(self):
+        return self._namespace
+
+    def scoped(self):
+        # totals are shared
+        return copy.copy(self)
@@ -87,6 +87,14 @@ class Parser(ABC):
     def validate_line(self, line) -> bool:
         return True
 
+    def prewarm(self):
+        """
+        Does work parsing of the first log line would do otherwise, e.g.
+        compiling patterns of timestamps, while the function is initialized.
+        Parses an ISO 8601 timestamp by default, as most log formats use those.
+        """
+        self._iso_time_to_hec_time("2020-12-07T20:01:55.177Z")
+
     def _iso_time_to_hec_time(self, timestamp):
         try:
             dt = dateutil.parser.isoparse(timestamp)
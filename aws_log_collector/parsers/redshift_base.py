@@ -44,6 +44,9 @@ class RedshiftBaseParser(Parser, ABC):
             "logType": match.group(LOG_TYPE_REGEX_GROUP_INDEX)
         }
 
+    def prewarm(self):
+        self._redshift_time_to_hec_time("Mon, 7 Dec 2020 20:01:55:177")
+
     @staticmethod
     def _is_redshift_log(log_file_name, log_type):
         match = OBJECT_KEY_REGEX.search(log_file_name)
@@ -1,6 +1,6 @@
 import re
 
-from aws_log_collector.parsers.parser import ParsedLine
+from aws_log_collector.parsers.parser import ParsedLine, Parser
 from aws_log_collector.parsers.redshift_base import RedshiftBaseParser
 
 FIELD_NAMES = ("userid", "username", "oldusername", "action",
@@ -32,6 +32,10 @@ class RedshiftUserActivityLogParser(RedshiftBaseParser):
         if complete_line is not None:
             yield complete_line
 
+    def prewarm(self):
+        # unlike other Redshift logs, this one has ISO 8601 timestamps
+        Parser.prewarm(self)
+
     def parse(self, metadata, line):
         hec_time = self._iso_time_to_hec_time(line[TIMESTAMP_START:TIMESTAMP_END])
         arns = [("clusterArn", metadata["clusterArn"])]
@@ -0,0 +1,25 @@
+from typing import List
+
+from aws_log_collector.parsers.alb import ApplicationELBParser
+from aws_log_collector.parsers.cloudfront import CloudFrontParser
+from aws_log_collector.parsers.nlb import NetworkELBParser
+from aws_log_collector.parsers.parser import Parser
+from aws_log_collector.parsers.redshift_connectionlog import RedshiftConnectionLogParser
+from aws_log_collector.parsers.redshift_useractivity import RedshiftUserActivityLogParser
+from aws_log_collector.parsers.redshift_userlog import RedshiftUserLogParser
+from aws_log_collector.parsers.s3 import S3Parser
+
+# parsers of S3 log files, the first one supporting a file parses it
+PARSER_CLASSES = [
+    S3Parser,
+    ApplicationELBParser,
+    NetworkELBParser,
+    CloudFrontParser,
+    RedshiftUserLogParser,
+    RedshiftUserActivityLogParser,
+    RedshiftConnectionLogParser
+]
+
+
+def create_parsers() -> List[Parser]:
+    return [parser_class() for parser_class in PARSER_CLASSES]
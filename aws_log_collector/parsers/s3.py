@@ -81,6 +81,9 @@ class S3Parser(Parser):
         arns = self._get_arns(fields)
         return ParsedLine(hec_time, fields, arns)
 
+    def prewarm(self):
+        self._to_hec_time("[06/Feb/2019:00:00:38 +0000]")
+
     @staticmethod
     def _fix_time_field(record):
         """
@@ -0,0 +1,74 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares json.dumps of every HEC item with HecSerializer using each installed
+JSON encoder on CloudWatch like items sharing the same metadata.
+
+    python3 -m benchmarks.hec_serializer
+"""
+
+import json
+import timeit
+
+from aws_log_collector.lib.frozen_dict import FrozenDict
+from aws_log_collector.lib.hec_serializer import HecSerializer
+from aws_log_collector.lib.json_encoder import available_encoders
+
+ITEMS = 10000
+REPEAT = 5
+
+
+def _hec_items():
+    fields = FrozenDict({
+        "logGroup": "/aws/lambda/my-function",
+        "logStream": "2020/07/21/[$LATEST]4be9a2e0f4a44a1d8bc3e3fcd7d0d3a4",
+        "logForwarder": "splunk_aws_log_forwarder:1.0.1",
+        "region": "us-east-1",
+        "awsAccountId": "134183635603",
+        "arn": "arn:aws:lambda:us-east-1:134183635603:function:my-function",
+        "functionName": "my-function",
+        **{f"tag-{i}": f"value-{i}" for i in range(20)}
+    })
+    return [{"event": f"START RequestId: 408713b5-d893-464b-9207-a1f8d9b60e6d Version: $LATEST {i}\n",
+             "fields": fields,
+             "host": fields["arn"],
+             "source": "lambda",
+             "sourcetype": "aws:lambda",
+             "time": f"1595335478.{i % 1000:03d}"} for i in range(ITEMS)]
+
+
+def main():
+    items = _hec_items()
+
+    def with_json_dumps():
+        return [json.dumps(item) for item in items]
+
+    baseline = min(timeit.repeat(with_json_dumps, number=1, repeat=REPEAT))
+    print(f"{ITEMS} items: json.dumps {baseline * 1000:.1f} ms")
+
+    for encoder_type in available_encoders():
+        def with_hec_serializer():
+            serializer = HecSerializer(encoder=encoder_type())
+            return [serializer.dumps(item) for item in items]
+
+        encoder = encoder_type()
+        assert with_hec_serializer() == [encoder.dumps(item) for item in items]
+        templated = min(timeit.repeat(with_hec_serializer, number=1, repeat=REPEAT))
+        print(f"{ITEMS} items: HecSerializer with {encoder_type.name} {templated * 1000:.1f} ms, "
+              f"speedup {baseline / templated:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
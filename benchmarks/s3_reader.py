@@ -0,0 +1,75 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares throughput of S3Service.read_lines with text mode line iteration of
+smart_open (the previous implementation, from requirements-dev.txt) on a
+gzip compressed ALB-like log file. Both read the file from a local directory
+through the same stand-in of the S3 client, so network transfer is not included.
+
+    python3 -m benchmarks.s3_reader
+"""
+
+import gzip
+import os
+import tempfile
+import time
+
+from smart_open import open as smart_open
+
+from aws_log_collector.lib.s3_service import S3Service, LocalS3Client
+
+BUCKET = "bucket"
+KEY = "AWSLogs/elasticloadbalancing/app.log.gz"
+LINES = 200000
+LINE = 'https 2018-07-02T22:23:00.186641Z app/my-loadbalancer/50dc6c495c0c9188 192.168.131.39:2817 ' \
+       '10.0.0.1:80 0.086 0.048 0.037 200 200 0 57 "GET https://www.example.com:443/ HTTP/1.1" ' \
+       '"curl/7.46.0" ECDHE-RSA-AES128-GCM-SHA256 TLSv1.2 ' \
+       'arn:aws:elasticloadbalancing:us-east-2:123456789012:targetgroup/my-targets/73e2d6bc24d8a067 ' \
+       '"Root=1-58337281-1d84f3d73c47ec4e58577259" "www.example.com" "arn:aws:acm:us-east-2:123456789012:' \
+       'certificate/12345678-1234-1234-1234-123456789012" 1 2018-07-02T22:22:48.364000Z "authenticate,forward" ' \
+       '"-" "-" "10.0.0.1:80" "200" "-" "-" {}\n'
+
+
+def _measure(name, read_lines, uncompressed_bytes):
+    start = time.perf_counter()
+    lines = sum(1 for _ in read_lines())
+    elapsed_seconds = time.perf_counter() - start
+    print(f"{name}: {lines} lines in {elapsed_seconds * 1000:.0f} ms, "
+          f"{uncompressed_bytes / elapsed_seconds / 1024 / 1024:.0f} MiB/s")
+    return elapsed_seconds
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, BUCKET, KEY)
+        os.makedirs(os.path.dirname(path))
+        data = "".join(LINE.format(i) for i in range(LINES)).encode("utf-8")
+        with open(path, "wb") as file:
+            file.write(gzip.compress(data))
+
+        def smart_open_lines():
+            with smart_open(f"s3://{BUCKET}/{KEY}", "r", transport_params={"client": client}) as file:
+                for line in file:
+                    yield line
+
+        client = LocalS3Client(directory)
+        s3_service = S3Service(client)
+        baseline = _measure("smart_open", smart_open_lines, len(data))
+        streamed = _measure("S3Service", lambda: s3_service.read_lines(BUCKET, KEY), len(data))
+        print(f"speedup {baseline / streamed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,21 +16,27 @@ import json
 import logging
 import os
 
+import boto3
+
 from aws_log_collector.cleaners.regex import RegexMessageCleaner
 from aws_log_collector.converters.cloudwatch import CloudWatchLogsConverter
+from aws_log_collector.converters.kinesis import KinesisLogsConverter
 from aws_log_collector.converters.s3 import S3LogsConverter
-from aws_log_collector.enrichers.cloudwatch import CloudWatchLogsEnricher
+from aws_log_collector.converters.sqs import SqsS3LogsConverter
+from aws_log_collector.enrichers.cloudwatch import CloudWatchLogsEnricher, LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING
+from aws_log_collector.enrichers.log_group_router import LogGroupRouter
 from aws_log_collector.enrichers.s3 import S3LogsEnricher
-from aws_log_collector.lib.client import BatchClient
+from aws_log_collector.enrichers.tag_dimensions import TagDimensions
+from aws_log_collector.lib.client import BatchClient, SessionPool
+from aws_log_collector.lib.continuation import Continuations, LambdaInvoker
+from aws_log_collector.lib.hec_serializer import HecSerializer
+from aws_log_collector.lib.json_encoder import create_json_encoder
+from aws_log_collector.lib.multi_account_tags_cache import MultiAccountTagsCache, AssumedRoleTaggingClients
+from aws_log_collector.lib.prewarm import Prewarm
+from aws_log_collector.lib.processed_objects import create_processed_objects
 from aws_log_collector.lib.s3_service import S3Service
 from aws_log_collector.lib.tags_cache import TagsCache
-from aws_log_collector.parsers.alb import ApplicationELBParser
-from aws_log_collector.parsers.cloudfront import CloudFrontParser
-from aws_log_collector.parsers.nlb import NetworkELBParser
-from aws_log_collector.parsers.redshift_connectionlog import RedshiftConnectionLogParser
-from aws_log_collector.parsers.redshift_useractivity import RedshiftUserActivityLogParser
-from aws_log_collector.parsers.redshift_userlog import RedshiftUserLogParser
-from aws_log_collector.parsers.s3 import S3Parser
+from aws_log_collector.parsers.registry import create_parsers
 from aws_log_collector.logger import log
 from aws_log_collector.metric import SfxMetrics
 
@@ -40,32 +46,111 @@ SPLUNK_API_KEY = os.getenv("SPLUNK_API_KEY", default="<unknown-token>")
 MAX_REQUEST_SIZE_IN_BYTES = int(os.getenv("MAX_REQUEST_SIZE_IN_BYTES", default=2 * 1024 * 1024))
 COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", default=6))
 TAGS_CACHE_TTL_SECONDS = int(os.getenv("TAGS_CACHE_TTL_SECONDS", default=15 * 60))
+TAGS_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("TAGS_CACHE_NEGATIVE_TTL_SECONDS", default=60))
+TAGS_CACHE_NEGATIVE_MAX_ENTRIES = int(os.getenv("TAGS_CACHE_NEGATIVE_MAX_ENTRIES", default=10000))
+TAGS_CACHE_MAX_SIZE_BYTES = int(os.getenv("TAGS_CACHE_MAX_SIZE_BYTES", default=64 * 1024 * 1024))
+# e.g. "lambda=300,redshift=86400,cloudfront=86400", namespaces not listed use TAGS_CACHE_TTL_SECONDS
+TAGS_CACHE_NAMESPACE_TTL_SECONDS = os.getenv("TAGS_CACHE_NAMESPACE_TTL_SECONDS", default="")
+TAGS_CACHE_MISS_RATE_REFRESH_THRESHOLD = float(os.getenv("TAGS_CACHE_MISS_RATE_REFRESH_THRESHOLD", default=0.5))
+TAGS_CACHE_MISS_RATE_MIN_REFRESH_INTERVAL_SECONDS = int(
+    os.getenv("TAGS_CACHE_MISS_RATE_MIN_REFRESH_INTERVAL_SECONDS", default=5 * 60))
+# e.g. "111111111111=arn:aws:iam::111111111111:role/splunk-log-collector-tags", tags of resources
+# in listed accounts are fetched using the given role
+TAGS_CACHE_ACCOUNT_ROLES = os.getenv("TAGS_CACHE_ACCOUNT_ROLES", default="")
 REDACTION_RULE = os.getenv("REDACTION_RULE", default="")
 REDACTION_RULE_REPLACEMENT = os.getenv("REDACTION_RULE_REPLACEMENT", default="**REDACTED**")
 INCLUDE_LOG_FIELDS = os.getenv('INCLUDE_LOG_FIELDS', default='false').lower() == 'true'
+# e.g. "s3,ApplicationELB", log records of listed namespaces carry ARN fields only
+DEFERRED_ENRICHMENT_NAMESPACES = os.getenv("DEFERRED_ENRICHMENT_NAMESPACES", default="")
+TAG_DIMENSION_INTERVAL_SECONDS = int(os.getenv("TAG_DIMENSION_INTERVAL_SECONDS", default=15 * 60))
+CLOUDWATCH_METADATA_CACHE_SIZE = int(os.getenv("CLOUDWATCH_METADATA_CACHE_SIZE", default=1024))
+CLOUDWATCH_METADATA_CACHE_TTL_SECONDS = int(os.getenv("CLOUDWATCH_METADATA_CACHE_TTL_SECONDS", default=5 * 60))
+S3_METADATA_CACHE_SIZE = int(os.getenv("S3_METADATA_CACHE_SIZE", default=0))
+S3_METADATA_CACHE_TTL_SECONDS = int(os.getenv("S3_METADATA_CACHE_TTL_SECONDS", default=5 * 60))
+S3_MAX_PARALLEL_OBJECTS = int(os.getenv("S3_MAX_PARALLEL_OBJECTS", default=4))
+S3_PARSE_WORKERS = int(os.getenv("S3_PARSE_WORKERS", default=2))
+S3_PARSE_PROCESSES = int(os.getenv("S3_PARSE_PROCESSES", default=0))
+# chunks of lines of an S3 object waiting to be parsed, and parsed ones waiting to be sent
+S3_PARSE_QUEUE_SIZE = int(os.getenv("S3_PARSE_QUEUE_SIZE", default=2))
+# log entries of S3 objects read in parallel waiting to be sent
+S3_MERGE_QUEUE_SIZE = int(os.getenv("S3_MERGE_QUEUE_SIZE", default=1000))
+S3_PARSE_PROCESSES_THRESHOLD_BYTES = int(os.getenv("S3_PARSE_PROCESSES_THRESHOLD_BYTES", default=8 * 1024 * 1024))
+KINESIS_DECODE_WORKERS = int(os.getenv("KINESIS_DECODE_WORKERS", default=2))
+LOG_SENDERS = int(os.getenv("LOG_SENDERS", default=2))
+S3_DOWNLOAD_THRESHOLD_BYTES = int(os.getenv("S3_DOWNLOAD_THRESHOLD_BYTES", default=64 * 1024 * 1024))
+S3_DOWNLOAD_PART_SIZE_BYTES = int(os.getenv("S3_DOWNLOAD_PART_SIZE_BYTES", default=8 * 1024 * 1024))
+S3_DOWNLOAD_CONCURRENCY = int(os.getenv("S3_DOWNLOAD_CONCURRENCY", default=8))
+S3_READ_RESUME_ATTEMPTS = int(os.getenv("S3_READ_RESUME_ATTEMPTS", default=3))
+# S3 objects not processed this many seconds before the timeout are continued by another invocation, 0 disables it
+S3_CONTINUATION_MARGIN_SECONDS = int(os.getenv("S3_CONTINUATION_MARGIN_SECONDS", default=0))
+# "memory", "file:<directory>" or "dynamodb:<table name>", S3 objects forwarded already are skipped when notified again
+S3_PROCESSED_OBJECTS_STORE = os.getenv("S3_PROCESSED_OBJECTS_STORE", default="")
+S3_PROCESSED_OBJECTS_TTL_SECONDS = int(os.getenv("S3_PROCESSED_OBJECTS_TTL_SECONDS", default=7 * 24 * 60 * 60))
+# "skip", "resume" or "reprocess" objects notified again after the rest of them was continued by another invocation
+S3_PROCESSED_OBJECTS_PARTIAL_POLICY = os.getenv("S3_PROCESSED_OBJECTS_PARTIAL_POLICY", default="skip")
+# "json" sends the same bytes as json.dumps, "json-compact" and "orjson" (when installed) send compact UTF-8 JSON
+JSON_ENCODER = os.getenv("JSON_ENCODER", default="json")
+# e.g. '[{"prefix": "/ecs/", "namespace": "ecs", "arn": "arn:aws:ecs:{region}:{accountId}:service/{logGroupName}"}]'
+LOG_GROUP_ROUTING_RULES = os.getenv("LOG_GROUP_ROUTING_RULES", default="")
+# seconds the function may spend when initialized on connecting to SPLUNK_LOG_URL, fetching tags of
+# PREWARM_TAG_NAMESPACES and preparing parsers, 0 disables it
+PREWARM_TIME_BUDGET_SECONDS = float(os.getenv("PREWARM_TIME_BUDGET_SECONDS", default=0))
+# e.g. "lambda,s3"
+PREWARM_TAG_NAMESPACES = os.getenv("PREWARM_TAG_NAMESPACES", default="")
 
 
 class LogCollector:
     def __init__(self):
-        tags_cache = TagsCache(TAGS_CACHE_TTL_SECONDS)
-        s3_parsers = [
-            S3Parser(),
-            ApplicationELBParser(),
-            NetworkELBParser(),
-            CloudFrontParser(),
-            RedshiftUserLogParser(),
-            RedshiftUserActivityLogParser(),
-            RedshiftConnectionLogParser()
-        ]
+        tags_cache = self._create_tags_cache()
+        s3_parsers = create_parsers()
+        s3_logs_enricher = S3LogsEnricher(tags_cache, S3_METADATA_CACHE_SIZE, S3_METADATA_CACHE_TTL_SECONDS)
+        deferred_enrichment_namespaces = [namespace.strip() for namespace in DEFERRED_ENRICHMENT_NAMESPACES.split(",")
+                                          if namespace.strip()]
+        s3_service = S3Service(download_threshold_bytes=S3_DOWNLOAD_THRESHOLD_BYTES,
+                               download_part_size_bytes=S3_DOWNLOAD_PART_SIZE_BYTES,
+                               download_concurrency=S3_DOWNLOAD_CONCURRENCY,
+                               resume_attempts=S3_READ_RESUME_ATTEMPTS)
+        self._continuations = Continuations(LambdaInvoker(), S3_CONTINUATION_MARGIN_SECONDS)
+        self._processed_objects = create_processed_objects(S3_PROCESSED_OBJECTS_STORE,
+                                                           S3_PROCESSED_OBJECTS_TTL_SECONDS,
+                                                           S3_PROCESSED_OBJECTS_PARTIAL_POLICY)
+        log_group_router = LogGroupRouter.create(LOG_GROUP_ROUTING_RULES, LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING)
+        self._json_encoder = create_json_encoder(JSON_ENCODER)
+        s3_logs_converter = S3LogsConverter(s3_logs_enricher, s3_service, s3_parsers, INCLUDE_LOG_FIELDS,
+                                            deferred_enrichment_namespaces,
+                                            TagDimensions(s3_logs_enricher, TAG_DIMENSION_INTERVAL_SECONDS),
+                                            S3_MAX_PARALLEL_OBJECTS, S3_PARSE_WORKERS, self._continuations,
+                                            S3_PARSE_PROCESSES, S3_PARSE_PROCESSES_THRESHOLD_BYTES,
+                                            self._processed_objects, S3_PARSE_QUEUE_SIZE, S3_MERGE_QUEUE_SIZE)
+        cloudwatch_logs_converter = CloudWatchLogsConverter(
+            CloudWatchLogsEnricher(tags_cache, CLOUDWATCH_METADATA_CACHE_SIZE, CLOUDWATCH_METADATA_CACHE_TTL_SECONDS,
+                                   log_group_router))
         self._converters = [
-            CloudWatchLogsConverter(CloudWatchLogsEnricher(tags_cache)),
-            S3LogsConverter(S3LogsEnricher(tags_cache), S3Service(), s3_parsers, INCLUDE_LOG_FIELDS)
+            cloudwatch_logs_converter,
+            s3_logs_converter,
+            SqsS3LogsConverter(s3_logs_converter),
+            KinesisLogsConverter(cloudwatch_logs_converter, KINESIS_DECODE_WORKERS)
         ]
+        self._tags_cache = tags_cache
         self._cleaners = []
         if REDACTION_RULE != "":
             self._cleaners.append(RegexMessageCleaner(REDACTION_RULE, REDACTION_RULE_REPLACEMENT))
+        # connections opened by prewarm are kept for invocations
+        self._session_pool = SessionPool() if PREWARM_TIME_BUDGET_SECONDS > 0 else None
+        # last, processes of the S3 parse pool have to be forked before prewarm starts threads
+        self._prewarm = self._run_prewarm(s3_parsers) if PREWARM_TIME_BUDGET_SECONDS > 0 else None
+
+    def _run_prewarm(self, s3_parsers):
+        prewarm = Prewarm(PREWARM_TIME_BUDGET_SECONDS)
+        prewarm.run("parsers", lambda _: [parser.prewarm() for parser in s3_parsers])
+        prewarm.run("connection", lambda timeout_seconds: self._session_pool.connect(SPLUNK_LOG_URL, timeout_seconds))
+        tag_namespaces = [namespace.strip() for namespace in PREWARM_TAG_NAMESPACES.split(",") if namespace.strip()]
+        if tag_namespaces:
+            prewarm.run("tags", lambda timeout_seconds: self._tags_cache.prewarm(tag_namespaces, timeout_seconds))
+        return prewarm
 
     def forward_log(self, log_event, context):
+        response = None
         with SfxMetrics(SPLUNK_METRIC_URL, SPLUNK_API_KEY) as sfx_metrics:
             try:
                 if log.isEnabledFor(logging.DEBUG):
@@ -74,15 +159,32 @@ class LogCollector:
 
                 for converter in self._converters:
                     if converter.supports(log_event):
-                        hec_items = converter.convert_to_hec(log_event, context, sfx_metrics)
+                        converted_items = converter.convert_to_hec(log_event, context, sfx_metrics)
+                        hec_items = converted_items
 
                         # modifying logs based on cleaners provided
                         for cleaner in self._cleaners:
-                            hec_items = [cleaner.cleanup_hec_item_message(hec_item, context, sfx_metrics) for hec_item in hec_items]
+                            hec_items = self._clean(cleaner, hec_items, context, sfx_metrics)
 
-                        # convert hec_items to jsons to produce hec_logs
-                        hec_logs = [json.dumps(hec_item) for hec_item in hec_items]
-                        self._send(hec_logs, sfx_metrics)
+                        # convert hec_items to jsons to produce hec_logs, items flow one by one
+                        # into batches, so at most a single batch is held in memory
+                        serializer = HecSerializer(encoder=self._json_encoder)
+                        hec_logs = (serializer.dumps(hec_item) for hec_item in hec_items)
+                        failed_batches = self._send(hec_logs, sfx_metrics)
+                        if failed_batches > 0:
+                            # objects are processed again when notified again, continuing
+                            # them as well would send their log entries twice
+                            log.warning(f"{failed_batches} batch(es) could not be sent, S3 objects are "
+                                        f"neither continued nor recorded as processed")
+                            self._continuations.discard()
+                            if self._processed_objects is not None:
+                                self._processed_objects.discard()
+                        else:
+                            # only once everything processed so far has been sent
+                            self._continuations.dispatch(context, sfx_metrics)
+                            if self._processed_objects is not None:
+                                self._processed_objects.commit()
+                        response = converter.response(converted_items, failed_batches)
                         break
                 else:
                     log.warning("Received unsupported log event: " + json.dumps(log_event))
@@ -92,17 +194,64 @@ class LogCollector:
                 sfx_metrics.inc_counter('sf.org.awsLogCollector.num.errors')
                 raise ex
             finally:
+                # the whole event is retried when the invocation fails
+                self._continuations.discard()
+                if self._processed_objects is not None:
+                    self._processed_objects.discard()
+                self._tags_cache.send_metrics(sfx_metrics)
+                if self._prewarm is not None:
+                    self._prewarm.send_metrics(sfx_metrics)
                 sfx_metrics.inc_counter('sf.org.awsLogCollector.num.invocations')
+        return response
 
     @staticmethod
-    def _send(logs, sfx_metrics):
-        log.debug(f"About to send {len(logs)} log item(s)...")
-        for item in logs:
-            log.debug(item)
+    def _clean(cleaner, hec_items, context, sfx_metrics):
+        for hec_item in hec_items:
+            yield cleaner.cleanup_hec_item_message(hec_item, context, sfx_metrics)
+
+    def _send(self, logs, sfx_metrics):
+        log.debug("About to send log items...")
+        if log.isEnabledFor(logging.DEBUG):
+            logs = LogCollector._logged(logs)
 
         with BatchClient.create(SPLUNK_LOG_URL, SPLUNK_API_KEY, MAX_REQUEST_SIZE_IN_BYTES, COMPRESSION_LEVEL,
-                                sfx_metrics) as client:
-            client.send(logs)
+                                sfx_metrics, senders=LOG_SENDERS, session_pool=self._session_pool) as client:
+            return client.send(logs)
+
+    @staticmethod
+    def _logged(logs):
+        for item in logs:
+            log.debug(item.decode("utf-8"))
+            yield item
+
+    def _create_tags_cache(self):
+        def create(tagging_clients=None):
+            return TagsCache(TAGS_CACHE_TTL_SECONDS, TAGS_CACHE_NEGATIVE_TTL_SECONDS, TAGS_CACHE_MAX_SIZE_BYTES,
+                             namespace_ttl_seconds=self._parse_key_values(TAGS_CACHE_NAMESPACE_TTL_SECONDS, int),
+                             miss_rate_refresh_threshold=TAGS_CACHE_MISS_RATE_REFRESH_THRESHOLD,
+                             miss_rate_min_refresh_interval_seconds=TAGS_CACHE_MISS_RATE_MIN_REFRESH_INTERVAL_SECONDS,
+                             tagging_clients=tagging_clients,
+                             negative_cache_max_entries=TAGS_CACHE_NEGATIVE_MAX_ENTRIES)
+
+        account_roles = self._parse_key_values(TAGS_CACHE_ACCOUNT_ROLES)
+        if not account_roles:
+            return create()
+
+        sts_client = boto3.client("sts")
+        caches_by_account_id = {
+            account_id: create(AssumedRoleTaggingClients(role_arn, TagsCache.session.region_name, sts_client,
+                                                         TagsCache.global_region_available))
+            for account_id, role_arn in account_roles.items()
+        }
+        return MultiAccountTagsCache(create(), caches_by_account_id)
+
+    @staticmethod
+    def _parse_key_values(key_values, value_type=str):
+        result = {}
+        for key_value in filter(None, key_values.split(",")):
+            key, value = key_value.split("=", 1)
+            result[key.strip()] = value_type(value.strip())
+        return result
 
     @staticmethod
     def _dump_object(context):
@@ -0,0 +1,88 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import gzip
+import json
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock
+
+from aws_log_collector.converters.cloudwatch import CloudWatchLogsConverter, parse_logs
+from tests.utils import read_json_file, lambda_context
+
+LOGS = read_json_file("tests/data/lambda_log.json")
+
+
+class ParseLogsSuite(TestCase):
+
+    def test_same_as_json_loads(self):
+        logs = dict(LOGS, logEvents=[dict(LOGS["logEvents"][0], id=str(i)) for i in range(3)])
+
+        for text in [json.dumps(logs), json.dumps(logs, indent=2), json.dumps(logs, separators=(",", ":"))]:
+            with self.subTest(text=text[:40]):
+                fields, log_events = parse_logs(text)
+                self.assertEqual({name: value for name, value in logs.items() if name != "logEvents"}, fields)
+                self.assertEqual(logs["logEvents"], list(log_events))
+
+    def test_log_events_are_parsed_lazily(self):
+        text = json.dumps(LOGS)[:-2] + ", {not json}]}"
+
+        _, log_events = parse_logs(text)
+
+        self.assertEqual(LOGS["logEvents"][0], next(log_events))
+        self.assertRaises(json.JSONDecodeError, next, log_events)
+
+    def test_log_events_before_other_fields(self):
+        logs = {"logEvents": LOGS["logEvents"], "logGroup": LOGS["logGroup"], "logStream": LOGS["logStream"]}
+
+        fields, log_events = parse_logs(json.dumps(logs))
+
+        self.assertEqual(LOGS["logGroup"], fields["logGroup"])
+        self.assertEqual(LOGS["logEvents"], list(log_events))
+
+    def test_without_log_events(self):
+        for logs in [{}, {"logGroup": "a", "logStream": "b"}, {"logGroup": "a", "logStream": "b", "logEvents": []}]:
+            with self.subTest(logs=logs):
+                _, log_events = parse_logs(json.dumps(logs))
+                self.assertEqual([], list(log_events))
+
+    def test_invalid_payload(self):
+        for text in ["", "[]", '{"logGroup" "a"}', '{"logGroup": "a" "logStream": "b"}']:
+            with self.subTest(text=text):
+                self.assertRaises(json.JSONDecodeError, parse_logs, text)
+
+
+class CloudWatchLogsConverterSuite(TestCase):
+
+    def test_input_metrics(self):
+        enricher = Mock()
+        enricher.get_metadata.return_value = {"host": "h", "source": "lambda", "sourcetype": "aws:lambda"}
+        sfx_metrics = Mock()
+        data = json.dumps(LOGS).encode("utf-8")
+        compressed = gzip.compress(data)
+        aws_logs_base64 = base64.b64encode(compressed)
+
+        hec_items = list(CloudWatchLogsConverter(enricher).convert_to_hec({"awslogs": {"data": aws_logs_base64}},
+                                                                          lambda_context(), sfx_metrics))
+
+        self.assertEqual(len(LOGS["logEvents"]), len(hec_items))
+        sfx_metrics.counters.assert_called_once_with(
+            ("sf.org.awsLogCollector.num.inputBase64Bytes", len(aws_logs_base64)),
+            ("sf.org.awsLogCollector.num.inputCompressedBytes", len(compressed)),
+            ("sf.org.awsLogCollector.num.inputUncompressedBytes", len(data)))
+
+
+if __name__ == "__main__":
+    unittest.main()
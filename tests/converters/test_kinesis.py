@@ -0,0 +1,39 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock
+
+from aws_log_collector.converters.kinesis import KinesisLogsConverter
+
+
+class KinesisLogsConverterSuite(TestCase):
+
+    def test_supports(self):
+        converter = KinesisLogsConverter(Mock())
+
+        self.assertTrue(converter.supports({"Records": [{"eventSource": "aws:kinesis", "kinesis": {"data": ""}}]}))
+        self.assertTrue(converter.supports({"deliveryStreamArn": "arn:aws:firehose:eu-central-1:906383545488:"
+                                                                 "deliverystream/logs", "records": []}))
+        self.assertFalse(converter.supports({"Records": [{"eventSource": "aws:sqs", "body": "{}"}]}))
+        self.assertFalse(converter.supports({"Records": []}))
+        self.assertFalse(converter.supports({"awslogs": {"data": "H4sI"}}))
+
+    def test_decode_failure(self):
+        self.assertEqual(("1", None), KinesisLogsConverter._decode(("1", "not base64 gzip")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock
+
+from aws_log_collector.converters.sqs import SqsS3LogsConverter
+from tests.utils import read_json_file
+
+S3_EVENT = read_json_file("tests/data/e2e/s3_event.json")
+
+
+class SqsS3LogsConverterSuite(TestCase):
+
+    def test_supports(self):
+        converter = SqsS3LogsConverter(Mock())
+
+        self.assertTrue(converter.supports({"Records": [{"eventSource": "aws:sqs", "body": "{}"}]}))
+        self.assertFalse(converter.supports(S3_EVENT))
+        self.assertFalse(converter.supports({"Records": []}))
+        self.assertFalse(converter.supports({"awslogs": {"data": "H4sI"}}))
+
+    def test_s3_records(self):
+        body = json.dumps(S3_EVENT)
+
+        self.assertEqual(S3_EVENT["Records"], SqsS3LogsConverter._s3_records(body))
+        self.assertEqual(S3_EVENT["Records"], SqsS3LogsConverter._s3_records(
+            json.dumps({"Type": "Notification", "TopicArn": "arn:aws:sns:eu-central-1:906383545488:logs",
+                        "Message": body})))
+        self.assertEqual([], SqsS3LogsConverter._s3_records(json.dumps({"Event": "s3:TestEvent"})))
+        self.assertRaises(ValueError, SqsS3LogsConverter._s3_records, json.dumps({"Records": [{"eventName": "x"}]}))
+        self.assertRaises(KeyError, SqsS3LogsConverter._s3_records, json.dumps({"detail": {}}))
+
+
+if __name__ == "__main__":
+    unittest.main()
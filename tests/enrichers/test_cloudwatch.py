@@ -16,7 +16,8 @@ import unittest
 from unittest import TestCase
 from unittest.mock import Mock
 
-from aws_log_collector.enrichers.cloudwatch import CloudWatchLogsEnricher
+from aws_log_collector.enrichers.cloudwatch import CloudWatchLogsEnricher, LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING
+from aws_log_collector.enrichers.log_group_router import LogGroupRouter
 from tests.utils import lambda_context, read_json_file, AWS_REGION, AWS_ACCOUNT_ID, \
     FORWARDER_FUNCTION_ARN_PREFIX, FORWARDER_FUNCTION_NAME, FORWARDER_FUNCTION_VERSION
 
@@ -217,6 +218,69 @@ class CloudWatchEnrichmentSuite(TestCase):
 
         self.assertEqual(expected, actual)
 
+    def test_routing_rule_with_templates(self):
+        # GIVEN
+        self.tag_cache_mock.get.return_value = CUSTOM_TAGS
+        rules = '[{"prefix": "/ecs/", "namespace": "ecs", "host": "{logGroupName}", ' \
+                '"arn": "arn:aws:ecs:{region}:{accountId}:service/{logGroupName}"}]'
+        log_enricher = CloudWatchLogsEnricher(
+            self.tag_cache_mock, log_group_router=LogGroupRouter.create(rules, LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING))
+        event = {"logGroup": "/ecs/web", "logStream": "web/web/1234"}
+
+        # WHEN
+        actual = log_enricher.get_metadata(event, lambda_context(), self.sfx_metrics)
+
+        # THEN
+        arn = f"arn:aws:ecs:{AWS_REGION}:{AWS_ACCOUNT_ID}:service/web"
+        expected = {
+            "logGroup": "/ecs/web",
+            "logStream": "web/web/1234",
+            "logForwarder": FORWARDER_FUNCTION_NAME + ":" + FORWARDER_FUNCTION_VERSION,
+            "region": AWS_REGION,
+            "awsAccountId": AWS_ACCOUNT_ID,
+            "arn": arn,
+            "host": "web",
+            "source": "ecs",
+            "sourcetype": "aws:ecs",
+            **CUSTOM_TAGS,
+        }
+        self.assertEqual(expected, actual)
+        self.tag_cache_mock.get.assert_called_with(arn, self.sfx_metrics)
+
+    def test_metadata_cached_until_tags_change(self):
+        # GIVEN
+        self.tag_cache_mock.get.return_value = CUSTOM_TAGS
+        self.tag_cache_mock.generation = 1
+        event = read_json_file('tests/data/lambda_log.json')
+
+        # WHEN
+        first = self.log_enricher.get_metadata(event, lambda_context(), self.sfx_metrics)
+        second = self.log_enricher.get_metadata(event, lambda_context(), self.sfx_metrics)
+        self.tag_cache_mock.generation = 2
+        third = self.log_enricher.get_metadata(event, lambda_context(), self.sfx_metrics)
+
+        # THEN
+        self.assertIs(first, second)
+        self.assertIsNot(second, third)
+        self.assertEqual(first, third)
+        self.assertEqual(2, self.tag_cache_mock.get.call_count)
+        hits = [dict(args)["sf.org.awsLogCollector.num.cloudwatch.metadataCacheHits"]
+                for args, _ in self.sfx_metrics.counters.call_args_list]
+        self.assertEqual([0, 1, 0], hits)
+
+    def test_metadata_cache_disabled(self):
+        # GIVEN
+        log_enricher = CloudWatchLogsEnricher(self.tag_cache_mock, metadata_cache_size=0)
+        self.tag_cache_mock.get.return_value = CUSTOM_TAGS
+        event = read_json_file('tests/data/lambda_log.json')
+
+        # WHEN
+        log_enricher.get_metadata(event, lambda_context(), self.sfx_metrics)
+        log_enricher.get_metadata(event, lambda_context(), self.sfx_metrics)
+
+        # THEN
+        self.assertEqual(2, self.tag_cache_mock.get.call_count)
+
     def test_parse_lambda_arn_without_version(self):
         # GIVEN
         context = lambda_context()
@@ -0,0 +1,120 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from unittest import TestCase
+
+from aws_log_collector.enrichers.cloudwatch import LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING
+from aws_log_collector.enrichers.log_group_router import LogGroupRouter, LogGroupRule
+
+
+class LogGroupRouterSuite(TestCase):
+
+    def test_default_prefixes(self):
+        router = LogGroupRouter.create(None, LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING)
+
+        self.assertEqual("lambda", router.route("/aws/lambda/my-function").namespace)
+        self.assertEqual("rds", router.route("/AWS/RDS/instance/db/error").namespace)
+        self.assertEqual("api-gateway", router.route("API-Gateway-Execution-Logs_x/prod").namespace)
+        self.assertIsNone(router.route("/aws/lamb"))
+        self.assertIsNone(router.route("/custom/app"))
+
+    def test_longest_prefix_wins(self):
+        router = LogGroupRouter([LogGroupRule("app", prefix="/app"),
+                                 LogGroupRule("app-payments", prefix="/app/payments"),
+                                 LogGroupRule("app-payments-eu", prefix="/app/payments/eu")])
+
+        self.assertEqual("app", router.route("/app/orders").namespace)
+        self.assertEqual("app-payments", router.route("/app/payments/us").namespace)
+        self.assertEqual("app-payments-eu", router.route("/app/payments/eu-west-1").namespace)
+
+    def test_configured_rules_override_defaults(self):
+        rules = json.dumps([{"prefix": "/aws/lambda/legacy-", "namespace": "legacy"},
+                            {"prefix": "/aws/eks", "namespace": "kubernetes"}])
+        router = LogGroupRouter.create(rules, LOG_GROUP_NAME_PREFIX_TO_NAMESPACE_MAPPING)
+
+        self.assertEqual("legacy", router.route("/aws/lambda/legacy-function").namespace)
+        self.assertEqual("lambda", router.route("/aws/lambda/function").namespace)
+        self.assertEqual("kubernetes", router.route("/aws/eks/cluster/cluster").namespace)
+
+    def test_first_matching_regex_wins_over_prefixes(self):
+        router = LogGroupRouter([LogGroupRule("lambda", prefix="/aws/lambda"),
+                                 LogGroupRule("batch", regex=r"/aws/(lambda/)?batch/(?P<queue>[^/]+)"),
+                                 LogGroupRule("jobs", regex=r"/aws/lambda/(?P<job>job-\d+)"),
+                                 LogGroupRule("batch-all", regex=r"/aws/batch")])
+
+        self.assertEqual("batch", router.route("/aws/lambda/batch/queue").namespace)
+        self.assertEqual("jobs", router.route("/aws/lambda/job-42").namespace)
+        self.assertEqual("batch", router.route("/aws/batch/queue").namespace)
+        self.assertEqual("lambda", router.route("/aws/lambda/job-x").namespace)
+
+    def test_regex_with_backreference_is_not_combined(self):
+        router = LogGroupRouter([LogGroupRule("first", regex=r"/(a)(b)/x"),
+                                 LogGroupRule("repeated", regex=r"/(\w+)/\1"),
+                                 LogGroupRule("named", regex=r"/(?P<name>\w+)-(?P=name)"),
+                                 LogGroupRule("escaped", regex=r"/\(?P<x>"),
+                                 LogGroupRule("any", regex=r"/")])
+
+        self.assertEqual("first", router.route("/ab/x").namespace)
+        self.assertEqual("repeated", router.route("/app/app").namespace)
+        self.assertEqual("named", router.route("/app-app").namespace)
+        self.assertEqual("escaped", router.route("/P<x>").namespace)
+        self.assertEqual("any", router.route("/app/other").namespace)
+
+    def test_regex_with_inline_flags_is_not_combined(self):
+        rules = json.dumps([{"regex": "(?i)/ecs/(?P<svc>.*)", "namespace": "ecs"},
+                            {"regex": "/batch/.*", "namespace": "batch"}])
+        router = LogGroupRouter.create(rules, {})
+
+        self.assertEqual("ecs", router.route("/ECS/web").namespace)
+        self.assertEqual("batch", router.route("/batch/queue").namespace)
+
+    def test_templates(self):
+        rule = LogGroupRule("ecs", regex=r"/ecs/(?P<cluster>[^/]+)/(?P<service>[^/]+)",
+                            host="{cluster}", arn="arn:aws:ecs:{region}:{accountId}:service/{cluster}/{service}")
+
+        self.assertEqual({"host": "prod", "arn": "arn:aws:ecs:us-east-1:123456789012:service/prod/web"},
+                         rule.enrich("us-east-1", "123456789012", "/ecs/prod/web"))
+
+    def test_host_defaults_to_arn(self):
+        rule = LogGroupRule("ecs", prefix="/ecs/", arn="arn:aws:ecs:{region}:{accountId}:service/{logGroupName}")
+
+        self.assertEqual({"host": "arn:aws:ecs:us-east-1:123456789012:service/web",
+                          "arn": "arn:aws:ecs:us-east-1:123456789012:service/web"},
+                         rule.enrich("us-east-1", "123456789012", "/ecs/web"))
+
+    def test_templates_are_formatted_once_per_log_group(self):
+        rule = LogGroupRule("ecs", prefix="/ecs/", arn="arn:aws:ecs:{region}:{accountId}:service/{logGroupName}")
+
+        self.assertIs(rule.enrich("us-east-1", "123456789012", "/ecs/web"),
+                      rule.enrich("us-east-1", "123456789012", "/ecs/web"))
+        self.assertEqual("arn:aws:ecs:us-east-1:123456789012:service/api",
+                         rule.enrich("us-east-1", "123456789012", "/ecs/api")["arn"])
+
+    def test_unknown_template_fields_are_rejected(self):
+        self.assertRaises(ValueError, LogGroupRule, "ecs", prefix="/ecs/", arn="arn:aws:ecs:{region}:{cluster}")
+        self.assertRaises(ValueError, LogGroupRule, "ecs", regex=r"/ecs/(?P<cluster>[^/]+)", host="{service}")
+        self.assertRaises(ValueError, LogGroupRule, "ecs", prefix="/ecs/", host="{}")
+        self.assertRaises(ValueError, LogGroupRouter.create,
+                          json.dumps([{"prefix": "/ecs/", "namespace": "ecs", "host": "{logGroupname}"}]), {})
+        LogGroupRule("ecs", regex=r"/ecs/(?P<cluster>[^/]+)", host="{cluster}", arn="{region}:{accountId}:{logGroup}")
+
+    def test_rule_needs_prefix_or_regex(self):
+        self.assertRaises(ValueError, LogGroupRule, "app")
+        self.assertRaises(ValueError, LogGroupRule, "app", prefix="/app", regex="/app")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -88,6 +88,66 @@ class S3EnrichmentSuite(TestCase):
         }
         self.assertEqual(expected, actual)
 
+    def test_s3_arn_metadata_without_tags(self):
+        # GIVEN
+        arns = [
+            ("bucketArn", f"arn:aws:s3:::{BUCKET}"),
+            ("objectArn", f"arn:aws:s3:::{BUCKET}/{OBJECT_KEY}"),
+        ]
+
+        # WHEN
+        actual = self.log_enricher.get_arn_metadata(arns, COMMON_METADATA)
+
+        # THEN
+        expected = {
+            "bucketArn": f"arn:aws:s3:::{BUCKET}",
+            "objectArn": f"arn:aws:s3:::{BUCKET}/{OBJECT_KEY}",
+            **COMMON_METADATA
+        }
+        self.assertEqual(expected, actual)
+        self.tag_cache_mock.get.assert_not_called()
+
+    def test_metadata_memoized_per_distinct_arns(self):
+        # GIVEN
+        self.tag_cache_mock.get.return_value = BUCKET_TAGS
+        bucket_arns = [("bucketArn", f"arn:aws:s3:::{BUCKET}")]
+        other_bucket_arns = [("bucketArn", "arn:aws:s3:::other-bucket")]
+        memo = self.log_enricher.memoize(COMMON_METADATA)
+
+        # WHEN
+        first = memo.get(bucket_arns, self.sfx_metrics)
+        second = memo.get(list(bucket_arns), self.sfx_metrics)
+        other = memo.get(other_bucket_arns, self.sfx_metrics)
+
+        # THEN
+        self.assertIs(first, second)
+        self.assertEqual({"bucketArn": f"arn:aws:s3:::{BUCKET}", **COMMON_METADATA, **BUCKET_TAGS}, first)
+        self.assertEqual("arn:aws:s3:::other-bucket", other["bucketArn"])
+        self.assertEqual((1, 2), (memo.hits, memo.misses))
+        self.assertEqual(2, self.tag_cache_mock.get.call_count)
+        self.assertRaises(TypeError, first.__setitem__, "foo", "baz")
+
+    def test_container_cache_invalidated_when_tags_change(self):
+        # GIVEN
+        log_enricher = S3LogsEnricher(self.tag_cache_mock, container_cache_size=10)
+        self.tag_cache_mock.get.return_value = BUCKET_TAGS
+        self.tag_cache_mock.generation = 1
+        arns = [("bucketArn", f"arn:aws:s3:::{BUCKET}")]
+
+        # WHEN
+        first_file = log_enricher.memoize(COMMON_METADATA)
+        first_file.get(arns, self.sfx_metrics)
+        second_file = log_enricher.memoize(COMMON_METADATA)
+        second_file.get(arns, self.sfx_metrics)
+        self.tag_cache_mock.generation = 2
+        third_file = log_enricher.memoize(COMMON_METADATA)
+        third_file.get(arns, self.sfx_metrics)
+
+        # THEN
+        self.assertEqual((0, 1), (first_file.container_hits, first_file.misses))
+        self.assertEqual((1, 0), (second_file.container_hits, second_file.misses))
+        self.assertEqual((0, 1), (third_file.container_hits, third_file.misses))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,94 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock
+
+from aws_log_collector.enrichers.s3 import S3LogsEnricher
+from aws_log_collector.enrichers.tag_dimensions import TagDimensions
+
+ELB_ARN = "arn:aws:elasticloadbalancing:us-east-2:840385940912:loadbalancer/app/my-loadbalancer/50dc6c495c0c9188"
+ELB_TAGS = {"team": "integrations", "region": "ignored"}
+TARGET_GROUP_ARN = "arn:aws:elasticloadbalancing:us-east-2:840385940912:targetgroup/my-targets/73e2d6bc24d8a067"
+BUCKET_ARN = "arn:aws:s3:::integrations-team"
+CONTEXT_METADATA = {"region": "us-east-2", "awsAccountId": "840385940912"}
+
+
+class TagDimensionsSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.tag_cache_mock = Mock()
+        self.tag_cache_mock.get.side_effect = lambda arn, _: ELB_TAGS if arn == ELB_ARN else None
+        # the cache holds tags of buckets, not of objects
+        self.tag_cache_mock.may_have_tags.side_effect = lambda arn: not arn.startswith(BUCKET_ARN + "/")
+        self.sfx_metrics = Mock()
+        self.tag_dimensions = TagDimensions(S3LogsEnricher(self.tag_cache_mock), 60)
+
+    def test_tag_dimension_record_per_arn_with_tags(self):
+        arns = {("elbArn", ELB_ARN), ("targetGroupArn", TARGET_GROUP_ARN)}
+
+        records = list(self.tag_dimensions.to_hec("ApplicationELB", arns, CONTEXT_METADATA, self.sfx_metrics))
+
+        self.assertEqual(1, len(records))
+        record = records[0]
+        self.assertEqual(ELB_ARN, record["event"])
+        self.assertEqual({**CONTEXT_METADATA, "arn": ELB_ARN, "elbArn": ELB_ARN, "team": "integrations"},
+                         record["fields"])
+        self.assertEqual("ApplicationELB", record["source"])
+        self.assertEqual("aws:tags", record["sourcetype"])
+
+    def test_tag_dimension_record_produced_once_per_interval(self):
+        arns = {("elbArn", ELB_ARN)}
+
+        first = list(self.tag_dimensions.to_hec("ApplicationELB", arns, CONTEXT_METADATA, self.sfx_metrics))
+        second = list(self.tag_dimensions.to_hec("ApplicationELB", arns, CONTEXT_METADATA, self.sfx_metrics))
+
+        self.assertEqual(1, len(first))
+        self.assertEqual(0, len(second))
+        self.assertEqual(1, self.tag_cache_mock.get.call_count)
+
+
+    def test_arn_without_tags_produced_once_tagged(self):
+        arns = {("targetGroupArn", TARGET_GROUP_ARN)}
+
+        first = list(self.tag_dimensions.to_hec("ApplicationELB", arns, CONTEXT_METADATA, self.sfx_metrics))
+        self.tag_cache_mock.get.side_effect = lambda arn, _: ELB_TAGS
+        second = list(self.tag_dimensions.to_hec("ApplicationELB", arns, CONTEXT_METADATA, self.sfx_metrics))
+
+        self.assertEqual(0, len(first))
+        self.assertEqual([TARGET_GROUP_ARN], [record["event"] for record in second])
+
+    def test_collect_arns_cache_may_have_tags_for(self):
+        arns = set()
+        objects = [("objectArn", f"{BUCKET_ARN}/logs/{i}.log") for i in range(100)]
+
+        self.tag_dimensions.collect(arns, [("bucketArn", BUCKET_ARN), *objects])
+        self.tag_dimensions.collect(arns, [("bucketArn", BUCKET_ARN), ("elbArn", ELB_ARN)])
+
+        self.assertEqual({("bucketArn", BUCKET_ARN), ("elbArn", ELB_ARN)}, arns)
+
+    def test_collected_arns_are_bounded(self):
+        tag_dimensions = TagDimensions(S3LogsEnricher(self.tag_cache_mock), 60, max_arns_per_file=2)
+        list(tag_dimensions.to_hec("ApplicationELB", {("elbArn", ELB_ARN)}, CONTEXT_METADATA, self.sfx_metrics))
+        arns = set()
+
+        tag_dimensions.collect(arns, [("elbArn", ELB_ARN)] + [("bucketArn", f"{BUCKET_ARN}-{i}") for i in range(5)])
+
+        # the ARN produced already is not collected again
+        self.assertEqual({("bucketArn", f"{BUCKET_ARN}-0"), ("bucketArn", f"{BUCKET_ARN}-1")}, arns)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,10 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+import time
 from unittest.case import TestCase
 from unittest.mock import MagicMock, call, Mock
 
-from aws_log_collector.lib.client import RetryableException, RetryableClient, BatchClient
+from aws_log_collector.lib.client import RetryableException, RetryableClient, BatchClient, HTTPClient, SessionPool
 
 
 class RetryClientSuite(TestCase):
@@ -106,3 +108,94 @@ class BatchingSuite(TestCase):
         self.assertEqual(1, self.client.send.call_count)
         # 341 '€' takes 1023 bytes
         self.assertEqual(call(["€" * 341]), self.client.send.call_args_list[0])
+
+    def test_batching_of_encoded_items(self):
+        # GIVEN
+        items = ["€".encode("utf-8") * 200, b"y" * 512, "€".encode("utf-8") * 400]
+
+        # WHEN
+        self.batch_client.send(items)
+
+        # THEN
+        self.assertEqual(3, self.client.send.call_count)
+        self.assertEqual(call([items[0]]), self.client.send.call_args_list[0])
+        self.assertEqual(call([items[1]]), self.client.send.call_args_list[1])
+        # 341 '€' takes 1023 bytes
+        self.assertEqual(call(["€".encode("utf-8") * 341]), self.client.send.call_args_list[2])
+
+    def test_batches_sent_by_several_senders(self):
+        # GIVEN
+        sfx_metrics = Mock()
+        batch_client = BatchClient(self.client, 1024, max_retry=3, senders=3, sfx_metrics=sfx_metrics)
+        senders = set()
+
+        def send(batch):
+            senders.add(threading.current_thread().name)
+            time.sleep(0.05)
+
+        self.client.send.side_effect = send
+        items = [str(i) * 1000 for i in range(10)]
+
+        # WHEN
+        batch_client.send(iter(items))
+
+        # THEN
+        sent_items = sorted(args[0][0] for args, _ in self.client.send.call_args_list)
+        self.assertEqual(items, sent_items)
+        self.assertEqual(3, len(senders))
+        sfx_metrics.gauges.assert_called_with(("sf.org.awsLogCollector.pipeline.sendQueueDepth", 3))
+
+
+    def test_failed_batches_counted(self):
+        # GIVEN
+        sfx_metrics = Mock()
+        self.client.send.side_effect = [None, Exception("Client error (status=403, reason=Forbidden)"), None]
+        items = ["x" * 1000, "y" * 1000, "z" * 1000]
+
+        # WHEN
+        failed_batches = BatchClient(self.client, 1024, max_retry=3, sfx_metrics=sfx_metrics).send(items)
+
+        # THEN
+        self.assertEqual(1, failed_batches)
+        self.assertEqual(3, self.client.send.call_count)
+        sfx_metrics.counters.assert_called_once_with(("sf.org.awsLogCollector.num.failedBatches", 1))
+
+    def test_failed_batches_counted_by_several_senders(self):
+        # GIVEN
+        def send(batch):
+            if batch[0].startswith("1") or batch[0].startswith("7"):
+                raise Exception("Client error (status=400, reason=Bad Request)")
+
+        self.client.send.side_effect = send
+        items = [str(i) * 1000 for i in range(10)]
+
+        # WHEN
+        failed_batches = BatchClient(self.client, 1024, max_retry=3, senders=3).send(iter(items))
+
+        # THEN
+        self.assertEqual(2, failed_batches)
+        self.assertEqual(10, self.client.send.call_count)
+
+
+class HTTPClientSuite(TestCase):
+
+    def test_combine_encoded_and_str_events(self):
+        self.assertEqual('{"a":"€"}\n{"b":1}'.encode("utf-8"),
+                         HTTPClient._combine_events(['{"a":"€"}'.encode("utf-8"), '{"b":1}']))
+
+    def test_sessions_kept_by_pool(self):
+        session_pool = SessionPool()
+
+        with HTTPClient("https://ingest.example.com", "token", 6, Mock(), session_pool=session_pool) as client:
+            session = client._session()
+        with HTTPClient("https://ingest.example.com", "token", 6, Mock(), session_pool=session_pool) as client:
+            self.assertIs(session, client._session())
+            self.assertEqual("token", session.headers["X-SF-TOKEN"])
+            # a thread of its own gets a session of its own
+            sessions = []
+            sender = threading.Thread(target=lambda: sessions.append(client._session()))
+            sender.start()
+            sender.join()
+            self.assertIsNot(session, sessions[0])
+
+        self.assertEqual({session, sessions[0]}, {session_pool.acquire(), session_pool.acquire()})
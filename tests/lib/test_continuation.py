@@ -0,0 +1,95 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock
+
+from aws_log_collector.lib.continuation import Continuations, Deadline, LambdaInvoker, LocalInvoker
+from tests.utils import lambda_context
+
+RECORD = {"s3": {"bucket": {"name": "logs"}, "object": {"key": "a.log", "size": 1024}}}
+
+
+class ContinuationsSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.invoker = LocalInvoker()
+        self.sfx_metrics = Mock()
+        self.context = lambda_context()
+        self.context.get_remaining_time_in_millis = lambda: 60000
+
+    def test_deadline(self):
+        self.assertIsNone(Continuations(self.invoker, 0).deadline(self.context))
+        self.assertIsNone(Continuations(self.invoker, 60).deadline(self.context))
+        self.assertFalse(Continuations(self.invoker, 30).deadline(self.context).is_near())
+        self.assertTrue(Deadline(1, 1).is_near())
+
+    def test_dispatch_checkpointed_records(self):
+        continuations = Continuations(self.invoker, 30)
+        continuations.add(RECORD, 256)
+        continuations.add(dict(RECORD, awsLogCollectorCheckpoint={"lines": 256}), 512)
+
+        continuations.dispatch(self.context, self.sfx_metrics)
+        continuations.dispatch(self.context, self.sfx_metrics)
+
+        self.assertEqual([(self.context.invoked_function_arn, {"Records": [
+            dict(RECORD, awsLogCollectorCheckpoint={"lines": 256}),
+            dict(RECORD, awsLogCollectorCheckpoint={"lines": 512})
+        ]})], self.invoker.events)
+        self.sfx_metrics.counters.assert_called_once_with(("sf.org.awsLogCollector.num.s3.continuations", 2))
+
+    def test_discard(self):
+        continuations = Continuations(self.invoker, 30)
+        continuations.add(RECORD, 256)
+
+        continuations.discard()
+        continuations.dispatch(self.context, self.sfx_metrics)
+
+        self.assertEqual([], self.invoker.events)
+
+    def test_checkpoint_lines(self):
+        self.assertEqual(0, Continuations.checkpoint_lines(RECORD))
+        self.assertEqual(256, Continuations.checkpoint_lines(dict(RECORD, awsLogCollectorCheckpoint={"lines": 256})))
+
+
+class InvokerSuite(TestCase):
+
+    def test_lambda_invoker(self):
+        client = Mock()
+
+        LambdaInvoker(client).invoke("arn:aws:lambda:us-east-1:134183635603:function:f", {"Records": [RECORD]})
+
+        client.invoke.assert_called_once_with(FunctionName="arn:aws:lambda:us-east-1:134183635603:function:f",
+                                              InvocationType="Event", Payload=json.dumps({"Records": [RECORD]}))
+
+    def test_local_invoker_runs_invocations_made_by_handler(self):
+        invoker = LocalInvoker()
+        handled = []
+
+        def handler(event, context):
+            handled.append(event["n"])
+            if event["n"] < 3:
+                invoker.invoke("f", {"n": event["n"] + 1})
+
+        invoker.invoke("f", {"n": 1})
+        invoker.run_pending(handler, lambda_context())
+
+        self.assertEqual([1, 2, 3], handled)
+        self.assertEqual([], invoker.events)
+
+
+if __name__ == "__main__":
+    unittest.main()
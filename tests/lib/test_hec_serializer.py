@@ -0,0 +1,74 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import TestCase
+
+from aws_log_collector.lib.frozen_dict import FrozenDict
+from aws_log_collector.lib.hec_serializer import HecSerializer
+from aws_log_collector.lib.json_encoder import available_encoders
+
+FIELDS = FrozenDict({"logGroup": "/aws/lambda/fn", "region": "us-east-1", "team": "zespół \"A\"", "count": 1})
+
+
+class HecSerializerSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.serializer = HecSerializer()
+
+    def test_same_output_as_encoder(self):
+        items = [
+            {"event": "simple", "fields": FIELDS, "host": "h", "source": "lambda", "sourcetype": "aws:lambda",
+             "time": "1595335478.131"},
+            {"event": "zażółć   \x00\t\"quoted\" \\ / €", "fields": FIELDS, "host": "h", "source": "lambda",
+             "sourcetype": "aws:lambda", "time": "1595335478.132"},
+            {"event": "s3 line", "fields": FIELDS, "source": "s3", "sourcetype": "aws:s3", "time": 1607371315.177},
+            {"event": "no time", "fields": FIELDS, "source": "s3", "sourcetype": "aws:s3", "time": None},
+            {"event": "other host", "fields": FIELDS, "host": "other", "source": "lambda",
+             "sourcetype": "aws:lambda", "time": "1595335478.133"},
+            {"event": "mutable fields", "fields": dict(FIELDS), "source": "s3", "sourcetype": "aws:s3", "time": 1.5},
+            {"fields": FIELDS, "event": "different order", "time": 2.5, "source": "s3", "sourcetype": "aws:s3"},
+            {"event": "without time", "fields": FIELDS, "source": "s3", "sourcetype": "aws:s3"},
+        ]
+
+        for encoder_type in available_encoders():
+            with self.subTest(encoder=encoder_type.name):
+                encoder = encoder_type()
+                serializer = HecSerializer(encoder=encoder)
+                for item in items + items:
+                    self.assertEqual(encoder.dumps(item), serializer.dumps(item))
+
+    def test_template_reused_for_same_fields(self):
+        first = {"event": "a", "fields": FIELDS, "source": "s3", "sourcetype": "aws:s3", "time": 1.0}
+        second = {"event": "b", "fields": FIELDS, "source": "s3", "sourcetype": "aws:s3", "time": 2.0}
+
+        self.serializer.dumps(first)
+        self.serializer.dumps(second)
+
+        self.assertEqual(1, len(self.serializer._templates))
+
+    def test_number_of_templates_is_bounded(self):
+        serializer = HecSerializer(max_templates=2)
+        encoder = serializer._encoder
+
+        for i in range(5):
+            fields = FrozenDict({"i": i})
+            item = {"event": "a", "fields": fields, "source": "s3", "sourcetype": "aws:s3", "time": 1.0}
+            self.assertEqual(encoder.dumps(item), serializer.dumps(item))
+
+        self.assertLessEqual(len(serializer._templates), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import glob
+import json
+import unittest
+from unittest import TestCase
+
+from aws_log_collector.lib.frozen_dict import FrozenDict
+from aws_log_collector.lib.hec_serializer import HecSerializer
+from aws_log_collector.lib.json_encoder import available_encoders, CompactJsonEncoder, create_json_encoder, \
+    JsonEncoder, OrjsonEncoder, orjson
+
+# HEC logs sent by end to end tests of all converters
+GOLDEN_FILES = sorted(glob.glob("tests/data/e2e/*_hec_logs.ndjson"))
+
+COMPACT_ENCODERS = [encoder_type for encoder_type in available_encoders() if encoder_type is not JsonEncoder]
+
+
+class JsonEncoderSuite(TestCase):
+
+    def test_golden_files(self):
+        self.assertGreater(len(GOLDEN_FILES), 0)
+        for encoder_type in available_encoders():
+            for file_name in GOLDEN_FILES:
+                with self.subTest(encoder=encoder_type.name, file_name=file_name):
+                    golden_logs = _read_lines(file_name)
+                    encoder = encoder_type()
+                    serializer = HecSerializer(encoder=encoder)
+
+                    hec_items = [_as_converted(json.loads(hec_log)) for hec_log in golden_logs]
+                    hec_logs = [serializer.dumps(hec_item) for hec_item in hec_items]
+
+                    self.assertEqual([encoder.dumps(hec_item) for hec_item in hec_items], hec_logs)
+                    self.assertEqual([json.loads(hec_log) for hec_log in golden_logs],
+                                     [json.loads(hec_log) for hec_log in hec_logs])
+                    if encoder_type is JsonEncoder:
+                        self.assertEqual(golden_logs, hec_logs)
+
+    def test_same_output_as_json_dumps(self):
+        obj = {"event": "zażółć \"€\"\n\x00 \ud800", "time": 1607371315.177, "i": [1, None, 2 ** 70, float("nan")],
+               1: "non-string key"}
+        self.assertEqual(json.dumps(obj).encode("utf-8"), JsonEncoder().dumps(obj))
+
+    def test_compact_utf8_output(self):
+        for encoder_type in COMPACT_ENCODERS:
+            with self.subTest(encoder=encoder_type.name):
+                encoded = encoder_type().dumps({"event": "zażółć \"€\"\n\x00", "time": 1607371315.177, "i": [1, None]})
+                self.assertEqual('{"event":"zażółć \\"€\\"\\n\\u0000","time":1607371315.177,"i":[1,null]}'
+                                 .encode("utf-8"), encoded)
+
+    def test_values_without_utf8_encoding_stay_escaped(self):
+        for encoder_type in COMPACT_ENCODERS:
+            with self.subTest(encoder=encoder_type.name):
+                self.assertEqual(b'{"event":"\\ud800 \\u20ac"}', encoder_type().dumps({"event": "\ud800 €"}))
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_orjson_falls_back_to_stdlib(self):
+        encoder = OrjsonEncoder()
+        for obj in [{"count": 2 ** 70}, {1: "non-string key"}]:
+            self.assertEqual(CompactJsonEncoder().dumps(obj), encoder.dumps(obj))
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    def test_orjson_writes_nan_as_null(self):
+        self.assertEqual(b'{"time":null}', OrjsonEncoder().dumps({"time": float("nan")}))
+
+    def test_create_encoder(self):
+        self.assertIsInstance(create_json_encoder(), JsonEncoder)
+        self.assertIsInstance(create_json_encoder("json-compact"), CompactJsonEncoder)
+        self.assertRaises(ValueError, create_json_encoder, "unknown")
+        self.assertRaises(ValueError, create_json_encoder, "auto")
+
+
+def _read_lines(file_name):
+    with open(file_name, "rb") as file:
+        return file.read().splitlines()
+
+
+def _as_converted(hec_item):
+    # converters share immutable fields, which lets the serializer use templates
+    return {name: FrozenDict(value) if name == "fields" else value for name, value in hec_item.items()}
+
+
+if __name__ == "__main__":
+    unittest.main()
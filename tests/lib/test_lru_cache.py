@@ -0,0 +1,109 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import TestCase
+
+from aws_log_collector.lib.lru_cache import LruCache
+from tests.utils import FakeClock
+
+
+class LruCacheSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+
+    def test_get_and_put(self):
+        cache = LruCache(10, clock=self.clock)
+        cache.put("a", 1)
+
+        self.assertEqual(1, cache.get("a"))
+        self.assertEqual(None, cache.get("b"))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_entry_expires_after_ttl(self):
+        cache = LruCache(10, clock=self.clock)
+        cache.put("short", 1, ttl_seconds=10)
+        cache.put("long", 2, ttl_seconds=100)
+
+        self.clock.now = 50
+
+        self.assertEqual(None, cache.get("short"))
+        self.assertEqual(2, cache.get("long"))
+        self.assertEqual(1, cache.expirations)
+        self.assertEqual(1, len(cache))
+
+    def test_evicts_least_recently_used(self):
+        cache = LruCache(2, clock=self.clock)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+
+        cache.put("c", 3)
+
+        self.assertEqual(1, cache.get("a"))
+        self.assertEqual(None, cache.get("b"))
+        self.assertEqual(3, cache.get("c"))
+        self.assertEqual(1, cache.evictions)
+
+    def test_bounded_by_entry_size(self):
+        cache = LruCache(10, sizeof=lambda key, value: len(value), clock=self.clock)
+        cache.put("a", "x" * 4)
+        cache.put("b", "y" * 4)
+        cache.put("c", "z" * 4)
+
+        self.assertEqual(8, cache.size)
+        self.assertEqual(None, cache.get("a"))
+        self.assertEqual(1, cache.evictions)
+        self.assertFalse(cache.put("d", "too big to fit"))
+
+    def test_replacing_entry_updates_size(self):
+        cache = LruCache(10, sizeof=lambda key, value: len(value), clock=self.clock)
+        cache.put("a", "x" * 4)
+        cache.put("a", "x" * 2)
+
+        self.assertEqual(2, cache.size)
+        self.assertEqual(1, len(cache))
+
+    def test_shared_values_are_sized_once(self):
+        shared, other = ["shared"], ["other"]
+        cache = LruCache(10, sizeof=lambda key, value: 1, clock=self.clock, shared_sizeof=lambda value: 3)
+        cache.put("a", shared)
+        cache.put("b", shared)
+        cache.put("c", other)
+
+        self.assertEqual(3 + 1 + 1 + 3 + 1, cache.size)
+
+        cache.remove("a")
+        self.assertEqual(3 + 1 + 3 + 1, cache.size)
+        cache.remove("b")
+        self.assertEqual(3 + 1, cache.size)
+
+    def test_shared_value_is_released_when_last_entry_is_evicted(self):
+        shared = ["shared"]
+        cache = LruCache(10, sizeof=lambda key, value: 1, clock=self.clock, shared_sizeof=lambda value: len(value[0]))
+        cache.put("a", shared)
+        cache.put("b", shared)
+        # each distinct value costs 1 + 6, so putting a second one evicts both entries of the first
+        cache.put("c", ["values"])
+
+        self.assertEqual(None, cache.get("a"))
+        self.assertEqual(None, cache.get("b"))
+        self.assertEqual(7, cache.size)
+        self.assertEqual(2, cache.evictions)
+
+
+if __name__ == "__main__":
+    unittest.main()
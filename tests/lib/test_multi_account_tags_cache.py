@@ -0,0 +1,154 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+from unittest.mock import Mock
+
+from aws_log_collector.lib.multi_account_tags_cache import MultiAccountTagsCache, AssumedRoleTaggingClients
+from aws_log_collector.lib.tags_cache import TagsCache
+
+OWN_ACCOUNT_ID = "134183635603"
+OTHER_ACCOUNT_ID = "840385940912"
+OTHER_ACCOUNT_ROLE = f"arn:aws:iam::{OTHER_ACCOUNT_ID}:role/splunk-tags"
+
+
+def _elb_arn(account_id):
+    return f"arn:aws:elasticloadbalancing:us-east-2:{account_id}:loadbalancer/app/my-lb/50dc6c495c0c9188"
+
+
+class FakeTaggingClient(object):
+    """
+    Stand-in of the resource tagging API client returning tags of a single account.
+    """
+
+    def __init__(self, tags_by_arn):
+        self.tags_by_arn = tags_by_arn
+        self.requests = []
+
+    def get_paginator(self, _):
+        return self
+
+    def paginate(self, ResourceTypeFilters, ResourcesPerPage):
+        self.requests.append(ResourceTypeFilters)
+        yield {"ResourceTagMappingList": [
+            {"ResourceARN": arn, "Tags": [{"Key": key, "Value": value} for key, value in tags.items()]}
+            for arn, tags in self.tags_by_arn.items() if arn.split(":")[2] in ResourceTypeFilters
+        ]}
+
+
+class FakeSts(object):
+
+    def __init__(self):
+        self.assumed_roles = []
+
+    def assume_role(self, RoleArn, RoleSessionName):
+        self.assumed_roles.append(RoleArn)
+        return {"Credentials": {"AccessKeyId": "id", "SecretAccessKey": "secret", "SessionToken": RoleArn,
+                                "Expiration": datetime.now(timezone.utc) + timedelta(hours=1)}}
+
+
+class MultiAccountTagsCacheSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.sfx_metrics = Mock()
+        self.own_client = FakeTaggingClient({_elb_arn(OWN_ACCOUNT_ID): {"account": "own"}})
+        self.other_client = FakeTaggingClient({_elb_arn(OTHER_ACCOUNT_ID): {"account": "other"}})
+        self.sts = FakeSts()
+
+        def session_factory(aws_session_token, **_):
+            self.assertEqual(OTHER_ACCOUNT_ROLE, aws_session_token)
+            session = Mock()
+            session.client.return_value = self.other_client
+            return session
+
+        self.tags_cache = MultiAccountTagsCache(
+            TagsCache(60, tagging_clients=lambda: (self.own_client, None)),
+            {OTHER_ACCOUNT_ID: TagsCache(60, tagging_clients=AssumedRoleTaggingClients(
+                OTHER_ACCOUNT_ROLE, "us-east-2", self.sts, False, session_factory=session_factory))})
+
+    def test_lookup_routed_by_account_id(self):
+        self.assertEqual({"account": "own"}, self.tags_cache.get(_elb_arn(OWN_ACCOUNT_ID), self.sfx_metrics))
+        self.assertEqual({"account": "other"}, self.tags_cache.get(_elb_arn(OTHER_ACCOUNT_ID), self.sfx_metrics))
+        self.assertEqual(None, self.tags_cache.get(_elb_arn("123456789012"), self.sfx_metrics))
+        self.assertEqual(None, self.tags_cache.get("arn:aws:s3:::some-bucket", self.sfx_metrics))
+
+        self.assertEqual([OTHER_ACCOUNT_ROLE], self.sts.assumed_roles)
+
+    def test_expired_namespaces_refreshed_in_all_accounts(self):
+        self.tags_cache.get(_elb_arn(OWN_ACCOUNT_ID), self.sfx_metrics)
+        self.tags_cache.get(_elb_arn(OTHER_ACCOUNT_ID), self.sfx_metrics)
+        for cache in self.tags_cache._caches():
+            cache.namespaces["elasticloadbalancing"].last_fetch_time -= 61
+        self.tags_cache._next_refresh_time = 0
+        self.other_client.tags_by_arn = {_elb_arn(OTHER_ACCOUNT_ID): {"account": "other", "new": "tag"}}
+
+        self.tags_cache.get(_elb_arn(OWN_ACCOUNT_ID), self.sfx_metrics)
+
+        self.assertEqual(2, len(self.own_client.requests))
+        self.assertEqual(2, len(self.other_client.requests))
+        self.assertEqual({"account": "other", "new": "tag"},
+                         self.tags_cache.get(_elb_arn(OTHER_ACCOUNT_ID), self.sfx_metrics))
+        # credentials are still valid, so the role is not assumed again
+        self.assertEqual([OTHER_ACCOUNT_ROLE], self.sts.assumed_roles)
+
+    def test_no_refresh_scan_before_namespaces_are_fetched(self):
+        self.assertEqual(float("inf"), self.tags_cache._next_refresh_time)
+        self.tags_cache.get("arn:aws:sqs:us-east-1:134183635603:queue", self.sfx_metrics)
+
+        self.assertEqual(float("inf"), self.tags_cache._next_refresh_time)
+        self.sfx_metrics.counters.assert_not_called()
+
+    def test_expired_namespace_refreshed_once(self):
+        self.tags_cache.get(_elb_arn(OWN_ACCOUNT_ID), self.sfx_metrics)
+        namespace = self.tags_cache.default_cache.namespaces["elasticloadbalancing"]
+        namespace.last_fetch_time -= 61
+
+        # e.g. a lookup refreshed it while the scan was waiting for its refresh lock
+        self.assertTrue(self.tags_cache.default_cache.refresh_if_expired(namespace))
+        self.assertFalse(self.tags_cache.default_cache.refresh_if_expired(namespace))
+        self.assertEqual(2, len(self.own_client.requests))
+
+    def test_role_assumed_once_by_concurrent_fetches(self):
+        clients = self.tags_cache.caches_by_account_id[OTHER_ACCOUNT_ID].tagging_clients
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: clients(), range(32)))
+
+        self.assertEqual([OTHER_ACCOUNT_ROLE], self.sts.assumed_roles)
+
+    def test_prewarm_all_accounts(self):
+        self.assertEqual(2, self.tags_cache.prewarm(["elasticloadbalancing"], 5))
+
+        self.assertEqual({"account": "own"}, self.tags_cache.get(_elb_arn(OWN_ACCOUNT_ID), self.sfx_metrics))
+        self.assertEqual({"account": "other"}, self.tags_cache.get(_elb_arn(OTHER_ACCOUNT_ID), self.sfx_metrics))
+        # lookups are served by the tags fetched in advance
+        self.assertEqual(1, len(self.own_client.requests))
+        self.assertEqual(1, len(self.other_client.requests))
+
+    def test_metrics_summed_across_accounts(self):
+        self.tags_cache.get(_elb_arn(OWN_ACCOUNT_ID), self.sfx_metrics)
+        self.tags_cache.get(_elb_arn(OTHER_ACCOUNT_ID), self.sfx_metrics)
+
+        self.tags_cache.send_metrics(self.sfx_metrics)
+
+        counters = dict(self.sfx_metrics.counters.call_args_list[-1][0])
+        gauges = dict(self.sfx_metrics.gauges.call_args_list[-1][0])
+        self.assertEqual(2, counters["sf.org.awsLogCollector.num.tagCacheHits"])
+        self.assertEqual(2, gauges["sf.org.awsLogCollector.tagCacheEntries"])
+
+
+if __name__ == "__main__":
+    unittest.main()
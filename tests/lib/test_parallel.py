@@ -0,0 +1,146 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import threading
+import time
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock
+
+from aws_log_collector.lib.parallel import merge, pipelined_map, StageStats
+
+
+def _producer(name, items, delay_seconds=0.0):
+    def produce():
+        for i in range(items):
+            time.sleep(delay_seconds)
+            yield f"{name}-{i}"
+
+    return produce
+
+
+class MergeSuite(TestCase):
+
+    def test_yields_items_of_all_producers(self):
+        producers = [_producer(name, 100) for name in ("a", "b", "c")]
+
+        items = list(merge(producers, max_workers=2, max_pending_items=10))
+
+        self.assertEqual(300, len(items))
+        for name in ("a", "b", "c"):
+            self.assertEqual([f"{name}-{i}" for i in range(100)], [item for item in items if item[0] == name])
+
+    def test_runs_producers_in_parallel(self):
+        producers = [_producer(name, 5, delay_seconds=0.05) for name in ("a", "b", "c", "d")]
+
+        start = time.perf_counter()
+        items = list(merge(producers, max_workers=4))
+        elapsed_seconds = time.perf_counter() - start
+
+        self.assertEqual(20, len(items))
+        self.assertLess(elapsed_seconds, 4 * 5 * 0.05 / 2)
+
+    def test_serial_with_single_worker(self):
+        producers = [_producer(name, 3) for name in ("a", "b")]
+
+        self.assertEqual(["a-0", "a-1", "a-2", "b-0", "b-1", "b-2"], list(merge(producers, max_workers=1)))
+
+    def test_producer_exception_is_raised_to_consumer(self):
+        def failing():
+            yield "x"
+            raise ValueError("broken object")
+
+        with self.assertRaises(ValueError):
+            list(merge([failing, _producer("a", 1000, delay_seconds=0.001)], max_workers=2, max_pending_items=1))
+
+    def test_closing_stops_producers(self):
+        produced = []
+        threads = set(threading.enumerate())
+
+        def endless():
+            while True:
+                produced.append(1)
+                yield len(produced)
+
+        items = merge([endless, endless], max_workers=2, max_pending_items=1)
+        next(items)
+        items.close()
+        produced_after_close = len(produced)
+        time.sleep(0.2)
+
+        self.assertEqual(produced_after_close, len(produced))
+        # threads of other tests may still be finishing, so only new ones are checked
+        self.assertEqual(set(), set(threading.enumerate()) - threads)
+
+
+class PipelinedMapSuite(TestCase):
+
+    def test_keeps_order_of_items(self):
+        def transform(item):
+            time.sleep(random.random() / 1000)
+            return item * 2
+
+        self.assertEqual([i * 2 for i in range(200)], list(pipelined_map(transform, range(200), workers=4)))
+
+    def test_without_workers(self):
+        self.assertEqual([1, 2, 3], list(pipelined_map(lambda item: item + 1, iter([0, 1, 2]), workers=0)))
+
+    def test_bounds_items_in_flight(self):
+        read = []
+
+        def items():
+            for i in range(1000):
+                read.append(i)
+                yield i
+
+        results = pipelined_map(lambda item: item, items(), workers=2, max_pending_items=2)
+        next(results)
+        time.sleep(0.2)
+
+        # in flight items, the one held by the reader and the one taken by the consumer
+        self.assertLessEqual(len(read), 2 * 2 + 2 + 2)
+        results.close()
+
+    def test_exceptions_are_raised_to_consumer(self):
+        def failing_items():
+            yield 1
+            raise IOError("connection reset")
+
+        def failing_transform(item):
+            raise ValueError(item)
+
+        self.assertRaises(IOError, list, pipelined_map(lambda item: item, failing_items(), workers=2))
+        self.assertRaises(ValueError, list, pipelined_map(failing_transform, range(10), workers=2))
+
+    def test_reports_stall_of_stages(self):
+        read_stats, transform_stats = StageStats("read"), StageStats("parse")
+
+        def slow_transform(item):
+            time.sleep(0.01)
+            return item
+
+        list(pipelined_map(slow_transform, range(20), workers=1, max_pending_items=1,
+                           read_stats=read_stats, transform_stats=transform_stats))
+
+        self.assertGreater(read_stats.stall_seconds, 0.05)
+        self.assertEqual(1, read_stats.max_queue_depth)
+
+        sfx_metrics = Mock()
+        read_stats.send_metrics(sfx_metrics)
+        sfx_metrics.gauges.assert_called_with(("sf.org.awsLogCollector.pipeline.readQueueDepth", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
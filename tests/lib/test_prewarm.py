@@ -0,0 +1,71 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock
+
+from aws_log_collector.lib.prewarm import Prewarm
+from tests.utils import FakeClock
+
+
+class PrewarmSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.clock = FakeClock(100.0)
+        self.prewarm = Prewarm(5, clock=self.clock)
+
+    def test_steps_share_time_budget(self):
+        given_seconds = []
+
+        def step(remaining_seconds):
+            given_seconds.append(remaining_seconds)
+            self.clock.sleep(3)
+
+        self.prewarm.run("connection", step)
+        self.prewarm.run("tags", step)
+        self.prewarm.run("parsers", step)
+
+        self.assertEqual([5, 2], given_seconds)
+        self.assertEqual({"connection": 3, "tags": 3}, self.prewarm.durations)
+        self.assertEqual(["parsers"], self.prewarm.skipped)
+
+    def test_failed_step(self):
+        def step(_):
+            self.clock.sleep(1)
+            raise IOError("connection refused")
+
+        self.prewarm.run("connection", step)
+        self.prewarm.run("parsers", lambda _: self.clock.sleep(0.25))
+
+        self.assertEqual(["connection"], self.prewarm.failed)
+        self.assertEqual({"parsers": 0.25}, self.prewarm.durations)
+
+    def test_metrics_sent_by_first_invocation(self):
+        sfx_metrics = Mock()
+        self.prewarm.run("connection", lambda _: self.clock.sleep(0.12))
+        self.prewarm.run("tags", lambda _: self.clock.sleep(1.5))
+
+        self.prewarm.send_metrics(sfx_metrics)
+        self.prewarm.send_metrics(sfx_metrics)
+
+        sfx_metrics.gauges.assert_called_once_with(("sf.org.awsLogCollector.prewarm.savedMillis", 1620),
+                                                   ("sf.org.awsLogCollector.prewarm.connectionMillis", 120),
+                                                   ("sf.org.awsLogCollector.prewarm.tagsMillis", 1500))
+        sfx_metrics.counters.assert_called_once_with(("sf.org.awsLogCollector.num.prewarm.skippedSteps", 0),
+                                                     ("sf.org.awsLogCollector.num.prewarm.failedSteps", 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
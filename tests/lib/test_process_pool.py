@@ -0,0 +1,107 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import random
+import unittest
+from unittest import TestCase
+
+import time
+
+from aws_log_collector.lib.process_pool import ProcessPool
+
+
+def _slow_square(item):
+    # results of later items are often ready first
+    time.sleep(random.random() / 100)
+    return os.getpid(), item * item
+
+
+def _fail_on_three(item):
+    if item == 3:
+        raise ValueError("three")
+    return item
+
+
+def _exit_on_three(item):
+    if item == 3:
+        os._exit(1)
+    return item
+
+
+class ProcessPoolSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.pools = []
+
+    def tearDown(self) -> None:
+        for pool in self.pools:
+            pool.close()
+
+    def test_results_in_order(self):
+        pool = self._pool(3, _slow_square)
+
+        results = list(pool.map(range(50)))
+
+        self.assertEqual([item * item for item in range(50)], [square for _, square in results])
+        self.assertEqual(3, len(set(pid for pid, _ in results)))
+        self.assertNotIn(os.getpid(), set(pid for pid, _ in results))
+        # processes stay warm
+        self.assertEqual([16], [square for _, square in pool.map([4])])
+
+    def test_handler_error(self):
+        pool = self._pool(2, _fail_on_three)
+
+        with self.assertRaisesRegex(RuntimeError, "ValueError: three"):
+            list(pool.map(range(10)))
+        self.assertEqual([5, 6], list(pool.map([5, 6])))
+
+    def test_consumer_stops_early(self):
+        pool = self._pool(2, _slow_square)
+
+        results = pool.map(range(10))
+        next(results)
+        results.close()
+
+        # results of items pending when the consumer stopped are not received by the next map
+        self.assertEqual([49], [square for _, square in pool.map([7])])
+
+    def test_exited_process_breaks_pool(self):
+        pool = self._pool(2, _exit_on_three)
+
+        self.assertTrue(pool.acquire())
+        with self.assertRaises(RuntimeError):
+            list(pool.map(range(10)))
+        pool.release()
+
+        self.assertTrue(pool.broken)
+        self.assertFalse(pool.acquire())
+
+    def test_single_user(self):
+        pool = self._pool(1, _slow_square)
+
+        self.assertTrue(pool.acquire())
+        self.assertFalse(pool.acquire())
+        pool.release()
+        self.assertTrue(pool.acquire())
+        pool.release()
+
+    def _pool(self, processes, handler):
+        pool = ProcessPool(processes, handler)
+        self.pools.append(pool)
+        return pool
+
+
+if __name__ == "__main__":
+    unittest.main()
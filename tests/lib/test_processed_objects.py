@@ -0,0 +1,141 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import time
+
+from aws_log_collector.lib.processed_objects import create_processed_objects, DynamoDbStore, FileStore, MemoryStore, \
+    object_id, ProcessedObjects, REPROCESS, RESUME, SKIP
+
+RECORD = {"s3": {"bucket": {"name": "logs"},
+                 "object": {"key": "AWSLogs/a+b.log", "size": 1024, "eTag": "0c47", "sequencer": "005FBE"}}}
+CONTINUATION = dict(RECORD, awsLogCollectorCheckpoint={"lines": 512})
+
+
+class ProcessedObjectsSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.sfx_metrics = Mock()
+
+    def test_object_id(self):
+        self.assertEqual("logs/AWSLogs/a b.log/0c47/005FBE", object_id(RECORD))
+        self.assertEqual("logs/a.log//", object_id({"s3": {"bucket": {"name": "logs"}, "object": {"key": "a.log"}}}))
+
+    def test_complete_objects_are_skipped_once_committed(self):
+        processed_objects = ProcessedObjects(MemoryStore(60))
+
+        self.assertEqual(0, processed_objects.start(RECORD, self.sfx_metrics))
+        processed_objects.complete(RECORD)
+        self.assertEqual(0, processed_objects.start(RECORD, self.sfx_metrics))
+        processed_objects.commit()
+
+        self.assertIsNone(processed_objects.start(RECORD, self.sfx_metrics))
+        self.assertIsNone(processed_objects.start(CONTINUATION, self.sfx_metrics))
+        self.sfx_metrics.inc_counter.assert_called_with("sf.org.awsLogCollector.num.s3.duplicateObjects")
+
+    def test_discarded_marks_are_not_stored(self):
+        processed_objects = ProcessedObjects(MemoryStore(60))
+
+        processed_objects.complete(RECORD)
+        processed_objects.discard()
+        processed_objects.commit()
+
+        self.assertEqual(0, processed_objects.start(RECORD, self.sfx_metrics))
+
+    def test_partial_policies(self):
+        for policy, expected_lines in [(SKIP, None), (RESUME, 256), (REPROCESS, 0)]:
+            with self.subTest(policy=policy):
+                processed_objects = ProcessedObjects(MemoryStore(60), policy)
+                processed_objects.partial(RECORD, 256)
+                processed_objects.commit()
+
+                self.assertEqual(expected_lines, processed_objects.start(RECORD, self.sfx_metrics))
+                # the continuation forwards the rest
+                self.assertEqual(512, processed_objects.start(CONTINUATION, self.sfx_metrics))
+
+    def test_store_failures(self):
+        store = Mock()
+        store.get.side_effect = IOError("throttled")
+        store.put.side_effect = IOError("throttled")
+        processed_objects = ProcessedObjects(store)
+
+        self.assertEqual(512, processed_objects.start(CONTINUATION, self.sfx_metrics))
+        processed_objects.complete(RECORD)
+        processed_objects.commit()
+
+    def test_create(self):
+        self.assertIsNone(create_processed_objects("", 60))
+        self.assertIsInstance(create_processed_objects("memory", 60), ProcessedObjects)
+        self.assertIsInstance(create_processed_objects("dynamodb:processed-objects", 60, RESUME), ProcessedObjects)
+        self.assertRaises(ValueError, create_processed_objects, "dynamodb", 60)
+        self.assertRaises(ValueError, create_processed_objects, "redis:localhost", 60)
+        self.assertRaises(ValueError, create_processed_objects, "memory", 60, "ignore")
+
+
+class StoreSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def test_stores(self):
+        for store in [MemoryStore(60), FileStore(self.directory, 60)]:
+            with self.subTest(store=type(store).__name__):
+                self.assertIsNone(store.get("logs/a.log//"))
+                store.put("logs/a.log//", {"status": "partial", "lines": 256})
+                store.put("logs/a.log//", {"status": "complete"})
+                self.assertEqual({"status": "complete"}, store.get("logs/a.log//"))
+                self.assertIsNone(store.get("logs/b.log//"))
+
+    def test_file_store_expiry(self):
+        store = FileStore(self.directory, -1)
+        store.put("logs/a.log//", {"status": "complete"})
+
+        self.assertIsNone(store.get("logs/a.log//"))
+        # shared by processes of the host
+        self.assertIsNone(FileStore(self.directory, 60).get("logs/a.log//"))
+
+    def test_dynamodb_store(self):
+        client = Mock()
+        store = DynamoDbStore("processed-objects", 60, client)
+        client.get_item.return_value = {"Item": {"id": {"S": "logs/a.log//"}, "status": {"S": "partial"},
+                                                 "lines": {"N": "256"}, "expiresAt": {"N": "1607371375"}}}
+
+        with patch.object(time, "time", return_value=1607371315.177):
+            store.put("logs/a.log//", {"status": "partial", "lines": 256})
+            state = store.get("logs/a.log//")
+
+        client.put_item.assert_called_once_with(TableName="processed-objects", Item={
+            "id": {"S": "logs/a.log//"}, "status": {"S": "partial"}, "expiresAt": {"N": "1607371375"},
+            "lines": {"N": "256"}})
+        self.assertEqual({"status": "partial", "lines": 256}, state)
+        client.get_item.assert_called_once_with(TableName="processed-objects", Key={"id": {"S": "logs/a.log//"}},
+                                                ConsistentRead=True)
+
+        client.get_item.return_value = {}
+        self.assertIsNone(store.get("logs/a.log//"))
+        client.get_item.return_value = {"Item": {"id": {"S": "logs/a.log//"}, "status": {"S": "complete"},
+                                                 "expiresAt": {"N": "1"}}}
+        self.assertIsNone(store.get("logs/a.log//"))
+
+
+if __name__ == "__main__":
+    unittest.main()
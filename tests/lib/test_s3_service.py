@@ -12,16 +12,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gzip
+import os
+import shutil
+import tempfile
 import unittest
+from collections import namedtuple
 from unittest import TestCase
+from unittest.mock import patch
 
-from aws_log_collector.lib.s3_service import S3Service
+from botocore.exceptions import ClientError
+
+from aws_log_collector.lib.s3_service import S3Service, LocalS3Client
+from tests.utils import FaultyS3Client
+
+BUCKET = "integrations-team-logs"
+LINES = ["first line", "zażółć gęślą jaźń €", "", "last line"]
 
 
 class S3ServiceSuite(TestCase):
 
     def setUp(self) -> None:
         self.s3_service = S3Service()
+        self._directory = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self._directory.name, BUCKET, "logs"))
+
+    def tearDown(self) -> None:
+        self._directory.cleanup()
 
     @unittest.skip("uses real bucket/key, must be run with proper AWS profile/permissions")
     def test_read_lines(self):
@@ -31,6 +48,169 @@ class S3ServiceSuite(TestCase):
         for line in self.s3_service.read_lines(bucket, key):
             print(line)
 
+    def test_read_plain_text_lines(self):
+        self._put("logs/plain.log", _text(LINES))
+
+        for chunk_size_bytes in (1, 2, 7, 1024):
+            s3_service = S3Service(LocalS3Client(self._directory.name), chunk_size_bytes)
+            self.assertEqual(LINES, list(s3_service.read_lines(BUCKET, "logs/plain.log")))
+
+    def test_read_gzip_compressed_lines(self):
+        self._put("logs/compressed", gzip.compress(_text(LINES)))
+
+        for chunk_size_bytes in (1, 5, 1024):
+            s3_service = S3Service(LocalS3Client(self._directory.name), chunk_size_bytes)
+            self.assertEqual(LINES, list(s3_service.read_lines(BUCKET, "logs/compressed")))
+
+    def test_read_multi_member_gzip(self):
+        data = b"".join(gzip.compress(_text([line])) for line in LINES)
+        self._put("logs/multi-member.log.gz", data)
+
+        s3_service = S3Service(LocalS3Client(self._directory.name), 16)
+        self.assertEqual(LINES, list(s3_service.read_lines(BUCKET, "logs/multi-member.log.gz")))
+
+    def test_truncated_gzip(self):
+        data = b"".join(gzip.compress(_text([line])) for line in LINES)
+        self._put("logs/truncated.log.gz", data[:-5])
+
+        for chunk_size_bytes in (1, 16, 1024):
+            s3_service = S3Service(LocalS3Client(self._directory.name), chunk_size_bytes)
+            with self.assertRaises(EOFError):
+                list(s3_service.read_lines(BUCKET, "logs/truncated.log.gz"))
+
+    def test_last_line_without_new_line_and_windows_new_lines(self):
+        self._put("logs/crlf.log", b"first\r\nsecond\r\nthird")
+
+        s3_service = S3Service(LocalS3Client(self._directory.name), 4)
+        self.assertEqual(["first", "second", "third"], list(s3_service.read_lines(BUCKET, "logs/crlf.log")))
+
+    def test_empty_object(self):
+        self._put("logs/empty.log", b"")
+
+        s3_service = S3Service(LocalS3Client(self._directory.name))
+        self.assertEqual([], list(s3_service.read_lines(BUCKET, "logs/empty.log")))
+
+    def test_large_compressed_object(self):
+        lines = [f"{i} " + "x" * (i % 300) for i in range(50000)]
+        self._put("logs/large.log.gz", gzip.compress(_text(lines)))
+
+        s3_service = S3Service(LocalS3Client(self._directory.name), 64 * 1024)
+        self.assertEqual(lines, list(s3_service.read_lines(BUCKET, "logs/large.log.gz")))
+
+    def test_download_large_object_in_parts(self):
+        lines = [f"{i} " + "x" * (i % 300) for i in range(5000)]
+        data = gzip.compress(_text(lines))
+        self._put("logs/large.log.gz", data)
+        client = RecordingClient(self._directory.name)
+
+        s3_service = S3Service(client, 4096, download_threshold_bytes=len(data) - 1,
+                               download_part_size_bytes=10000, download_concurrency=4,
+                               download_directory=self._directory.name)
+
+        self.assertEqual(lines, list(s3_service.read_lines(BUCKET, "logs/large.log.gz", len(data))))
+        self.assertEqual((len(data) + 9999) // 10000, len(client.ranges))
+        self.assertEqual("bytes=0-9999", client.ranges[0])
+
+    def test_stream_object_below_threshold_or_of_unknown_size(self):
+        self._put("logs/plain.log", _text(LINES))
+        client = RecordingClient(self._directory.name)
+        s3_service = S3Service(client, download_threshold_bytes=1024, download_part_size_bytes=8)
+
+        self.assertEqual(LINES, list(s3_service.read_lines(BUCKET, "logs/plain.log", len(_text(LINES)))))
+        self.assertEqual(LINES, list(s3_service.read_lines(BUCKET, "logs/plain.log")))
+        self.assertEqual([None, None], client.ranges)
+
+    def test_stream_when_download_directory_is_full(self):
+        data = _text(LINES)
+        self._put("logs/plain.log", data)
+        client = RecordingClient(self._directory.name)
+        s3_service = S3Service(client, download_threshold_bytes=1, download_part_size_bytes=8)
+        disk_usage = namedtuple("usage", "total used free")(100 * 1024 * 1024, 100 * 1024 * 1024, 0)
+
+        with patch.object(shutil, "disk_usage", return_value=disk_usage):
+            self.assertEqual(LINES, list(s3_service.read_lines(BUCKET, "logs/plain.log", len(data))))
+        self.assertEqual([None], client.ranges)
+
+    def test_resume_stream_after_connection_reset(self):
+        lines = [f"{i} " + "x" * (i % 300) for i in range(5000)]
+        data = gzip.compress(_text(lines))
+        self._put("logs/large.log.gz", data)
+        client = FaultyS3Client(LocalS3Client(self._directory.name), fail_after_bytes=5000, failures=2)
+        s3_service = S3Service(client, 4096, resume_backoff_seconds=0)
+
+        self.assertEqual(lines, list(s3_service.read_lines(BUCKET, "logs/large.log.gz")))
+        self.assertEqual([None, "bytes=5000-", "bytes=10000-"], [request.get("Range") for request in client.requests])
+        etag = LocalS3Client(self._directory.name).get_object(Bucket=BUCKET, Key="logs/large.log.gz")["ETag"]
+        self.assertEqual([None, etag, etag], [request.get("IfMatch") for request in client.requests])
+
+    def test_resume_downloaded_parts(self):
+        lines = [f"{i} " + "x" * (i % 300) for i in range(5000)]
+        data = gzip.compress(_text(lines))
+        self._put("logs/large.log.gz", data)
+        client = FaultyS3Client(LocalS3Client(self._directory.name), fail_after_bytes=3000, failures=3)
+        s3_service = S3Service(client, 1024, download_threshold_bytes=1, download_part_size_bytes=10000,
+                               download_concurrency=4, download_directory=self._directory.name,
+                               resume_backoff_seconds=0)
+
+        self.assertEqual(lines, list(s3_service.read_lines(BUCKET, "logs/large.log.gz", len(data))))
+        parts = (len(data) + 9999) // 10000
+        self.assertEqual(parts + 3, len(client.requests))
+        # failed parts are resumed where they stopped, a resumed request may fail again
+        starts = [int(request["Range"][len("bytes="):].split("-")[0]) for request in client.requests]
+        resumed_starts = [start for start in starts if start % 10000 != 0]
+        self.assertEqual(3, len(resumed_starts))
+        self.assertTrue(all(start - 3000 in starts for start in resumed_starts))
+
+    def test_resume_attempts_are_bounded(self):
+        self._put("logs/plain.log", _text(LINES))
+        client = FaultyS3Client(LocalS3Client(self._directory.name), fail_after_bytes=1, failures=4)
+        s3_service = S3Service(client, 1, resume_attempts=3, resume_backoff_seconds=0)
+
+        with self.assertRaises(ConnectionResetError):
+            list(s3_service.read_lines(BUCKET, "logs/plain.log"))
+        self.assertEqual(4, len(client.requests))
+
+    def test_other_errors_are_not_resumed(self):
+        self._put("logs/plain.log", _text(LINES))
+        client = FaultyS3Client(LocalS3Client(self._directory.name), fail_after_bytes=4,
+                                error=PermissionError(13, "Permission denied"))
+        s3_service = S3Service(client, 4, resume_backoff_seconds=0)
+
+        with self.assertRaises(PermissionError):
+            list(s3_service.read_lines(BUCKET, "logs/plain.log"))
+        self.assertEqual(1, len(client.requests))
+
+    def test_not_resumed_when_object_changed(self):
+        self._put("logs/plain.log", _text(LINES))
+        client = FaultyS3Client(LocalS3Client(self._directory.name), fail_after_bytes=4)
+        s3_service = S3Service(client, 4, resume_backoff_seconds=0)
+
+        chunks = s3_service._read(BUCKET, "logs/plain.log")
+        self.assertEqual(b"firs", next(chunks))
+        self._put("logs/plain.log", _text(["other", "lines"]))
+
+        with self.assertRaisesRegex(ClientError, "PreconditionFailed"):
+            next(chunks)
+
+    def _put(self, key, data):
+        with open(os.path.join(self._directory.name, BUCKET, key), "wb") as file:
+            file.write(data)
+
+
+class RecordingClient(LocalS3Client):
+
+    def __init__(self, root_directory):
+        super().__init__(root_directory)
+        self.ranges = []
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        self.ranges.append(Range)
+        return super().get_object(Bucket, Key, Range, **kwargs)
+
+
+def _text(lines):
+    return "".join(line + "\n" for line in lines).encode("utf-8")
+
 
 if __name__ == "__main__":
     unittest.main()
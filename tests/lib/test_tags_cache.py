@@ -0,0 +1,360 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import tracemalloc
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from aws_log_collector.lib.tags_cache import TagsCache, TagSets
+
+LAMBDA_ARN = "arn:aws:lambda:us-east-1:134183635603:function:my-function"
+LAMBDA_TAGS = {"team": "integrations", "env": "prod"}
+BUCKET_ARN = "arn:aws:s3:::integrations-team"
+BUCKET_TAGS = {"team": "integrations"}
+
+
+@patch.object(TagsCache, "_build_cache")
+class TagsCacheSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.sfx_metrics = Mock()
+
+    def test_get_tags(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS})
+        tags_cache = TagsCache(60)
+
+        self.assertEqual(LAMBDA_TAGS, tags_cache.get(LAMBDA_ARN.upper(), self.sfx_metrics))
+        self.assertEqual(1, build_cache_mock.call_count)
+
+    def test_negative_entry_for_arn_without_tags(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS})
+        tags_cache = TagsCache(60, negative_cache_ttl_seconds=10)
+
+        self.assertEqual(None, tags_cache.get(LAMBDA_ARN + "-untagged", self.sfx_metrics))
+        self.assertEqual(None, tags_cache.get(LAMBDA_ARN + "-untagged", self.sfx_metrics))
+
+        self.assertEqual(1, tags_cache.untagged_arns.misses)
+        self.assertEqual(1, tags_cache.negative_hits)
+        self.assertEqual(1, len(tags_cache.tags_by_arn))
+
+    def test_negative_entries_do_not_evict_tags(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({f"{LAMBDA_ARN}-{i}": LAMBDA_TAGS for i in range(10)})
+        max_size_bytes = 10 * TagsCache._size_of_entry(f"{LAMBDA_ARN}-0", LAMBDA_TAGS) \
+                         + TagsCache._size_of_tag_set(LAMBDA_TAGS)
+        tags_cache = TagsCache(60, max_size_bytes=max_size_bytes, negative_cache_max_entries=5)
+
+        for i in range(100):
+            self.assertEqual(None, tags_cache.get(f"{LAMBDA_ARN}-untagged-{i}", self.sfx_metrics))
+
+        self.assertEqual(LAMBDA_TAGS, tags_cache.get(f"{LAMBDA_ARN}-0", self.sfx_metrics))
+        self.assertEqual(0, tags_cache.tags_by_arn.evictions)
+        self.assertEqual(5, len(tags_cache.untagged_arns))
+
+    def test_skip_lookup_of_resource_types_not_in_cache(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS, BUCKET_ARN: BUCKET_TAGS})
+        tags_cache = TagsCache(60)
+
+        self.assertEqual(BUCKET_TAGS, tags_cache.get(BUCKET_ARN, self.sfx_metrics))
+        self.assertEqual(None, tags_cache.get(BUCKET_ARN + "/some/object.jpeg", self.sfx_metrics))
+        self.assertEqual(None, tags_cache.get(
+            "arn:aws:elasticloadbalancing:us-east-2:840385940912:loadbalancer/app/my-lb/50dc6c495c0c9188",
+            self.sfx_metrics))
+        self.assertEqual(None, tags_cache.get(LAMBDA_ARN + "-untagged", self.sfx_metrics))
+
+        self.assertEqual(2, tags_cache.lookups_skipped)
+        self.assertEqual(1, tags_cache.untagged_arns.misses)
+        self.assertEqual(2, len(tags_cache.tags_by_arn))
+
+    def test_may_have_tags(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({BUCKET_ARN: BUCKET_TAGS})
+        tags_cache = TagsCache(60)
+
+        # not fetched yet
+        self.assertTrue(tags_cache.may_have_tags(BUCKET_ARN + "/some/object.jpeg"))
+        tags_cache.get(BUCKET_ARN, self.sfx_metrics)
+
+        self.assertTrue(tags_cache.may_have_tags("arn:aws:s3:::other-bucket"))
+        self.assertFalse(tags_cache.may_have_tags(BUCKET_ARN + "/some/object.jpeg"))
+        self.assertFalse(tags_cache.may_have_tags("arn:aws:sqs:us-east-1:134183635603:queue"))
+        self.assertFalse(tags_cache.may_have_tags("not-an-arn"))
+        self.assertEqual(1, build_cache_mock.call_count)
+
+    def test_resource_type_prefix(self, _):
+        self.assertEqual("arn:aws:s3:::", TagsCache._resource_type_prefix(BUCKET_ARN))
+        self.assertEqual("arn:aws:s3:::integrations-team", TagsCache._resource_type_prefix(BUCKET_ARN + "/a/b"))
+        self.assertEqual("arn:aws:lambda:us-east-1:134183635603:function", TagsCache._resource_type_prefix(LAMBDA_ARN))
+        self.assertEqual("arn:aws:apigateway:us-east-1::",
+                         TagsCache._resource_type_prefix("arn:aws:apigateway:us-east-1::/restapis/x/stages/prod"))
+        self.assertEqual(None, TagsCache._resource_type_prefix("not-an-arn"))
+
+    def test_refresh_after_ttl(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS})
+        tags_cache = TagsCache(60)
+        tags_cache.get(LAMBDA_ARN, self.sfx_metrics)
+
+        tags_cache.namespaces["lambda"].last_fetch_time -= 61
+        build_cache_mock.side_effect = _by_namespace({})
+
+        self.assertEqual(None, tags_cache.get(LAMBDA_ARN, self.sfx_metrics))
+        self.assertEqual(2, build_cache_mock.call_count)
+
+    def test_namespaces_are_refreshed_independently(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS, BUCKET_ARN: BUCKET_TAGS})
+        tags_cache = TagsCache(60, namespace_ttl_seconds={"lambda": 10})
+        tags_cache.get(LAMBDA_ARN, self.sfx_metrics)
+        tags_cache.get(BUCKET_ARN, self.sfx_metrics)
+
+        for namespace in tags_cache.namespaces.values():
+            namespace.last_fetch_time -= 11
+        tags_cache.get(LAMBDA_ARN, self.sfx_metrics)
+        tags_cache.get(BUCKET_ARN, self.sfx_metrics)
+
+        refreshed_namespaces = [args[0] for args, _ in build_cache_mock.call_args_list]
+        self.assertEqual(["lambda", "s3", "lambda"], refreshed_namespaces)
+
+    def test_early_refresh_when_lookups_miss(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS})
+        tags_cache = TagsCache(60, miss_rate_refresh_threshold=0.5, miss_rate_min_lookups=4,
+                               miss_rate_min_refresh_interval_seconds=0)
+        tags_cache.get(LAMBDA_ARN, self.sfx_metrics)
+        tags_cache.get(LAMBDA_ARN, self.sfx_metrics)
+        tags_cache.get(LAMBDA_ARN + "-new", self.sfx_metrics)
+
+        build_cache_mock.side_effect = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS, LAMBDA_ARN + "-new": LAMBDA_TAGS})
+        self.assertEqual(None, tags_cache.get(LAMBDA_ARN + "-other", self.sfx_metrics))
+        self.assertEqual(LAMBDA_TAGS, tags_cache.get(LAMBDA_ARN + "-new", self.sfx_metrics))
+
+        self.assertEqual(2, build_cache_mock.call_count)
+        self.sfx_metrics.inc_counter.assert_any_call("sf.org.awsLogCollector.num.tagCacheMissRateRefresh")
+
+    def test_negative_hits_do_not_refresh_early(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS})
+        tags_cache = TagsCache(60, miss_rate_refresh_threshold=0.5, miss_rate_min_lookups=4,
+                               miss_rate_min_refresh_interval_seconds=0)
+
+        for _ in range(10):
+            self.assertEqual(None, tags_cache.get(LAMBDA_ARN + "-untagged", self.sfx_metrics))
+
+        self.assertEqual(1, build_cache_mock.call_count)
+        self.assertEqual(9, tags_cache.negative_hits)
+
+    def test_lookups_of_other_namespaces_go_on_during_refresh(self, build_cache_mock):
+        fetching_lambda, fetch_lambda = threading.Event(), threading.Event()
+        build_all = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS, BUCKET_ARN: BUCKET_TAGS})
+
+        def build_cache(namespace):
+            if namespace == "lambda":
+                fetching_lambda.set()
+                fetch_lambda.wait()
+            return build_all(namespace)
+
+        build_cache_mock.side_effect = build_cache
+        tags_cache = TagsCache(60)
+        lambda_tags = []
+        lookup = threading.Thread(target=lambda: lambda_tags.append(tags_cache.get(LAMBDA_ARN, self.sfx_metrics)))
+        lookup.start()
+        try:
+            self.assertTrue(fetching_lambda.wait(5))
+            self.assertEqual(BUCKET_TAGS, tags_cache.get(BUCKET_ARN, self.sfx_metrics))
+        finally:
+            fetch_lambda.set()
+            lookup.join()
+
+        self.assertEqual([LAMBDA_TAGS], lambda_tags)
+
+    def test_lookups_wait_for_refresh_of_their_namespace(self, build_cache_mock):
+        fetching, fetch = threading.Event(), threading.Event()
+        build_lambda = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS})
+
+        def build_cache(namespace):
+            fetching.set()
+            fetch.wait()
+            return build_lambda(namespace)
+
+        build_cache_mock.side_effect = build_cache
+        tags_cache = TagsCache(60)
+        tags = []
+
+        def get():
+            tags.append(tags_cache.get(LAMBDA_ARN, self.sfx_metrics))
+
+        lookups = [threading.Thread(target=get) for _ in range(2)]
+        try:
+            lookups[0].start()
+            self.assertTrue(fetching.wait(5))
+            lookups[1].start()
+            # the second lookup must not see the namespace as fetched before its tags are stored
+            lookups[1].join(0.2)
+            self.assertTrue(lookups[1].is_alive())
+        finally:
+            fetch.set()
+            for lookup in lookups:
+                lookup.join()
+
+        self.assertEqual([LAMBDA_TAGS, LAMBDA_TAGS], tags)
+        self.assertEqual(1, build_cache_mock.call_count)
+
+    def test_bounded_size(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({f"{LAMBDA_ARN}-{i}": LAMBDA_TAGS for i in range(100)})
+        max_size_bytes = 10 * TagsCache._size_of_entry(f"{LAMBDA_ARN}-00", LAMBDA_TAGS) \
+                         + TagsCache._size_of_tag_set(LAMBDA_TAGS)
+        tags_cache = TagsCache(60, max_size_bytes=max_size_bytes)
+
+        self.assertEqual(LAMBDA_TAGS, tags_cache.get(f"{LAMBDA_ARN}-99", self.sfx_metrics))
+        self.assertLessEqual(tags_cache.tags_by_arn.size, max_size_bytes)
+        self.assertEqual(90, tags_cache.tags_by_arn.evictions)
+
+    def test_distinct_tag_sets_count_towards_size(self, build_cache_mock):
+        tags_by_arn = {f"{LAMBDA_ARN}-{i}": {"team": f"team-{i}"} for i in range(100)}
+        build_cache_mock.side_effect = _by_namespace(tags_by_arn)
+        entry_bytes = TagsCache._size_of_entry(f"{LAMBDA_ARN}-00", None) \
+                      + TagsCache._size_of_tag_set({"team": "team-00"})
+        tags_cache = TagsCache(60, max_size_bytes=10 * entry_bytes)
+
+        self.assertEqual({"team": "team-99"}, tags_cache.get(f"{LAMBDA_ARN}-99", self.sfx_metrics))
+        self.assertLessEqual(tags_cache.tags_by_arn.size, 10 * entry_bytes)
+        self.assertEqual(90, tags_cache.tags_by_arn.evictions)
+
+    def test_send_metrics_reports_deltas(self, build_cache_mock):
+        build_cache_mock.side_effect = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS})
+        tags_cache = TagsCache(60)
+        tags_cache.get(LAMBDA_ARN, self.sfx_metrics)
+        tags_cache.get(LAMBDA_ARN + "-untagged", self.sfx_metrics)
+        tags_cache.get(LAMBDA_ARN + "-untagged", self.sfx_metrics)
+
+        tags_cache.send_metrics(self.sfx_metrics)
+        tags_cache.send_metrics(self.sfx_metrics)
+
+        first, second = [args for args, _ in self.sfx_metrics.counters.call_args_list]
+        self.assertEqual((("sf.org.awsLogCollector.num.tagCacheHits", 1),
+                          ("sf.org.awsLogCollector.num.tagCacheNegativeHits", 1),
+                          ("sf.org.awsLogCollector.num.tagCacheMisses", 1),
+                          ("sf.org.awsLogCollector.num.tagCacheEvictions", 0),
+                          ("sf.org.awsLogCollector.num.tagCacheLookupsSkipped", 0)), first)
+        self.assertTrue(all(value == 0 for _, value in second))
+
+    def test_prewarm(self, build_cache_mock):
+        fetch_s3 = threading.Event()
+        build_all = _by_namespace({LAMBDA_ARN: LAMBDA_TAGS, BUCKET_ARN: BUCKET_TAGS})
+
+        def build_cache(namespace):
+            if namespace == "s3":
+                fetch_s3.wait(5)
+            return build_all(namespace)
+
+        build_cache_mock.side_effect = build_cache
+        tags_cache = TagsCache(60)
+        bucket_tags = []
+        lookup = threading.Thread(target=lambda: bucket_tags.append(tags_cache.get(BUCKET_ARN, self.sfx_metrics)))
+        try:
+            self.assertEqual(1, tags_cache.prewarm(["lambda", "s3", "unknown"], 0.1))
+
+            self.assertEqual(LAMBDA_TAGS, tags_cache.get(LAMBDA_ARN, self.sfx_metrics))
+            self.assertEqual(0, tags_cache.tags_by_arn.misses)
+            self.assertFalse(tags_cache.namespaces["lambda"].is_expired())
+            # the lookup waits for the fetch not done in time rather than fetch the tags again
+            self.assertTrue(tags_cache.namespaces["s3"].is_expired())
+            lookup.start()
+            lookup.join(0.1)
+            self.assertTrue(lookup.is_alive())
+        finally:
+            fetch_s3.set()
+            if lookup.ident is not None:
+                lookup.join(5)
+
+        self.assertEqual([BUCKET_TAGS], bucket_tags)
+        self.assertEqual(2, build_cache_mock.call_count)
+        self.sfx_metrics.inc_counter.assert_not_called()
+
+
+class TagSetsSuite(TestCase):
+
+    def test_identical_tag_sets_are_shared(self):
+        tag_sets = TagSets()
+        page = _resources_page(0, 10, distinct_tag_sets=2)
+
+        tags_by_arn = TagsCache._parse_get_resources_response_for_tags_by_arn(page, tag_sets)
+
+        self.assertEqual(10, len(tags_by_arn))
+        self.assertEqual(2, len(tag_sets))
+        self.assertIs(tags_by_arn[_arn(0)], tags_by_arn[_arn(2)])
+        self.assertEqual({"team": "team-0", "env": "env-0", "cost-center": "cc-0"}, tags_by_arn[_arn(0)])
+        self.assertRaises(TypeError, tags_by_arn[_arn(0)].__setitem__, "team", "other")
+
+    def test_memory_of_synthetic_large_account(self):
+        resources, distinct_tag_sets = 20000, 50
+
+        def plain_tags_by_arn():
+            # tags representation used before tag sets were interned
+            tags_by_arn = {}
+            for page in _resources_pages(resources, distinct_tag_sets):
+                for aws_resource in page["ResourceTagMappingList"]:
+                    tags_by_arn[aws_resource["ResourceARN"].lower()] = {raw_tag["Key"]: raw_tag["Value"]
+                                                                       for raw_tag in aws_resource["Tags"]}
+            return tags_by_arn
+
+        def interned_tags_by_arn():
+            tags_by_arn, tag_sets = {}, TagSets()
+            for page in _resources_pages(resources, distinct_tag_sets):
+                tags_by_arn.update(TagsCache._parse_get_resources_response_for_tags_by_arn(page, tag_sets))
+            return tags_by_arn
+
+        plain_bytes = _retained_memory(plain_tags_by_arn)
+        interned_bytes = _retained_memory(interned_tags_by_arn)
+
+        self.assertLess(interned_bytes, plain_bytes / 2)
+
+
+def _by_namespace(tags_by_arn):
+    def build_cache(namespace):
+        return {arn: tags for arn, tags in tags_by_arn.items() if arn.split(":")[2] == namespace}
+
+    return build_cache
+
+
+def _arn(i):
+    return f"arn:aws:lambda:us-east-1:134183635603:function:function-{i}"
+
+
+def _resources_page(start, count, distinct_tag_sets):
+    # values are built with f-strings so that every resource gets its own string
+    # objects, just like resources parsed from an API response
+    return {"ResourceTagMappingList": [
+        {"ResourceARN": _arn(i),
+         "Tags": [{"Key": f"{name}", "Value": f"{prefix}-{i % distinct_tag_sets}"}
+                  for name, prefix in (("team", "team"), ("env", "env"), ("cost-center", "cc"))]}
+        for i in range(start, start + count)
+    ]}
+
+
+def _resources_pages(resources, distinct_tag_sets):
+    for start in range(0, resources, 100):
+        yield _resources_page(start, 100, distinct_tag_sets)
+
+
+def _retained_memory(build):
+    tracemalloc.start()
+    try:
+        result = build()
+        retained_bytes, _ = tracemalloc.get_traced_memory()
+        del result
+        return retained_bytes
+    finally:
+        tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+# Copyright 2021 Splunk, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import TestCase
+from unittest.mock import MagicMock, Mock, patch
+
+import time
+
+from aws_log_collector import backfill
+from aws_log_collector.backfill import create_source, LocalDirectorySource, parse_args, RateLimiter, run, \
+    S3BucketSource, S3Object
+from aws_log_collector.lib.client import BatchClient
+from tests.utils import read_text_file
+
+BUCKET = "integrations-team-logs"
+ALB_KEY = "AWSLogs/840385940912/elasticloadbalancing/us-east-2/2016/05/01/840385940912_elasticloadbalancing_" \
+          "us-east-2_app.my-loadbalancer.50dc6c495c0c9188_20140215T2340Z_172.160.001.192_20sg8hgm.log.gz"
+S3_KEY = "logs/ABCDEF12345/s3/2020-11-25-12-27-23-EC390CD533CD5C56"
+UNSUPPORTED_KEY = "other/notes.txt"
+
+
+class BackfillSuite(TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.bucket_directory = os.path.join(self.directory, BUCKET)
+        alb_data = "\n".join(read_text_file("tests/data/e2e/alb.log")).encode("utf-8")
+        self._write(ALB_KEY, gzip.compress(alb_data))
+        self._write(S3_KEY, "\n".join(read_text_file("tests/data/e2e/s3.log")).encode("utf-8"))
+        self._write(UNSUPPORTED_KEY, b"not a log file")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def test_local_directory_objects(self):
+        source = LocalDirectorySource(self.bucket_directory)
+
+        self.assertEqual([ALB_KEY, S3_KEY, UNSUPPORTED_KEY], [s3_object.key for s3_object in source.objects()])
+        self.assertTrue(all(s3_object.bucket == BUCKET for s3_object in source.objects()))
+        self.assertEqual([S3_KEY], [s3_object.key for s3_object in
+                                    LocalDirectorySource(self.bucket_directory, "logs/").objects()])
+
+    @patch.object(BatchClient, "create")
+    def test_send_logs_of_local_directory(self, create_mock):
+        sent_logs = []
+        client = MagicMock()
+        client.__enter__.return_value = client
+        client.send.side_effect = lambda logs: sent_logs.extend(logs) or 0
+        create_mock.return_value = client
+
+        progress = run(self._options("--processes", "0", "--prefix", "AWSLogs/"))
+
+        self.assertEqual(1, progress.objects)
+        self.assertEqual(5, progress.events)
+        self.assertEqual([], progress.failed_keys)
+        self.assertGreater(progress.bytes, 0)
+        hec_events = [json.loads(item) for item in sent_logs]
+        self.assertEqual(read_text_file("tests/data/e2e/alb.log"), [hec_event["event"] for hec_event in hec_events])
+        self.assertEqual({"ApplicationELB"}, set(hec_event["source"] for hec_event in hec_events))
+        self.assertEqual("aws_log_collector_backfill:backfill", hec_events[0]["fields"]["logForwarder"])
+        # the account of the load balancer comes from the object key
+        self.assertEqual("840385940912", hec_events[0]["fields"]["awsAccountId"])
+
+    @patch.object(BatchClient, "create")
+    def test_object_failed_when_batches_not_sent(self, create_mock):
+        client = MagicMock()
+        client.__enter__.return_value = client
+        client.send.side_effect = lambda logs: len(list(logs)) and 1
+        create_mock.return_value = client
+
+        progress = run(self._options("--processes", "0"))
+
+        self.assertEqual(3, progress.objects)
+        # the object which is not a log file sends nothing, so nothing fails
+        self.assertEqual([ALB_KEY, S3_KEY], sorted(progress.failed_keys))
+
+    def test_process_pool(self):
+        progress = run(self._options("--processes", "2", "--dry-run", "--max-events-per-second", "10000"))
+
+        self.assertEqual(3, progress.objects)
+        self.assertEqual(5 + 2, progress.events)
+        # the object is not a log file, but nothing failed
+        self.assertEqual([], progress.failed_keys)
+
+    def test_failed_object(self):
+        os.remove(os.path.join(self.bucket_directory, ALB_KEY))
+        source = LocalDirectorySource(self.bucket_directory)
+        objects = [S3Object(BUCKET, ALB_KEY, 4459), S3Object(BUCKET, S3_KEY)]
+        source.objects = lambda: iter(objects)
+
+        progress = run(self._options("--processes", "0", "--dry-run"), source)
+
+        self.assertEqual([ALB_KEY], progress.failed_keys)
+        self.assertEqual(2, progress.events)
+
+    def _options(self, *args):
+        return parse_args([self.bucket_directory, "--account-id", "134183635603", "--region", "us-east-1",
+                           "--without-tags", *args])
+
+    def _write(self, key, data):
+        path = os.path.join(self.bucket_directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(data)
+
+
+class SourceSuite(TestCase):
+
+    def test_create_source(self):
+        source = create_source("s3://my-logs/AWSLogs/", "134183635603/")
+        self.assertIsInstance(source, S3BucketSource)
+        self.assertRaises(ValueError, create_source, "/nonexistent/directory")
+
+    def test_s3_bucket_objects(self):
+        client = Mock()
+        client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": "AWSLogs/", "Size": 0}, {"Key": "AWSLogs/a.log", "Size": 10}]},
+            {"Contents": [{"Key": "AWSLogs/b b.log", "Size": 20}]},
+            {}
+        ]
+
+        objects = list(create_source("s3://my-logs/AWSLogs/").objects(client))
+
+        client.get_paginator.return_value.paginate.assert_called_once_with(Bucket="my-logs", Prefix="AWSLogs/")
+        self.assertEqual([S3Object("my-logs", "AWSLogs/a.log", 10), S3Object("my-logs", "AWSLogs/b b.log", 20)],
+                         objects)
+        self.assertEqual("AWSLogs/b+b.log", objects[1].to_record()["s3"]["object"]["key"])
+
+
+class RateLimiterSuite(TestCase):
+
+    def test_limits_rate(self):
+        rate_limiter = RateLimiter(10000)
+
+        start = time.monotonic()
+        items = list(rate_limiter.limit(range(4 * backfill.EVENTS_PER_PERMIT)))
+        elapsed_seconds = time.monotonic() - start
+
+        self.assertEqual(4 * backfill.EVENTS_PER_PERMIT, len(items))
+        # the first block is sent right away
+        self.assertGreaterEqual(elapsed_seconds, 3 * backfill.EVENTS_PER_PERMIT / 10000)
+
+    def test_unlimited(self):
+        rate_limiter = RateLimiter(0)
+
+        start = time.monotonic()
+        rate_limiter.acquire(1000000)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -14,27 +14,36 @@
 
 import base64
 import gzip
+import itertools
 import json
 import os
+import threading
 import unittest
+from contextlib import ExitStack
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 
+import requests
 import signalfx
 
 import function
 from function import LogCollector
-from aws_log_collector.lib.client import BatchClient
+from aws_log_collector.lib.client import BatchClient, RetryableClient, SessionPool
+from aws_log_collector.lib.continuation import Deadline, LocalInvoker
 from aws_log_collector.lib.s3_service import S3Service
 from aws_log_collector.lib.tags_cache import TagsCache
-from tests.utils import get_read_lines_mock
+from aws_log_collector.parsers.registry import PARSER_CLASSES
+from tests.utils import get_read_lines_mock, read_text_file
 from tests.enrichers.test_cloudwatch import lambda_context, read_json_file, CUSTOM_TAGS, FORWARDER_FUNCTION_ARN_PREFIX, \
     FORWARDER_FUNCTION_NAME, FORWARDER_FUNCTION_VERSION, AWS_REGION, AWS_ACCOUNT_ID
 
+# the suite replaces BatchClient.send
+BATCH_CLIENT_SEND = BatchClient.send
+
 
 @patch.object(signalfx.SignalFx, "ingest")
 @patch.object(S3Service, "read_lines")
-@patch.object(BatchClient, "send")
+@patch.object(BatchClient, "send", return_value=0)
 @patch.object(TagsCache, "get")
 # TODO should not require connection to AWS
 # @unittest.skipUnless(
@@ -54,6 +63,8 @@ class LogCollectingSuite(TestCase):
         tags_cache_get_mock.return_value = CUSTOM_TAGS
         event, cw_event = self._read_aws_log_event_from_file('tests/data/lambda_log.json')
 
+        sent_logs = self._capture_sent_logs(send_method_mock)
+
         # WHEN
         self.log_forwarder.forward_log(cw_event, lambda_context())
 
@@ -83,7 +94,43 @@ class LogCollectingSuite(TestCase):
             "time": "1595335478.131",
         }
 
-        send_method_mock.assert_called_with([json.dumps(expected_event)])
+        self.assertEqual([json.dumps(expected_event).encode("utf-8")], sent_logs)
+        self._assert_same_as_golden_file("tests/data/e2e/lambda_hec_logs.ndjson", sent_logs)
+
+    def test_kinesis_and_firehose(self, tags_cache_get_mock, send_method_mock, _, __):
+        # GIVEN
+        tags_cache_get_mock.return_value = CUSTOM_TAGS
+        with patch.object(function, "REDACTION_RULE", ""):
+            self.log_forwarder = LogCollector()
+        event, cw_event = self._read_aws_log_event_from_file('tests/data/lambda_log.json')
+        control_message = self._encode(json.dumps({
+            "messageType": "CONTROL_MESSAGE", "owner": "CloudwatchLogs", "logGroup": "", "logStream": "",
+            "subscriptionFilters": [], "logEvents": [
+                {"id": "", "timestamp": 1595335478131, "message": "CWL CONTROL MESSAGE: Checking health of destination"}
+            ]})).decode("ascii")
+        log_data = cw_event["awslogs"]["data"].decode("ascii")
+        payloads = [log_data, control_message, "not base64 gzip", log_data]
+        kinesis_event = {"Records": [
+            {"kinesis": {"partitionKey": "p", "sequenceNumber": str(i), "data": data}, "eventSource": "aws:kinesis",
+             "eventID": f"shardId-000000000000:{i}"} for i, data in enumerate(payloads)]}
+        firehose_event = {"invocationId": "i", "region": "us-east-1",
+                          "deliveryStreamArn": "arn:aws:firehose:us-east-1:134183635603:deliverystream/logs",
+                          "records": [{"recordId": str(i), "approximateArrivalTimestamp": 1595335478131, "data": data}
+                                      for i, data in enumerate(payloads)]}
+        sent_logs = self._capture_sent_logs(send_method_mock)
+
+        # WHEN
+        kinesis_response = self.log_forwarder.forward_log(kinesis_event, lambda_context())
+        firehose_response = self.log_forwarder.forward_log(firehose_event, lambda_context())
+
+        # THEN
+        self.assertIsNone(kinesis_response)
+        self.assertEqual({"records": [{"recordId": str(i), "result": "ProcessingFailed" if i == 2 else "Ok",
+                                       "data": data} for i, data in enumerate(payloads)]}, firehose_response)
+        sent_events = self._parse_hec_events_to_json(sent_logs)
+        self.assertEqual([event["logEvents"][0]["message"]] * 4, [sent_event["event"] for sent_event in sent_events])
+        # log entries of all records of an invocation are sent together
+        self.assertEqual(2, send_method_mock.call_count)
 
     def test_s3_s3(self, tags_cache_get_mock, send_method_mock, s3_service_read_lines_mock, _):
         scenario = {
@@ -130,6 +177,228 @@ class LogCollectingSuite(TestCase):
         }
         self._test_s3_logs_handling(tags_cache_get_mock, send_method_mock, s3_service_read_lines_mock, scenario)
 
+    def test_s3_alb_parsed_by_processes(self, tags_cache_get_mock, send_method_mock, s3_service_read_lines_mock, _):
+        # GIVEN
+        arn_to_tags = {
+            "arn:aws:elasticloadbalancing:us-east-2:840385940912:loadbalancer/app/my-loadbalancer/50dc6c495c0c9188":
+                {"elb-a": 1, "elb-b": "one"},
+            "arn:aws:elasticloadbalancing:us-east-2:840385940912:targetgroup/my-targets/73e2d6bc24d8a067":
+                {"tg-a": 10, "tg-b": "ten"}
+        }
+        with patch.object(function, "S3_PARSE_PROCESSES", 2), \
+                patch.object(function, "S3_PARSE_PROCESSES_THRESHOLD_BYTES", 0), \
+                patch.object(function, "INCLUDE_LOG_FIELDS", False):
+            self.log_forwarder = LogCollector()
+        # configured once processes are started, so lines have to be enriched by this process
+        tags_cache_get_mock.side_effect = lambda arn, _: arn_to_tags.get(arn)
+        s3_event = read_json_file("tests/data/e2e/alb_event.json")
+        s3_service_read_lines_mock.side_effect = get_read_lines_mock("tests/data/e2e/alb.log")
+        sent_logs = self._capture_sent_logs(send_method_mock)
+
+        # WHEN
+        with patch("aws_log_collector.converters.s3.LINES_PER_CHUNK", 2):
+            self.log_forwarder.forward_log(s3_event, lambda_context())
+
+        # THEN
+        self._assert_same_as_golden_file("tests/data/e2e/alb_hec_logs.ndjson", sent_logs)
+
+    def test_s3_alb_deferred_enrichment(self, tags_cache_get_mock, send_method_mock, s3_service_read_lines_mock, _):
+        # GIVEN
+        with patch.object(function, "DEFERRED_ENRICHMENT_NAMESPACES", "ApplicationELB"):
+            self.log_forwarder = LogCollector()
+        elb_arn = "arn:aws:elasticloadbalancing:us-east-2:840385940912:loadbalancer/app/my-loadbalancer/50dc6c495c0c9188"
+        tags_cache_get_mock.side_effect = lambda arn, _: {"elb-a": 1, "elb-b": "one"} if arn == elb_arn else None
+        s3_service_read_lines_mock.side_effect = get_read_lines_mock("tests/data/e2e/alb.log")
+        sent_logs = self._capture_sent_logs(send_method_mock)
+
+        # WHEN
+        self.log_forwarder.forward_log(read_json_file("tests/data/e2e/alb_event.json"), lambda_context())
+
+        # THEN
+        expected_hec_events = read_json_file("tests/data/e2e/alb_hec_items.json")
+        for expected_hec_event in expected_hec_events:
+            for tag in ("elb-a", "elb-b", "tg-a", "tg-b"):
+                expected_hec_event["fields"].pop(tag, None)
+        actual_hec_events = self._parse_hec_events_to_json(sent_logs)
+        self.assertEqual(expected_hec_events, actual_hec_events[:len(expected_hec_events)])
+
+        tag_dimension_events = actual_hec_events[len(expected_hec_events):]
+        self.assertEqual(1, len(tag_dimension_events))
+        self.assertEqual("aws:tags", tag_dimension_events[0]["sourcetype"])
+        self.assertEqual(elb_arn, tag_dimension_events[0]["fields"]["elbArn"])
+        self.assertEqual("one", tag_dimension_events[0]["fields"]["elb-b"])
+
+    def test_s3_multiple_records(self, tags_cache_get_mock, send_method_mock, s3_service_read_lines_mock, _):
+        # GIVEN
+        arn_to_tags = {
+            "arn:aws:s3:::integrations-team":
+                {"bucket-tag-1": 1, "bucket-tag-2": "abc"},
+            "arn:aws:s3:::integrations-team/WhatsApp Image 2020-07-05 at 18.34.43.jpeg":
+                {"object-tag-1": 10, "object-tag-2": "def"}
+        }
+        tags_cache_get_mock.side_effect = lambda arn, _: arn_to_tags.get(arn)
+        s3_event = read_json_file("tests/data/e2e/s3_event.json")
+        s3_event["Records"] = s3_event["Records"] * 4
+        lines = read_text_file("tests/data/e2e/s3.log")
+        # passed only once two objects are being read at the same time
+        both_reading = threading.Barrier(2, timeout=5)
+        calls = itertools.count()
+
+        def read_lines_concurrently(bucket, key, size):
+            if next(calls) < 2:
+                both_reading.wait()
+            yield from lines
+
+        s3_service_read_lines_mock.side_effect = read_lines_concurrently
+        sent_logs = self._capture_sent_logs(send_method_mock)
+
+        # WHEN
+        self.log_forwarder.forward_log(s3_event, lambda_context())
+
+        # THEN
+        expected_hec_events = read_json_file("tests/data/e2e/s3_hec_items.json")
+        actual_hec_events = self._parse_hec_events_to_json(sent_logs)
+        self.assertFalse(both_reading.broken)
+        self.assertEqual(sorted(map(json.dumps, expected_hec_events * 4)), sorted(map(json.dumps, actual_hec_events)))
+
+    def test_prewarm(self, tags_cache_get_mock, _, s3_service_read_lines_mock, ingest_mock):
+        # GIVEN
+        tags_cache_get_mock.return_value = None
+        with patch.object(function, "PREWARM_TIME_BUDGET_SECONDS", 5), \
+                patch.object(function, "PREWARM_TAG_NAMESPACES", "lambda, s3"), \
+                patch.object(SessionPool, "connect") as connect_mock, \
+                patch.object(TagsCache, "prewarm", return_value=2) as prewarm_mock, ExitStack() as parsers:
+            parser_prewarm_mocks = [parsers.enter_context(patch.object(parser_class, "prewarm"))
+                                    for parser_class in PARSER_CLASSES]
+            self.log_forwarder = LogCollector()
+        s3_service_read_lines_mock.side_effect = lambda bucket, key, size: iter(read_text_file("tests/data/e2e/s3.log"))
+
+        # WHEN
+        self.log_forwarder.forward_log(read_json_file("tests/data/e2e/s3_event.json"), lambda_context())
+        self.log_forwarder.forward_log(read_json_file("tests/data/e2e/s3_event.json"), lambda_context())
+
+        # THEN
+        connect_mock.assert_called_once_with(function.SPLUNK_LOG_URL, ANY)
+        prewarm_mock.assert_called_once_with(["lambda", "s3"], ANY)
+        for parser_prewarm_mock in parser_prewarm_mocks:
+            parser_prewarm_mock.assert_called_once_with()
+        sent_gauges = [gauge["metric"] for _, kwargs in ingest_mock.return_value.send.call_args_list
+                       for gauge in kwargs.get("gauges", [])]
+        # reported by the first invocation only
+        self.assertEqual(1, sent_gauges.count("sf.org.awsLogCollector.prewarm.savedMillis"))
+        self.assertEqual(1, sent_gauges.count("sf.org.awsLogCollector.prewarm.tagsMillis"))
+
+    def test_s3_duplicate_notifications(self, tags_cache_get_mock, send_method_mock, s3_service_read_lines_mock, _):
+        # GIVEN
+        tags_cache_get_mock.return_value = None
+        with patch.object(function, "S3_PROCESSED_OBJECTS_STORE", "memory"):
+            self.log_forwarder = LogCollector()
+        s3_event = read_json_file("tests/data/e2e/s3_event.json")
+        sent_logs = self._capture_sent_logs(send_method_mock)
+
+        # WHEN
+        s3_service_read_lines_mock.side_effect = IOError("connection reset")
+        self.log_forwarder.forward_log(s3_event, lambda_context())
+        s3_service_read_lines_mock.side_effect = lambda bucket, key, size: iter(read_text_file("tests/data/e2e/s3.log"))
+        self.log_forwarder.forward_log(s3_event, lambda_context())
+        self.log_forwarder.forward_log(s3_event, lambda_context())
+
+        # THEN
+        # the object which could not be read is not skipped, the one forwarded already is
+        self.assertEqual(2, len(sent_logs))
+        self.assertEqual(2, s3_service_read_lines_mock.call_count)
+
+    def test_s3_not_recorded_when_send_failed(self, tags_cache_get_mock, send_method_mock, s3_service_read_lines_mock,
+                                              _):
+        # GIVEN
+        tags_cache_get_mock.return_value = None
+        with patch.object(function, "S3_PROCESSED_OBJECTS_STORE", "memory"):
+            self.log_forwarder = LogCollector()
+        s3_event = read_json_file("tests/data/e2e/s3_event.json")
+        s3_service_read_lines_mock.side_effect = lambda bucket, key, size: iter(read_text_file("tests/data/e2e/s3.log"))
+        sent_logs = []
+
+        def send(logs):
+            sent_logs.extend(logs)
+            # the first batch is rejected by the endpoint
+            return 1 if len(sent_logs) == 2 else 0
+
+        send_method_mock.side_effect = send
+
+        # WHEN
+        self.log_forwarder.forward_log(s3_event, lambda_context())
+        self.log_forwarder.forward_log(s3_event, lambda_context())
+        self.log_forwarder.forward_log(s3_event, lambda_context())
+
+        # THEN
+        # the object is skipped only once it has been sent
+        self.assertEqual(2, s3_service_read_lines_mock.call_count)
+        self.assertEqual(4, len(sent_logs))
+
+    def test_sqs_s3_notifications(self, tags_cache_get_mock, send_method_mock, s3_service_read_lines_mock, _):
+        # GIVEN
+        arn_to_tags = {
+            "arn:aws:s3:::integrations-team":
+                {"bucket-tag-1": 1, "bucket-tag-2": "abc"},
+            "arn:aws:s3:::integrations-team/WhatsApp Image 2020-07-05 at 18.34.43.jpeg":
+                {"object-tag-1": 10, "object-tag-2": "def"}
+        }
+        tags_cache_get_mock.side_effect = lambda arn, _: arn_to_tags.get(arn)
+        with patch.object(function, "INCLUDE_LOG_FIELDS", False):
+            self.log_forwarder = LogCollector()
+        s3_event = read_json_file("tests/data/e2e/s3_event.json")
+        unreadable_event = json.loads(json.dumps(s3_event).replace("logs/ABCDEF12345", "unreadable/ABCDEF12345"))
+        lines = read_text_file("tests/data/e2e/s3.log")
+
+        def read_lines(bucket, key, size):
+            if key.startswith("unreadable/"):
+                raise IOError("Access Denied")
+            return iter(lines)
+
+        s3_service_read_lines_mock.side_effect = read_lines
+        sent_logs = self._capture_sent_logs(send_method_mock)
+        sqs_event = {"Records": [
+            self._sqs_message("direct", json.dumps(s3_event)),
+            self._sqs_message("sns", json.dumps({"Type": "Notification", "Message": json.dumps(s3_event)})),
+            self._sqs_message("test", json.dumps({"Service": "Amazon S3", "Event": "s3:TestEvent"})),
+            self._sqs_message("unreadable", json.dumps(unreadable_event)),
+            self._sqs_message("invalid", "not a notification"),
+        ]}
+
+        # WHEN
+        response = self.log_forwarder.forward_log(sqs_event, lambda_context())
+
+        # THEN
+        self.assertEqual({"batchItemFailures": [{"itemIdentifier": "invalid"}, {"itemIdentifier": "unreadable"}]},
+                         response)
+        expected_hec_events = read_json_file("tests/data/e2e/s3_hec_items.json")
+        actual_hec_events = self._parse_hec_events_to_json(sent_logs)
+        self.assertEqual(sorted(map(json.dumps, expected_hec_events * 2)), sorted(map(json.dumps, actual_hec_events)))
+
+    def test_sqs_messages_failed_when_batch_rejected(self, tags_cache_get_mock, _, s3_service_read_lines_mock, __):
+        # GIVEN
+        tags_cache_get_mock.return_value = None
+        s3_event = read_json_file("tests/data/e2e/s3_event.json")
+        s3_service_read_lines_mock.side_effect = lambda bucket, key, size: iter(read_text_file("tests/data/e2e/s3.log"))
+        sqs_event = {"Records": [
+            self._sqs_message("first", json.dumps(s3_event)),
+            self._sqs_message("second", json.dumps(s3_event)),
+        ]}
+        rejected = requests.Response()
+        rejected.status_code = 400
+        rejected.reason = "Bad Request"
+
+        # WHEN
+        # batches go through the real client, the HEC endpoint rejects them
+        with patch.object(BatchClient, "send", BATCH_CLIENT_SEND), \
+                patch.object(requests.Session, "post", return_value=rejected) as post_mock:
+            response = self.log_forwarder.forward_log(sqs_event, lambda_context())
+
+        # THEN
+        self.assertEqual(1, post_mock.call_count)
+        self.assertEqual({"batchItemFailures": [{"itemIdentifier": "first"}, {"itemIdentifier": "second"}]},
+                         response)
+
     def test_s3_nlb(self, tags_cache_get_mock, send_method_mock, s3_service_read_lines_mock, _):
         scenario = {
             "name": "nlb",
@@ -185,14 +454,15 @@ class LogCollectingSuite(TestCase):
 
         s3_event = read_json_file(f"tests/data/e2e/{scenario_name}_event.json")
         s3_service_read_lines_mock.side_effect = get_read_lines_mock(f"tests/data/e2e/{scenario_name}.log")
+        sent_logs = self._capture_sent_logs(send_method_mock)
 
         # WHEN
         self.log_forwarder.forward_log(s3_event, lambda_context())
 
         # THEN
         expected_hec_events = read_json_file(f"tests/data/e2e/{scenario_name}_hec_items.json")
-        actual_hec_events = self._parse_hec_events_to_json(send_method_mock.call_args)
-        self.assertEqual(expected_hec_events, actual_hec_events)
+        self.assertEqual([json.dumps(hec_event).encode("utf-8") for hec_event in expected_hec_events], sent_logs)
+        self._assert_same_as_golden_file(f"tests/data/e2e/{scenario_name}_hec_logs.ndjson", sent_logs)
 
     def test_unsupported_log_event(self, _, __, ___, ____):
         unsupported_event = {'foo': 'bar', 'baz': 123}
@@ -205,10 +475,27 @@ class LogCollectingSuite(TestCase):
         aws_event = {'awslogs': {'data': self._encode(json.dumps(log_event))}}
         return log_event, aws_event
 
+    @staticmethod
+    def _sqs_message(message_id, body):
+        return {"messageId": message_id, "receiptHandle": f"handle-{message_id}", "body": body,
+                "eventSource": "aws:sqs", "eventSourceARN": "arn:aws:sqs:eu-central-1:906383545488:s3-logs",
+                "awsRegion": "eu-central-1"}
+
+    @staticmethod
+    def _capture_sent_logs(send_method_mock):
+        # logs are passed as a generator, so they have to be consumed when sent
+        sent_logs = []
+        send_method_mock.side_effect = lambda logs: sent_logs.extend(logs) or 0
+        return sent_logs
+
+    def _assert_same_as_golden_file(self, file_name, sent_logs):
+        # serialized logs are compared byte by byte, the default encoder sends the same bytes as json.dumps
+        with open(file_name, "rb") as file:
+            self.assertEqual(file.read().splitlines(), sent_logs)
+
     @staticmethod
     def _parse_hec_events_to_json(raw_hec_events):
-        events = raw_hec_events[0][0]
-        return list(map(lambda s: json.loads(s), events))
+        return list(map(lambda s: json.loads(s), raw_hec_events))
 
     @staticmethod
     def _encode(event):
@@ -216,5 +503,152 @@ class LogCollectingSuite(TestCase):
         return result
 
 
+class DiscardingIngestClient(object):
+    # unlike a mock, does not keep references to the metrics sent
+
+    def send(self, **kwargs):
+        pass
+
+    def stop(self):
+        pass
+
+
+@patch.object(signalfx.SignalFx, "ingest", lambda *args, **kwargs: DiscardingIngestClient())
+@patch.object(S3Service, "read_lines")
+@patch.object(TagsCache, "get")
+@patch.object(function, "MAX_REQUEST_SIZE_IN_BYTES", 256 * 1024)
+@patch.object(function, "REDACTION_RULE", "integrations-team")
+class StreamingSuite(TestCase):
+
+    def test_object_streamed_while_sent(self, tags_cache_get_mock, s3_service_read_lines_mock):
+        # GIVEN
+        tags_cache_get_mock.return_value = {"bucket-tag-1": 1, "bucket-tag-2": "abc"}
+        line = read_text_file("tests/data/e2e/s3.log")[0] + "\n"
+        lines = 20000
+        lines_read = []
+        s3_event = read_json_file("tests/data/e2e/s3_event.json")
+        sent_items = []
+        read_when_first_sent = []
+        log_forwarder = LogCollector()
+
+        def read_lines(bucket, key, size):
+            for i in range(lines):
+                lines_read.append(i)
+                yield line
+
+        def send(client, batch):
+            if not sent_items:
+                read_when_first_sent.append(len(lines_read))
+            sent_items.append(len(batch))
+
+        s3_service_read_lines_mock.side_effect = read_lines
+
+        # WHEN
+        with patch.object(RetryableClient, "send", send):
+            log_forwarder.forward_log(s3_event, lambda_context())
+
+        # THEN
+        self.assertEqual(lines, sum(sent_items))
+        self.assertGreater(len(sent_items), 10)
+        # the first batch is sent while most of the object is still to be read
+        self.assertLess(read_when_first_sent[0], lines / 4)
+
+
+@patch.object(signalfx.SignalFx, "ingest", lambda *args, **kwargs: DiscardingIngestClient())
+@patch.object(S3Service, "read_lines")
+@patch.object(TagsCache, "get")
+@patch.object(function, "S3_CONTINUATION_MARGIN_SECONDS", 30)
+@patch.object(function, "S3_PARSE_WORKERS", 0)
+class ContinuationSuite(TestCase):
+
+    def test_object_continued_after_last_sent_line(self, tags_cache_get_mock, s3_service_read_lines_mock):
+        # GIVEN
+        tags_cache_get_mock.return_value = None
+        line = read_text_file("tests/data/e2e/s3.log")[0]
+        lines = [f"{line} {i}" for i in range(2000)]
+        s3_service_read_lines_mock.side_effect = lambda bucket, key, size: iter(lines)
+        s3_event = read_json_file("tests/data/e2e/s3_event.json")
+        context = lambda_context()
+        context.get_remaining_time_in_millis = lambda: 60000
+
+        invoker = LocalInvoker()
+        with patch.object(function, "LambdaInvoker", lambda: invoker):
+            log_forwarder = LogCollector()
+        sent_events, invocations = [], []
+
+        def forward_log(event, lambda_context):
+            invocations.append(event)
+            log_forwarder.forward_log(event, lambda_context)
+
+        # the deadline is near once the object has been checked and 3 chunks of lines processed
+        calls = itertools.count(1)
+
+        # WHEN
+        with patch.object(RetryableClient, "send", lambda client, batch: sent_events.extend(map(json.loads, batch))), \
+                patch.object(Deadline, "is_near", lambda deadline: next(calls) % 4 == 0):
+            forward_log(s3_event, context)
+            invoker.run_pending(forward_log, context)
+
+        # THEN
+        self.assertEqual(lines, [event["event"] for event in sent_events])
+        self.assertEqual([None, 768, 1536], [record.get("awsLogCollectorCheckpoint", {}).get("lines")
+                                             for event in invocations for record in event["Records"]])
+        self.assertEqual(s3_event["Records"][0]["s3"], invocations[-1]["Records"][0]["s3"])
+
+    def test_not_continued_when_send_failed(self, tags_cache_get_mock, s3_service_read_lines_mock):
+        # GIVEN
+        tags_cache_get_mock.return_value = None
+        line = read_text_file("tests/data/e2e/s3.log")[0]
+        s3_service_read_lines_mock.side_effect = lambda bucket, key, size: iter([f"{line} {i}" for i in range(2000)])
+        s3_event = read_json_file("tests/data/e2e/s3_event.json")
+        context = lambda_context()
+        context.get_remaining_time_in_millis = lambda: 60000
+
+        invoker = LocalInvoker()
+        with patch.object(function, "LambdaInvoker", lambda: invoker):
+            log_forwarder = LogCollector()
+
+        # WHEN
+        # the deadline is near once the object has been checked and a chunk of lines processed,
+        # a batch is rejected
+        calls = itertools.count(1)
+        sent_logs = []
+        with patch.object(BatchClient, "send", lambda client, logs: sent_logs.extend(logs) or 1), \
+                patch.object(Deadline, "is_near", lambda deadline: next(calls) >= 2):
+            log_forwarder.forward_log(s3_event, context)
+
+        # THEN
+        self.assertTrue(0 < len(sent_logs) < 2000)
+        self.assertEqual([], invoker.events)
+
+    def test_sqs_messages_not_continued_when_send_failed(self, tags_cache_get_mock, s3_service_read_lines_mock):
+        # GIVEN
+        tags_cache_get_mock.return_value = None
+        line = read_text_file("tests/data/e2e/s3.log")[0]
+        s3_service_read_lines_mock.side_effect = lambda bucket, key, size: iter([f"{line} {i}" for i in range(2000)])
+        s3_event = read_json_file("tests/data/e2e/s3_event.json")
+        sqs_event = {"Records": [{"messageId": message_id, "eventSource": "aws:sqs", "body": json.dumps(s3_event)}
+                                 for message_id in ("first", "second")]}
+        context = lambda_context()
+        context.get_remaining_time_in_millis = lambda: 60000
+
+        invoker = LocalInvoker()
+        with patch.object(function, "LambdaInvoker", lambda: invoker):
+            log_forwarder = LogCollector()
+
+        # WHEN
+        # objects are continued after a chunk of lines each, a batch is rejected
+        calls = itertools.count(1)
+        with patch.object(BatchClient, "send", lambda client, logs: [None for _ in logs] and 1), \
+                patch.object(Deadline, "is_near", lambda deadline: next(calls) > 2):
+            response = log_forwarder.forward_log(sqs_event, context)
+
+        # THEN
+        # both messages are delivered again, so nothing is continued
+        self.assertEqual({"batchItemFailures": [{"itemIdentifier": "first"}, {"itemIdentifier": "second"}]},
+                         response)
+        self.assertEqual([], invoker.events)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import json
+import threading
 
 from aws_lambda_context import LambdaContext
 
@@ -26,7 +27,7 @@ FORWARDER_FUNCTION_VERSION = "1.0.1"
 def get_read_lines_mock(file_name):
     gen = get_raw_line_generator(file_name)
 
-    def read_lines_mock(bucket, key):
+    def read_lines_mock(bucket, key, size=None):
         return gen
 
     return read_lines_mock
@@ -54,3 +55,68 @@ def lambda_context():
     context.function_version = FORWARDER_FUNCTION_VERSION
     context.invoked_function_arn = FORWARDER_FUNCTION_ARN_PREFIX + FORWARDER_FUNCTION_NAME
     return context
+
+
+class FakeClock(object):
+    """
+    Stand-in of time.monotonic and time.sleep, time passes only by sleep or
+    by setting now.
+    """
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FaultyS3Client(object):
+    """
+    Stand-in of the S3 client wrapping another one, e.g. LocalS3Client, whose
+    response streams fail with error (a connection reset by default) after
+    fail_after_bytes bytes, for the first failures responses. Requests are
+    kept in requests.
+    """
+
+    def __init__(self, client, fail_after_bytes, failures=1, error=None):
+        self.requests = []
+        self._client = client
+        self._fail_after_bytes = fail_after_bytes
+        self._failures = failures
+        self._error = error or ConnectionResetError(104, "Connection reset by peer")
+        self._lock = threading.Lock()
+
+    def get_object(self, **kwargs):
+        with self._lock:
+            self.requests.append(kwargs)
+            fail = self._failures > 0
+            if fail:
+                self._failures -= 1
+        response = self._client.get_object(**kwargs)
+        if fail:
+            response = dict(response, Body=_FaultyBody(response["Body"], self._fail_after_bytes, self._error))
+        return response
+
+
+class _FaultyBody(object):
+
+    def __init__(self, body, fail_after_bytes, error):
+        self._body = body
+        self._fail_after_bytes = fail_after_bytes
+        self._error = error
+
+    def iter_chunks(self, chunk_size):
+        remaining_bytes = self._fail_after_bytes
+        for chunk in self._body.iter_chunks(chunk_size):
+            if len(chunk) > remaining_bytes:
+                if remaining_bytes > 0:
+                    yield chunk[:remaining_bytes]
+                raise self._error
+            remaining_bytes -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self._body.close()